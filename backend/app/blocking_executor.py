@@ -0,0 +1,104 @@
+import asyncio
+import numpy as np
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import BLOCKING_EXECUTOR_WORKERS, BLOCKING_EXECUTOR_QUEUE
+
+
+class ExecutorSaturated(RuntimeError):
+    """Fila do executor cheia: a requisição deve ser recusada (503)"""
+
+
+class BoundedExecutor:
+    """Pool de threads com fila limitada para o trabalho bloqueante das rotas
+
+    Decodificação de imagens, busca no FAISS, criptografia e commits do
+    SQLAlchemy rodam aqui, fora do event loop: um frame lento não trava as
+    outras requisições do worker (nem o /api/ready). Com max_workers tarefas
+    em execução e max_queue aguardando, novas tarefas são recusadas com
+    ExecutorSaturated em vez de acumular latência.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "blocking"):
+        self.max_workers = max_workers if max_workers > 0 else min(32, (os.cpu_count() or 1) + 4)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+
+        self._lock = threading.Lock()
+        self._pending = 0  # Tarefas aceitas ainda não concluídas
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._run_ms = deque(maxlen=1000)
+
+    async def run(self, func, *args, **kwargs):
+        """Executa func(*args, **kwargs) no pool e aguarda o resultado"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated("Fila de processamento cheia")
+            self._pending += 1
+        queued_at = time.perf_counter()
+
+        def task():
+            start = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._wait_ms.append((start - queued_at) * 1000)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_ms.append((time.perf_counter() - start) * 1000)
+
+        def release(_):
+            # Pelo Future do pool: a vaga só é liberada quando a tarefa termina
+            # (ou é cancelada ainda na fila), mesmo que quem aguardava desista antes
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+        try:
+            future = self._executor.submit(task)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """Profundidade da fila, tarefas em execução e tempos de espera/execução"""
+        with self._lock:
+            wait_ms = np.array(self._wait_ms) if self._wait_ms else np.zeros(1)
+            run_ms = np.array(self._run_ms) if self._run_ms else np.zeros(1)
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_ms_p50": float(np.percentile(wait_ms, 50)),
+                "wait_ms_p95": float(np.percentile(wait_ms, 95)),
+                "run_ms_p50": float(np.percentile(run_ms, 50)),
+                "run_ms_p95": float(np.percentile(run_ms, 95)),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# Instância global do executor das rotas
+blocking_executor = BoundedExecutor(BLOCKING_EXECUTOR_WORKERS, BLOCKING_EXECUTOR_QUEUE)
@@ -28,7 +28,7 @@ def init_database():
     """Inicializa o banco de dados criando todas as tabelas"""
     try:
         # Criar todas as tabelas
-        create_tables()
+        create_tables(engine)
         
         # Verificar se a coluna passage_count existe (migração)
         from sqlalchemy import text, inspect
@@ -45,6 +45,34 @@ def init_database():
                 conn.commit()
             print("✅ Coluna passage_count adicionada com sucesso!")
 
+        # Coluna do envelope binário dos embeddings (migração)
+        if "embedding" not in columns:
+            print("🔄 Adicionando coluna embedding à tabela users...")
+            binary_type = "BYTEA" if engine.dialect.name == "postgresql" else "BLOB"
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE users ADD COLUMN embedding {binary_type}"))
+                if engine.dialect.name == "postgresql":
+                    conn.execute(
+                        text("ALTER TABLE users ALTER COLUMN embedding_hash SET DEFAULT ''")
+                    )
+                conn.commit()
+            print("✅ Coluna embedding adicionada com sucesso!")
+
+        # Coluna da reconciliação incremental (migração)
+        if "updated_at" not in columns:
+            print("🔄 Adicionando coluna updated_at à tabela users...")
+            timestamp_type = "TIMESTAMP" if engine.dialect.name == "postgresql" else "DATETIME"
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE users ADD COLUMN updated_at {timestamp_type}"))
+                conn.execute(
+                    text("UPDATE users SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+                )
+                conn.execute(
+                    text("CREATE INDEX IF NOT EXISTS ix_users_updated_at ON users (updated_at)")
+                )
+                conn.commit()
+            print("✅ Coluna updated_at adicionada com sucesso!")
+
         print("✅ Banco de dados PostgreSQL inicializado com sucesso!")
         return True
     except OperationalError as e:
@@ -3,19 +3,44 @@ from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 import base64
 import hashlib
+import numpy as np
+import struct
 import sys
 import os
 
 sys.path.append(
     os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 )
-from config import ENCRYPTION_KEY, AES_KEY_LENGTH
+from config import (
+    ENCRYPTION_KEY,
+    AES_KEY_LENGTH,
+    EMBEDDING_DIMENSION,
+    EMBEDDING_STORAGE_DTYPE,
+)
+
+# Envelope binário dos embeddings:
+# cabeçalho (magic, versão, tipo, dimensão) + nonce + vetor criptografado + tag
+ENVELOPE_MAGIC = b"FE"
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct("<2sBBH")
+ENVELOPE_DTYPES = {1: np.float32, 2: np.float16}
+ENVELOPE_DTYPE_CODES = {"float32": 1, "float16": 2}
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
 
 
 class EncryptionManager:
     def __init__(self):
         # Gerar chave AES a partir da chave de configuração
         self.key = hashlib.sha256(ENCRYPTION_KEY.encode()).digest()[:AES_KEY_LENGTH]
+        # Chave própria do envelope binário (AES-GCM), separada da usada no CBC
+        self.embedding_key = hashlib.sha256(
+            b"embedding-envelope-v1:" + ENCRYPTION_KEY.encode()
+        ).digest()[:AES_KEY_LENGTH]
+        # Chave do snapshot criptografado da galeria (índice FAISS)
+        self.snapshot_key = hashlib.sha256(
+            b"gallery-snapshot-v1:" + ENCRYPTION_KEY.encode()
+        ).digest()[:AES_KEY_LENGTH]
 
     def encrypt_data(self, data: str) -> str:
         """Criptografa dados usando AES-256"""
@@ -63,16 +88,19 @@ class EncryptionManager:
             raise Exception(f"Erro na descriptografia: {str(e)}")
 
     def encrypt_embedding(self, embedding) -> str:
-        """Criptografa embedding numpy array"""
-        import numpy as np
-
+        """Criptografa embedding numpy array (formato antigo, em texto)"""
         # Converter numpy array para string
         embedding_str = np.array2string(embedding, separator=",")
         return self.encrypt_data(embedding_str)
 
-    def decrypt_embedding(self, encrypted_embedding: str):
-        """Descriptografa embedding e converte de volta para numpy array"""
-        import numpy as np
+    def decrypt_embedding(self, encrypted_embedding):
+        """Descriptografa embedding e converte de volta para numpy array
+
+        Aceita os dois formatos: envelope binário (bytes, coluna embedding) e
+        texto base64 do formato antigo (coluna embedding_hash).
+        """
+        if isinstance(encrypted_embedding, (bytes, bytearray, memoryview)):
+            return self.decrypt_embedding_binary(encrypted_embedding)
 
         decrypted_str = self.decrypt_data(encrypted_embedding)
         # Converter string de volta para numpy array
@@ -80,6 +108,82 @@ class EncryptionManager:
         clean_str = decrypted_str.strip("[]")
         return np.fromstring(clean_str, sep=",")
 
+    def encrypt_embedding_binary(self, embedding, dtype: str = EMBEDDING_STORAGE_DTYPE) -> bytes:
+        """Criptografa embedding no envelope binário versionado (AES-256-GCM)
+
+        O vetor é gravado em bytes float32 (ou float16, metade do tamanho) e o
+        cabeçalho entra como dado autenticado: qualquer alteração no envelope
+        falha na descriptografia.
+        """
+        try:
+            code = ENVELOPE_DTYPE_CODES[dtype]
+            vector = np.asarray(embedding, dtype=ENVELOPE_DTYPES[code]).reshape(-1)
+            header = ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, code, len(vector))
+
+            cipher = AES.new(
+                self.embedding_key, AES.MODE_GCM, nonce=get_random_bytes(GCM_NONCE_SIZE)
+            )
+            cipher.update(header)
+            ciphertext, tag = cipher.encrypt_and_digest(vector.tobytes())
+            return header + cipher.nonce + ciphertext + tag
+
+        except Exception as e:
+            raise Exception(f"Erro na criptografia: {str(e)}")
+
+    def decrypt_embedding_binary(self, envelope: bytes):
+        """Descriptografa o envelope binário para um vetor float32"""
+        try:
+            envelope = bytes(envelope)
+            magic, version, code, dimension = ENVELOPE_HEADER.unpack_from(envelope)
+            if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION or code not in ENVELOPE_DTYPES:
+                raise ValueError("envelope de embedding desconhecido")
+
+            dtype = np.dtype(ENVELOPE_DTYPES[code])
+            nonce_start = ENVELOPE_HEADER.size
+            data_start = nonce_start + GCM_NONCE_SIZE
+            data_end = data_start + dimension * dtype.itemsize
+            if len(envelope) != data_end + GCM_TAG_SIZE:
+                raise ValueError("tamanho do envelope inválido")
+
+            cipher = AES.new(
+                self.embedding_key,
+                AES.MODE_GCM,
+                nonce=envelope[nonce_start:data_start],
+            )
+            cipher.update(envelope[:nonce_start])
+            data = cipher.decrypt_and_verify(
+                envelope[data_start:data_end], envelope[data_end:]
+            )
+            return np.frombuffer(data, dtype=dtype).astype(np.float32)
+
+        except Exception as e:
+            raise Exception(f"Erro na descriptografia: {str(e)}")
+
 
 # Instância global do gerenciador de criptografia
 encryption_manager = EncryptionManager()
+
+
+def decrypt_embedding_batch(encrypted_embeddings: list):
+    """Descriptografa um lote de embeddings em uma matriz float32
+
+    Função de módulo para poder rodar em processos do pool da reconstrução
+    do índice (cada processo usa sua própria instância global). Aceita os dois
+    formatos de armazenamento, misturados no mesmo lote.
+
+    Returns:
+        (vectors, valid): matriz [N, EMBEDDING_DIMENSION] e máscara das linhas
+        descriptografadas com sucesso (linhas inválidas ficam zeradas)
+    """
+    vectors = np.zeros((len(encrypted_embeddings), EMBEDDING_DIMENSION), dtype=np.float32)
+    valid = np.zeros(len(encrypted_embeddings), dtype=bool)
+    for row, encrypted in enumerate(encrypted_embeddings):
+        try:
+            embedding = encryption_manager.decrypt_embedding(encrypted)
+        except Exception:
+            continue
+        if embedding.shape == (EMBEDDING_DIMENSION,):
+            vectors[row] = embedding
+            valid[row] = True
+
+    return vectors, valid
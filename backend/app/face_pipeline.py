@@ -0,0 +1,300 @@
+import numpy as np
+import os
+import sys
+import time
+from typing import List, Optional
+
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import (
+    DEVICE,
+    FACE_DETECTION_CONFIDENCE,
+    FACE_DETECTION_CONFIDENCE_HIGH,
+    FACE_MIN_SHARPNESS,
+    FACE_DETECTION_SIZES,
+    INSIGHTFACE_MODEL_PACK,
+    INSIGHTFACE_ALLOWED_MODULES,
+    INFERENCE_BATCH_SIZE,
+    MODEL_WARMUP_RUNS,
+)
+from app.face_quality import geometry_mask, score_faces
+from app.onnx_sessions import configure_sessions, load_face_analysis
+
+
+class FacePipeline:
+    """Modelos InsightFace e as etapas de inferência de cada frame
+
+    Detecção, filtro de confiança/qualidade e reconhecimento em lote das faces
+    escolhidas. Roda no processo da API ou nos processos do servidor de
+    inferência (app.inference_pool); o resultado só tem arrays pequenos
+    (bbox, landmarks e embedding), sem objetos do InsightFace.
+    """
+
+    def __init__(self):
+        self.face_app = None
+        self.detector_sizes = [max(FACE_DETECTION_SIZES)]
+        self.session_settings = {}
+
+    @property
+    def models_loaded(self) -> bool:
+        return self.face_app is not None
+
+    @property
+    def model_names(self) -> List[str]:
+        return list(getattr(self.face_app, "models", {}))
+
+    def close(self):
+        pass
+
+    def load_models(self):
+        """Carrega modelos InsightFace - Suporta GPU e CPU"""
+        try:
+            import torch
+            import onnxruntime as ort
+
+            # Determinar providers baseado no dispositivo disponível
+            if DEVICE == "cuda" and torch.cuda.is_available():
+                print("🚀 Configurando InsightFace para GPU...")
+                
+                # Verificar providers disponíveis no ONNX Runtime
+                available_providers = ort.get_available_providers()
+                
+                if "CUDAExecutionProvider" in available_providers:
+                    providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+                    print("✅ ONNX Runtime GPU disponível")
+                else:
+                    print("⚠️  CUDAExecutionProvider não disponível, usando CPU")
+                    providers = ["CPUExecutionProvider"]
+                
+                # Configurar InsightFace com GPU (com fallback para CPU)
+                self.face_app = load_face_analysis(
+                    INSIGHTFACE_MODEL_PACK, self._allowed_modules(), providers
+                )
+                
+                # Preparar com configurações GPU otimizadas
+                self.face_app.prepare(ctx_id=0, det_size=(max(FACE_DETECTION_SIZES),) * 2)
+                
+                # Verificar providers ativos
+                active_providers = self.face_app.models["detection"].session.get_providers()
+                print(f"✅ Modelos InsightFace carregados!")
+                print(f"   Providers ativos: {active_providers}")
+                
+                if "CUDAExecutionProvider" in active_providers:
+                    print("   🎯 Usando GPU para processamento")
+                else:
+                    print("   💻 Usando CPU para processamento")
+                    
+            else:
+                print("💻 Configurando InsightFace para CPU...")
+                
+                # Configurar InsightFace apenas com CPU
+                self.face_app = load_face_analysis(
+                    INSIGHTFACE_MODEL_PACK, self._allowed_modules(), ["CPUExecutionProvider"]
+                )
+                
+                # Preparar com configurações CPU
+                self.face_app.prepare(
+                    ctx_id=-1, det_size=(max(FACE_DETECTION_SIZES),) * 2
+                )  # ctx_id=-1 para CPU
+                
+                active_providers = self.face_app.models["detection"].session.get_providers()
+                print(f"✅ Modelos InsightFace carregados em CPU!")
+                print(f"   Providers ativos: {active_providers}")
+
+            # Threads, otimização de grafo e modelos INT8 por modelo
+            self.session_settings = configure_sessions(self.face_app, INSIGHTFACE_MODEL_PACK)
+            print(f"   Modelos ({INSIGHTFACE_MODEL_PACK}): {self._loaded_models_description()}")
+            for taskname, settings in self.session_settings.items():
+                print(
+                    f"   Sessão {taskname}: threads {settings['intra_op_threads']}/{settings['inter_op_threads']}, "
+                    f"grafo {settings['graph_optimization']}, {settings['execution_mode']}, "
+                    f"arena {'sim' if settings['cpu_mem_arena'] else 'não'}, "
+                    f"cache do grafo {settings['optimized_cache']}"
+                )
+            self._configure_detector_sizes()
+            self._warm_up()
+
+        except Exception as e:
+            print(f"❌ Erro ao carregar modelos: {e}")
+            raise
+
+    @staticmethod
+    def _allowed_modules() -> Optional[List[str]]:
+        """Modelos do pacote a carregar (None = todos)
+
+        Só bbox, kps, det_score e embedding são usados; landmarks e gênero/idade
+        rodariam em cada face sem necessidade. Detecção e reconhecimento são
+        sempre carregados.
+        """
+        if not INSIGHTFACE_ALLOWED_MODULES:
+            return None
+        modules = list(INSIGHTFACE_ALLOWED_MODULES)
+        for required in ("detection", "recognition"):
+            if required not in modules:
+                print(f"⚠️  Módulo '{required}' é obrigatório, adicionado a INSIGHTFACE_ALLOWED_MODULES")
+                modules.append(required)
+        return modules
+
+    def _loaded_models_description(self) -> str:
+        """Lista 'tarefa (arquivo)' dos modelos carregados no FaceAnalysis"""
+        return ", ".join(
+            f"{taskname} ({os.path.basename(getattr(model, 'model_file', '') or '?')})"
+            for taskname, model in self.face_app.models.items()
+        )
+
+    def _configure_detector_sizes(self):
+        """Resoluções que o detector aceita (modelos com entrada fixa usam só a dela)"""
+        det_model = self.face_app.det_model
+        input_shape = det_model.session.get_inputs()[0].shape
+        if all(isinstance(dim, int) for dim in input_shape[2:4]):
+            self.detector_sizes = [int(input_shape[3])]
+            print(f"   Detector com entrada fixa {input_shape[3]}x{input_shape[2]}")
+        else:
+            self.detector_sizes = sorted(set(FACE_DETECTION_SIZES))
+            print(f"   Resoluções do detector: {self.detector_sizes}")
+
+    def _warm_up(self):
+        """Executa os modelos com frames sintéticos antes de ficar pronto
+
+        A primeira execução em cada resolução do detector e em cada tamanho de
+        lote do reconhecimento aloca buffers e escolhe kernels; sem o
+        aquecimento as primeiras requisições depois de um deploy pagam esse
+        custo.
+        """
+        if MODEL_WARMUP_RUNS <= 0:
+            return
+        start_time = time.perf_counter()
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+        rec_model = self.face_app.models["recognition"]
+        crop = rng.integers(
+            0, 256, size=(rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8
+        )
+        batch_sizes = sorted({1, max(1, INFERENCE_BATCH_SIZE)})
+        for _ in range(MODEL_WARMUP_RUNS):
+            for det_size in self.detector_sizes:
+                self._detect(frame, det_size)
+            for batch_size in batch_sizes:
+                rec_model.get_feat([crop] * batch_size)
+        print(
+            f"🔥 Modelos aquecidos em {time.perf_counter() - start_time:.1f}s "
+            f"(detector {self.detector_sizes}, lotes de reconhecimento {batch_sizes})"
+        )
+
+    def run(self, requests: List[tuple]) -> List[List[dict]]:
+        """Detecta e reconhece as faces de vários frames
+
+        Args:
+            requests: (image, det_size, high_precision, max_faces) por frame
+
+        Returns:
+            Faces escolhidas de cada frame (bbox, kps, det_score, embedding e
+            quality_score), com o reconhecimento de todas em um só lote
+        """
+        detect_start = time.perf_counter()
+        selected = []
+        for image, det_size, high_precision, max_faces in requests:
+            try:
+                selected.append(self._select_faces(image, det_size, high_precision, max_faces))
+            except Exception as e:
+                print(f"Erro na detecção de faces: {e}")
+                selected.append([])
+        detect_time = time.perf_counter() - detect_start
+
+        # Reconhecimento só das faces escolhidas, de todos os frames de uma vez
+        embed_start = time.perf_counter()
+        self._embed_faces_batch([request[0] for request in requests], selected)
+        embed_time = time.perf_counter() - embed_start
+
+        det_sizes = ", ".join(f"{request[1]}x{request[1]}" for request in requests)
+        print(
+            f"⏱️  Detecção {det_sizes} ({len(requests)} frames): {detect_time * 1000:.1f}ms, "
+            f"reconhecimento ({sum(len(faces) for faces in selected)} faces): "
+            f"{embed_time * 1000:.1f}ms"
+        )
+
+        return [
+            [
+                {
+                    "bbox": np.asarray(face.bbox, dtype=np.float32),
+                    "kps": face.kps,
+                    "det_score": float(face.det_score),
+                    "embedding": face.embedding,
+                    "quality_score": face.quality_score,
+                }
+                for face in faces
+            ]
+            for faces in selected
+        ]
+
+    def _select_faces(
+        self, image: np.ndarray, det_size: int, high_precision: bool, max_faces: Optional[int]
+    ) -> list:
+        """Etapa de detecção e filtro: faces que vão para o reconhecimento"""
+        print(f"DEBUG DETECT: Processando imagem - Shape: {image.shape}")
+        faces = self._detect(image, det_size)
+        print(f"DEBUG DETECT: Faces detectadas: {len(faces)}")
+
+        # Escolher threshold baseado na precisão desejada
+        confidence_threshold = (
+            FACE_DETECTION_CONFIDENCE_HIGH
+            if high_precision
+            else FACE_DETECTION_CONFIDENCE
+        )
+
+        # Filtrar faces por confiança e qualidade (antes do reconhecimento)
+        bboxes = np.array([face.bbox for face in faces], dtype=np.float32).reshape(-1, 4).astype(int)
+        det_scores = np.array([face.det_score for face in faces], dtype=np.float32)
+        keep = np.flatnonzero((det_scores >= confidence_threshold) & geometry_mask(bboxes, image.shape))
+        scores = score_faces(image, bboxes[keep])
+        candidates = []
+        for i, quality, sharpness in zip(keep, scores["quality"], scores["sharpness"]):
+            # Faces borradas não chegam ao modelo de reconhecimento
+            if sharpness < FACE_MIN_SHARPNESS:
+                continue
+            faces[i].quality_score = float(quality)
+            candidates.append(faces[i])
+        if max_faces is not None:
+            candidates = sorted(candidates, key=lambda face: face.det_score, reverse=True)[:max_faces]
+        return candidates
+
+    def _detect(self, image: np.ndarray, det_size: int) -> list:
+        """Etapa de detecção: só bbox, landmarks (kps) e det_score de cada face"""
+        bboxes, kpss = self.face_app.det_model.detect(
+            image, input_size=(det_size, det_size), max_num=0, metric="default"
+        )
+        return [
+            Face(
+                bbox=bboxes[i, 0:4],
+                kps=kpss[i] if kpss is not None else None,
+                det_score=bboxes[i, 4],
+            )
+            for i in range(bboxes.shape[0])
+        ]
+
+    def _embed_faces_batch(self, images: List[np.ndarray], faces_per_image: List[list]):
+        """Etapa de reconhecimento: embeddings das faces escolhidas em um lote"""
+        pairs = [(image, face) for image, faces in zip(images, faces_per_image) for face in faces]
+        if not pairs:
+            return
+        rec_model = self.face_app.models["recognition"]
+        crops = [
+            face_align.norm_crop(image, landmark=face.kps, image_size=rec_model.input_size[0])
+            for image, face in pairs
+        ]
+        embeddings = rec_model.get_feat(crops)
+        for (_, face), embedding in zip(pairs, embeddings):
+            face.embedding = embedding.flatten()
+
+        # Demais modelos do pacote, se habilitados em INSIGHTFACE_ALLOWED_MODULES
+        for taskname, model in self.face_app.models.items():
+            if taskname in ("detection", "recognition"):
+                continue
+            for image, face in pairs:
+                model.get(image, face)
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import FACE_QUALITY_ROI_SIZE, MAX_FACE_SIZE, MIN_FACE_SIZE
+
+MIN_PIXEL_VARIANCE = 25.0  # Piso da variância dos pixels (ROIs quase lisas não viram nitidez alta)
+CONTRAST_SCALE = 64.0  # Desvio padrão com contraste 1.0
+
+
+def geometry_mask(bboxes: np.ndarray, image_shape: tuple) -> np.ndarray:
+    """Faces com tamanho, proporção e posição aceitáveis
+
+    Args:
+        bboxes: (N, 4) inteiros x1, y1, x2, y2
+        image_shape: shape da imagem (altura, largura, ...)
+    """
+    widths = bboxes[:, 2] - bboxes[:, 0]
+    heights = bboxes[:, 3] - bboxes[:, 1]
+    img_height, img_width = image_shape[:2]
+    aspect_ratios = widths / np.maximum(heights, 1)
+    return (
+        (widths >= MIN_FACE_SIZE)
+        & (heights >= MIN_FACE_SIZE)
+        & (widths <= MAX_FACE_SIZE)
+        & (heights <= MAX_FACE_SIZE)
+        & (bboxes[:, 0] >= 0)
+        & (bboxes[:, 1] >= 0)
+        & (bboxes[:, 2] <= img_width)
+        & (bboxes[:, 3] <= img_height)
+        & (aspect_ratios >= 0.5)
+        & (aspect_ratios <= 2.0)
+    )
+
+
+def score_faces(image: np.ndarray, bboxes: np.ndarray, roi_size: int = FACE_QUALITY_ROI_SIZE) -> dict:
+    """Nitidez, brilho, contraste e score de qualidade de todas as faces de um frame
+
+    Cada face é reduzida para roi_size x roi_size e convertida para cinza;
+    as métricas saem de uma passada em float32 sobre a pilha (N, roi_size,
+    roi_size). Faces de perto (ROIs grandes) custam o mesmo que as distantes,
+    e a nitidez não depende da distância até a câmera.
+
+    Args:
+        bboxes: (N, 4) inteiros x1, y1, x2, y2 dentro da imagem
+
+    Returns:
+        {"quality", "sharpness", "brightness", "contrast"}: arrays (N,) float32
+        normalizados em 0-1 (quality 0 para ROIs vazias)
+    """
+    count = len(bboxes)
+    rois = np.zeros((count, roi_size, roi_size), dtype=np.uint8)
+    valid = np.zeros(count, dtype=bool)
+    for i, (x1, y1, x2, y2) in enumerate(bboxes):
+        roi = image[max(y1, 0) : y2, max(x1, 0) : x2]
+        if roi.size:
+            # Reduzir antes de converter: a conversão para cinza roda só na ROI pequena
+            small = cv2.resize(roi, (roi_size, roi_size), interpolation=cv2.INTER_AREA)
+            rois[i] = small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            valid[i] = True
+
+    pixels = rois.astype(np.float32)
+    # Laplaciano 3x3 (o mesmo kernel do cv2.Laplacian com ksize=1) no interior de cada ROI
+    laplacian = (
+        pixels[:, :-2, 1:-1]
+        + pixels[:, 2:, 1:-1]
+        + pixels[:, 1:-1, :-2]
+        + pixels[:, 1:-1, 2:]
+        - 4.0 * pixels[:, 1:-1, 1:-1]
+    )
+    # A variância do Laplaciano cresce com o quadrado do contraste: dividida
+    # pela variância dos pixels, uma face escura e nítida não parece borrada
+    pixel_variance = np.maximum(pixels.var(axis=(1, 2)), MIN_PIXEL_VARIANCE)
+    sharpness = np.minimum(laplacian.var(axis=(1, 2)) / pixel_variance, 1.0)
+    brightness = pixels.mean(axis=(1, 2))
+    brightness_score = 1.0 - np.abs(brightness - 128.0) / 128.0  # Ideal é 128
+    contrast = np.minimum(pixels.std(axis=(1, 2)) / CONTRAST_SCALE, 1.0)
+
+    quality = np.clip(sharpness * 0.4 + brightness_score * 0.3 + contrast * 0.3, 0.0, 1.0)
+    return {
+        "quality": np.where(valid, quality, 0.0).astype(np.float32),
+        "sharpness": np.where(valid, sharpness, 0.0).astype(np.float32),
+        "brightness": brightness_score.astype(np.float32),
+        "contrast": contrast.astype(np.float32),
+    }
@@ -1,10 +1,15 @@
-import cv2
 import numpy as np
-import insightface
-from insightface.app import FaceAnalysis
 import faiss
+import json
 import os
-import pickle
+import threading
+import time
+import multiprocessing
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List, Tuple, Optional
 import sys
 
@@ -15,304 +20,1159 @@ project_root = os.path.dirname(
 sys.path.insert(0, project_root)
 from config import (
     DEVICE,
-    FACE_DETECTION_CONFIDENCE,
     FACE_RECOGNITION_THRESHOLD,
     EMBEDDING_DIMENSION,
     FAISS_INDEX_DIR,
     MODELS_DIR,
-    FACE_DETECTION_CONFIDENCE_HIGH,
     FACE_RECOGNITION_THRESHOLD_STRICT,
     FACE_RECOGNITION_THRESHOLD_RELAXED,
     MIN_FACE_SIZE,
-    MAX_FACE_SIZE,
+    FACE_DETECTION_MIN_FACE_PIXELS,
+    FACE_DETECTION_SESSION_TTL,
+    INFERENCE_BATCH_QUEUE,
+    INFERENCE_BATCH_SIZE,
+    INFERENCE_BATCH_WAIT_MS,
+    INFERENCE_SERVER_ADDRESS,
+    FAISS_COMPACTION_TOMBSTONE_RATIO,
+    FAISS_ANN_MIN_RECALL,
+    FAISS_RERANK_K,
+    FAISS_CHECKPOINT_RECORDS,
+    FAISS_SHARDS,
+    FAISS_REBUILD_BATCH_SIZE,
+    FAISS_REBUILD_WORKERS,
+    FACE_RECOGNITION_BACKGROUND_INIT,
+    INSIGHTFACE_MODEL_PACK,
+    FAISS_SYNC_INTERVAL,
+    FAISS_ENCRYPTED_SNAPSHOT,
+    FAISS_ENCRYPTED_SNAPSHOT_PATH,
+    FAISS_VERIFY_CHECKSUMS,
+    FAISS_RECONCILE_INTERVAL,
+    FAISS_RECONCILE_OVERLAP,
 )
-from app.encryption import encryption_manager
+from app.encryption import decrypt_embedding_batch, encryption_manager
+from app.face_tracker import FaceTracker
+from app.inference_pool import InferenceClient
+from app.inference_scheduler import InferenceScheduler
+from app.index_factory import (
+    configure_search,
+    copy_search_params,
+    index_compression,
+    index_kind,
+    make_search_params,
+    measure_recall,
+    new_index,
+    select_index_compression,
+    select_index_kind,
+)
+from app.id_mapping import UserIdMap
+from app.index_snapshot import (
+    MANIFEST,
+    PREVIOUS_MANIFEST,
+    LayeredIndex,
+    open_snapshot,
+    publish_snapshot,
+    read_manifest,
+    serialize_snapshot,
+    snapshot_file_info,
+    verify_snapshot_files,
+    write_manifest,
+)
+from app.sharded_index import ShardedIndex, build_sharded_index, new_sharded_index
+from app.index_journal import (
+    IndexJournal,
+    RECORD_ADD,
+    RECORD_CHECKPOINT,
+    RECORD_MAP,
+    RECORD_REMOVE,
+)
+from app.gallery_snapshot import read_encrypted_snapshot, write_encrypted_snapshot
+from app.gallery_version import GalleryVersion
+from app.vector_store import EmbeddingStore
+
+# Fases da inicialização, na ordem
+PHASE_STARTING = "starting"
+PHASE_LOADING_MODELS = "loading_models"
+PHASE_LOADING_INDEX = "loading_index"
+PHASE_REBUILDING = "rebuilding"  # Atendendo com o snapshot enquanto lê o banco
+PHASE_READY = "ready"
+PHASE_FAILED = "failed"  # Modelos não carregados
+
+
+def _spawn_pool_available() -> bool:
+    """Processos "spawn" podem ser iniciados a partir deste processo
+
+    Cada processo filho reimporta o __main__: só é seguro no processo
+    principal e com um __main__ importável (script ou módulo protegido por
+    if __name__ == "__main__"). Em workers, sessões interativas e stdin a
+    descriptografia fica no processo atual.
+    """
+    if multiprocessing.current_process().name != "MainProcess":
+        return False
+    main = sys.modules.get("__main__")
+    if getattr(main, "__spec__", None) is not None:
+        return True
+    # "python -" e "python -c" não têm arquivo para reimportar
+    main_file = getattr(main, "__file__", None)
+    return main_file is not None and os.path.isfile(main_file)
 
 
 class FaceRecognitionSystem:
-    def __init__(self):
-        self.face_app = None
+    def __init__(self, index_dir: Optional[Path] = None, pipeline=None, session_factory=None):
+        """
+        Args:
+            index_dir: diretório da galeria (padrão FAISS_INDEX_DIR; o snapshot
+                criptografado fica nele quando informado)
+            pipeline: modelos já carregados a compartilhar (não são fechados
+                por close())
+            session_factory: fábrica de sessões do banco (padrão SessionLocal)
+        """
+        self.index_dir = Path(index_dir) if index_dir is not None else FAISS_INDEX_DIR
+        self.encrypted_snapshot_path = (
+            self.index_dir / FAISS_ENCRYPTED_SNAPSHOT_PATH.name
+            if index_dir is not None
+            else FAISS_ENCRYPTED_SNAPSHOT_PATH
+        )
+        self._session_factory = session_factory
+        # Modelos no próprio processo ou no servidor de inferência compartilhado
+        self._owns_pipeline = pipeline is None
+        if pipeline is not None:
+            self.pipeline = pipeline
+        elif INFERENCE_SERVER_ADDRESS:
+            self.pipeline = InferenceClient(INFERENCE_SERVER_ADDRESS)
+        else:
+            # Importado só aqui: workers ligados ao servidor não carregam o insightface
+            from app.face_pipeline import FacePipeline
+
+            self.pipeline = FacePipeline()
+        # Tamanho da face no último frame de cada sessão: session_id -> (pixels, instante)
+        self._session_faces = {}
+        self._sessions_lock = threading.Lock()
+        # Trilha da face de cada sessão: identidade reaproveitada entre frames
+        self.face_tracker = FaceTracker()
+        # Frames de requisições concorrentes agrupados em lotes de inferência
+        self.inference_scheduler = InferenceScheduler(
+            self.detect_faces_batch,
+            INFERENCE_BATCH_SIZE,
+            INFERENCE_BATCH_WAIT_MS,
+            max_queue=INFERENCE_BATCH_QUEUE,
+        )
         self.faiss_index = None
-        self.id_to_user = {}  # Mapear ID do FAISS para usuário
+        self.index_kind = "flat"  # Tipo do índice atual: flat, ivf ou hnsw
+        self.index_compression = "none"  # Compressão do índice atual: none, sq8 ou pq
+        self._rejected_index_spec = None  # (tipo, compressão) reprovado no teste de recall
+        # Vetores exatos da galeria (fonte da compactação e do re-ranking)
+        self.vector_store = EmbeddingStore(self.index_dir / "embeddings.f32")
+        self.id_to_user = UserIdMap()  # Mapear ID do FAISS para usuário
         self.next_faiss_id = 0
+        self.tombstones = set()  # faiss_ids removidos que ainda ocupam o índice
+        self._search_params = None  # Parâmetros de busca que excluem os tombstones
+        # Alterações desde o último snapshot (cadastros não reescrevem o índice)
+        self.journal = IndexJournal(self.index_dir / "index.journal")
+        # Geração da galeria compartilhada pelos workers e a já aplicada aqui
+        self.version = GalleryVersion(self.index_dir)
+        self.generation = 0
+        self._needs_reload = False  # Snapshot novo de outro worker a carregar
+        # Galeria carregada do snapshot anterior ou do criptografado: republicar
+        # os arquivos do índice
+        self._republish_snapshot = False
+        self._sync_thread = None
+        self._closing = threading.Event()
+        # Ordem dos locks: _checkpoint_lock, checkpoint.lock, lock da galeria
+        # (self.version.lock()) e por último _index_lock
+        self._index_lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._compaction_thread = None
+        self._checkpoint_thread = None
+        # Reconstrução a partir do banco: uma por vez; remoções feitas durante
+        # a leitura do banco são reaplicadas no índice novo antes da troca
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_removals = None
+        # Reconciliação incremental com o banco (uma por vez)
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_thread = None
+        self._unmapped_seen = set()  # Embeddings sem usuário na reconciliação anterior
+        self.last_reconcile = None  # Resumo da última reconciliação
+        # Fase da inicialização (consultada por /api/ready)
+        self.phase = PHASE_STARTING
+        self.startup_error = None
+        self._ready = threading.Event()
+        self._init_thread = None
+        self.start()
+
+    @property
+    def face_app(self):
+        """FaceAnalysis carregado neste processo (None com servidor de inferência)"""
+        return getattr(self.pipeline, "face_app", None)
+
+    def start(self, background: bool = FACE_RECOGNITION_BACKGROUND_INIT):
+        """Carrega modelos e índice, em background por padrão
+
+        Em background a API aceita conexões imediatamente e /api/ready informa
+        a fase da carga; scripts que usam o sistema direto devem chamar
+        wait_until_ready().
+        """
+        if not background:
+            self.initialize()
+            return
+
+        self._init_thread = threading.Thread(
+            target=self.initialize, name="face-recognition-init", daemon=True
+        )
+        self._init_thread.start()
+
+    def initialize(self):
+        """Carrega modelos, snapshot do índice e, se preciso, reconstrói do banco"""
+        start_time = time.perf_counter()
         try:
-            self.load_models()
-        except Exception as e:
-            print(f"⚠️  Erro ao carregar modelos: {e}")
-            # Continuar mesmo se os modelos não carregarem
-        try:
-            self.load_faiss_index()
-            # Se o índice estiver vazio, tentar reconstruir do banco
-            if self.faiss_index is None or self.faiss_index.ntotal == 0:
-                print("🔄 Índice FAISS vazio, tentando reconstruir do banco de dados...")
-                self.rebuild_index_from_database()
-        except Exception as e:
-            print(f"⚠️  Erro ao carregar índice FAISS: {e}")
-            # Criar índice vazio se não conseguir carregar
-            self._create_new_index()
-            # Tentar reconstruir do banco mesmo assim
+            self.phase = PHASE_LOADING_MODELS
             try:
-                self.rebuild_index_from_database()
-            except Exception as rebuild_error:
-                print(f"⚠️  Não foi possível reconstruir índice do banco: {rebuild_error}")
+                self.load_models()
+            except Exception as e:
+                print(f"⚠️  Erro ao carregar modelos: {e}")
+                self.startup_error = f"Modelos não carregados: {e}"
+                # Continuar mesmo se os modelos não carregarem
 
-    def load_models(self):
-        """Carrega modelos InsightFace - Suporta GPU e CPU"""
-        try:
-            import torch
-            import onnxruntime as ort
-
-            # Determinar providers baseado no dispositivo disponível
-            if DEVICE == "cuda" and torch.cuda.is_available():
-                print("🚀 Configurando InsightFace para GPU...")
-                
-                # Verificar providers disponíveis no ONNX Runtime
-                available_providers = ort.get_available_providers()
-                
-                if "CUDAExecutionProvider" in available_providers:
-                    providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
-                    print("✅ ONNX Runtime GPU disponível")
-                else:
-                    print("⚠️  CUDAExecutionProvider não disponível, usando CPU")
-                    providers = ["CPUExecutionProvider"]
-                
-                # Configurar InsightFace com GPU (com fallback para CPU)
-                self.face_app = FaceAnalysis(
-                    name="buffalo_l",  # Modelo mais preciso
-                    providers=providers,
-                )
-                
-                # Preparar com configurações GPU otimizadas
-                self.face_app.prepare(ctx_id=0, det_size=(640, 640))
-                
-                # Verificar providers ativos
-                active_providers = self.face_app.models["detection"].session.get_providers()
-                print(f"✅ Modelos InsightFace carregados!")
-                print(f"   Providers ativos: {active_providers}")
-                
-                if "CUDAExecutionProvider" in active_providers:
-                    print("   🎯 Usando GPU para processamento")
-                else:
-                    print("   💻 Usando CPU para processamento")
-                    
-            else:
-                print("💻 Configurando InsightFace para CPU...")
-                
-                # Configurar InsightFace apenas com CPU
-                self.face_app = FaceAnalysis(
-                    name="buffalo_l",
-                    providers=["CPUExecutionProvider"],
+            self.phase = PHASE_LOADING_INDEX
+            try:
+                self.load_faiss_index()
+                # Se o índice estiver vazio, tentar reconstruir do banco
+                needs_rebuild = self.faiss_index is None or self.faiss_index.ntotal == 0
+                if needs_rebuild:
+                    print("🔄 Índice FAISS vazio, tentando reconstruir do banco de dados...")
+            except Exception as e:
+                print(f"⚠️  Erro ao carregar índice FAISS: {e}")
+                # Criar índice vazio se não conseguir carregar
+                self._create_new_index()
+                needs_rebuild = True
+
+            # Acompanhar cadastros feitos por outros workers
+            self._sync_thread = threading.Thread(
+                target=self._gallery_sync_loop, name="gallery-sync", daemon=True
+            )
+            self._sync_thread.start()
+
+            if needs_rebuild:
+                # Buscas e cadastros seguem no índice atual até a troca
+                self.phase = PHASE_REBUILDING
+                try:
+                    # Um worker reconstrói; os outros esperam e usam o snapshot publicado
+                    with self.version.file_lock("rebuild"):
+                        self.sync_gallery()
+                        if self.faiss_index is None or self.faiss_index.ntotal == 0:
+                            self.rebuild_index_from_database()
+                except Exception as rebuild_error:
+                    print(f"⚠️  Não foi possível reconstruir índice do banco: {rebuild_error}")
+
+            # Corrigir divergências com o banco sem reconstruir o índice
+            if FAISS_RECONCILE_INTERVAL > 0:
+                self._reconcile_thread = threading.Thread(
+                    target=self._reconcile_loop, name="gallery-reconcile", daemon=True
                 )
-                
-                # Preparar com configurações CPU
-                self.face_app.prepare(ctx_id=-1, det_size=(640, 640))  # ctx_id=-1 para CPU
-                
-                active_providers = self.face_app.models["detection"].session.get_providers()
-                print(f"✅ Modelos InsightFace carregados em CPU!")
-                print(f"   Providers ativos: {active_providers}")
+                self._reconcile_thread.start()
 
+            self.phase = PHASE_READY if self.pipeline.models_loaded else PHASE_FAILED
+            print(
+                f"🚦 Inicialização concluída em {time.perf_counter() - start_time:.1f}s "
+                f"(fase: {self.phase})"
+            )
         except Exception as e:
-            print(f"❌ Erro ao carregar modelos: {e}")
-            raise
+            self.phase = PHASE_FAILED
+            self.startup_error = str(e)
+            print(f"❌ Erro na inicialização do reconhecimento facial: {e}")
+        finally:
+            self._ready.set()
 
-    def load_faiss_index(self):
-        """Carrega ou cria índice FAISS"""
-        index_path = FAISS_INDEX_DIR / "face_index.faiss"
-        id_map_path = FAISS_INDEX_DIR / "id_mapping.pkl"
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda o fim da inicialização; retorna False se o tempo acabar antes"""
+        return self._ready.wait(timeout)
 
-        if index_path.exists() and id_map_path.exists():
-            try:
-                # Carregar índice existente
-                self.faiss_index = faiss.read_index(str(index_path))
+    def readiness(self) -> dict:
+        """Fase da inicialização e se o sistema já pode atender requisições
+
+        Durante a reconstrução a partir do banco o sistema atende com o snapshot
+        carregado, se ele tiver embeddings; com a galeria vazia ainda não.
+        """
+        index = self.faiss_index
+        total = index.ntotal if index is not None else 0
+        models_loaded = self.pipeline.models_loaded
+        ready = models_loaded and index is not None and (
+            self.phase == PHASE_READY or (self.phase == PHASE_REBUILDING and total > 0)
+        )
+        return {
+            "phase": self.phase,
+            "ready": ready,
+            "models_loaded": models_loaded,
+            "total_embeddings": total,
+            "error": self.startup_error,
+        }
 
-                # Carregar mapeamento de IDs
-                with open(id_map_path, "rb") as f:
-                    self.id_to_user = pickle.load(f)
+    def load_models(self):
+        """Carrega modelos InsightFace (ou conecta ao servidor de inferência)"""
+        if not self.pipeline.models_loaded:
+            self.pipeline.load_models()
 
-                # Definir próximo ID disponível
-                if self.id_to_user:
-                    self.next_faiss_id = max(self.id_to_user.keys()) + 1
-                else:
-                    self.next_faiss_id = 0
+    def _open_session(self):
+        """Sessão do banco de dados (SessionLocal, ou a fábrica informada)"""
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.database import SessionLocal
+
+        return SessionLocal()
+
+    def load_faiss_index(self):
+        """Carrega ou cria índice FAISS
+
+        Abre o último snapshot publicado e aplica os registros do journal
+        posteriores a ele. Também recarrega o índice quando outro worker publica
+        um checkpoint (com FAISS_INDEX_MMAP os arquivos são só mapeados). Sem
+        os arquivos do índice (ou com eles corrompidos) a galeria é restaurada
+        do snapshot criptografado, se houver.
+        """
+        with self.version.file_lock("checkpoint", shared=True):
+            with self.version.lock():
+                self._load_faiss_index_locked()
+
+        if self._republish_snapshot:
+            self._republish_snapshot = False
+            self.save_faiss_index()
 
-                print(f"Índice FAISS carregado: {self.faiss_index.ntotal} embeddings")
+    def _load_faiss_index_locked(self, keep_current_on_error: bool = False):
+        """Carrega o índice (chamar com o lock da galeria, sem checkpoint em andamento)
 
+        Os arquivos do snapshot são conferidos contra o manifesto (SHA-256 na
+        carga inicial, com FAISS_VERIFY_CHECKSUMS; só o tamanho nas recargas
+        pedidas por outro worker). Se o snapshot atual falhar, a carga inicial
+        usa o do manifesto anterior e reaplica o journal desde ele.
+        """
+        self._needs_reload = False
+        self.vector_store.refresh()
+        manifests = [
+            read_manifest(self.index_dir),
+            read_manifest(self.index_dir, PREVIOUS_MANIFEST),
+        ]
+        # Journal gravado antes das gerações
+        self.journal.upgrade_legacy(
+            max(int(manifests[0].get("generation", 0)), self.version.current())
+        )
+
+        # Sem manifesto: snapshot de versões antigas, com nomes fixos
+        candidates = [manifest for manifest in manifests if manifest] or [{}]
+        loaded = failed = False
+        for attempt, manifest in enumerate(candidates):
+            snapshot_files = self._manifest_snapshot_files(manifest)
+            if snapshot_files is None:
+                continue
+            snapshot_generation = int(manifest.get("generation", 0))
+            try:
+                verify_snapshot_files(
+                    manifest,
+                    self.index_dir,
+                    checksums=FAISS_VERIFY_CHECKSUMS and not keep_current_on_error,
+                )
+                self._open_snapshot(*snapshot_files, snapshot_generation)
+                loaded = True
+                if attempt > 0:
+                    print(f"♻️  Snapshot anterior (geração {snapshot_generation}) carregado")
+                    self._republish_snapshot = True
+                break
             except Exception as e:
-                print(f"Erro ao carregar índice FAISS: {e}")
-                self._create_new_index()
-        else:
+                print(f"Erro ao carregar índice FAISS (geração {snapshot_generation}): {e}")
+                if keep_current_on_error:
+                    # Continuar com o índice atual e tentar de novo depois
+                    self._needs_reload = True
+                    return
+                failed = True
+
+        if not loaded and (keep_current_on_error or not self._restore_encrypted_snapshot()):
             self._create_new_index()
+            if not failed:
+                # Galeria ainda sem checkpoint: todo o conteúdo está no journal
+                self.generation = 0
+                self._replay_journal()
+
+        with self._index_lock:
+            # Gerações e faiss_ids continuam de onde os outros workers estão
+            self.generation = max(self.generation, self.version.current())
+            self.version.publish(self.generation)
+            self.version.reserve_ids(0, self.next_faiss_id)
+
+    def _open_snapshot(self, snapshot_paths: list, id_map_path, snapshot_generation: int):
+        """Abre os arquivos de um snapshot e aplica o journal posterior a ele"""
+        # Carregar índice existente (mapeado em memória, se habilitado)
+        shards = [open_snapshot(path) for path in snapshot_paths]
+        if len(shards) > 1:
+            index = ShardedIndex(shards)
+        else:
+            index = shards[0]
 
-    def _create_new_index(self):
-        """Cria novo índice FAISS"""
-        try:
-            # Criar índice FlatIP (Inner Product) para similaridade de cosseno
-            self.faiss_index = faiss.IndexFlatIP(EMBEDDING_DIMENSION)
-            self.id_to_user = {}
-            self.next_faiss_id = 0
-            print("Novo índice FAISS criado")
-        except Exception as e:
-            print(f"❌ Erro ao criar índice FAISS: {e}")
-            # Criar índice vazio como fallback
-            import numpy as np
-            # Criar um índice mínimo mesmo se houver erro
-            try:
-                self.faiss_index = faiss.IndexFlatIP(EMBEDDING_DIMENSION)
-            except:
-                # Se ainda falhar, criar um índice dummy
-                self.faiss_index = None
-            self.id_to_user = {}
-            self.next_faiss_id = 0
+        # Índices antigos (IndexFlatIP puro) usam a posição como ID
+        if not isinstance(index, (faiss.IndexIDMap2, LayeredIndex, ShardedIndex)):
+            index = self._upgrade_legacy_index(index)
+        configure_search(index)
+        self._check_vector_store(index)
 
-    def save_faiss_index(self):
-        """Salva índice FAISS e mapeamento"""
-        try:
-            # Salvar índice
-            faiss.write_index(
-                self.faiss_index, str(FAISS_INDEX_DIR / "face_index.faiss")
+        # Carregar mapeamento de IDs
+        id_to_user = UserIdMap.load(id_map_path)
+
+        with self._index_lock:
+            self.id_to_user = id_to_user
+
+            # Vetores sem usuário mapeado são tombstones de remoções anteriores
+            index_ids = self._get_index_ids(index)
+            self.tombstones = set(
+                index_ids[self.id_to_user.lookup(index_ids) < 0].tolist()
             )
+            self._set_index(index)
+
+            # Definir próximo ID disponível
+            max_id = self.id_to_user.max_id()
+            if len(index_ids) > 0:
+                max_id = max(max_id, int(index_ids.max()))
+            self.next_faiss_id = max_id + 1
+            self.generation = snapshot_generation
+
+        self._replay_journal()
+        print(
+            f"Índice FAISS ({self.index_kind}/{self.index_compression}"
+            f"{', mmap' if self._is_mapped(index) else ''}, "
+            f"{len(snapshot_paths)} shard(s)) carregado: "
+            f"{self.faiss_index.ntotal} embeddings "
+            f"({len(self.tombstones)} removidos aguardando compactação, "
+            f"geração {self.generation})"
+        )
+        self._maybe_schedule_compaction()
+
+    def _restore_encrypted_snapshot(self) -> bool:
+        """Restaura a galeria do snapshot criptografado, sem consultar o banco
+
+        O arquivo é descriptografado em blocos direto para a memória, o índice
+        é montado e os registros posteriores do journal aplicados. Retorna False
+        se não houver snapshot válido (a galeria é então reconstruída do banco).
+        """
+        path = self.encrypted_snapshot_path
+        if not FAISS_ENCRYPTED_SNAPSHOT or not path.exists():
+            return False
 
-            # Salvar mapeamento
-            with open(FAISS_INDEX_DIR / "id_mapping.pkl", "wb") as f:
-                pickle.dump(self.id_to_user, f)
+        try:
+            start_time = time.perf_counter()
+            info, ids, user_ids, vectors = read_encrypted_snapshot(
+                path, encryption_manager.snapshot_key
+            )
+            read_time = time.perf_counter() - start_time
 
-            print("Índice FAISS salvo com sucesso!")
+            self.vector_store.put(ids, vectors)
+            self.vector_store.flush()
+            if len(ids) > 0:
+                index = self._build_gallery_index(vectors, ids)
+            else:
+                index = new_sharded_index(FAISS_SHARDS)
+            mapped = user_ids >= 0
+            id_to_user = UserIdMap()
+            id_to_user.assign(ids[mapped], user_ids[mapped])
+
+            with self._index_lock:
+                self.id_to_user = id_to_user
+                self.tombstones = set(ids[~mapped].tolist())
+                self._set_index(index)
+                self.next_faiss_id = max(
+                    info["next_faiss_id"], int(ids.max()) + 1 if len(ids) > 0 else 0
+                )
+                self.generation = info["generation"]
+                self._republish_snapshot = True
+
+            self._replay_journal()
+            print(
+                f"🔐 Galeria restaurada do snapshot criptografado: {len(ids)} embeddings "
+                f"(leitura {read_time:.1f}s, total {time.perf_counter() - start_time:.1f}s, "
+                f"geração {self.generation})"
+            )
+            return True
 
         except Exception as e:
-            print(f"Erro ao salvar índice FAISS: {e}")
+            print(f"⚠️  Snapshot criptografado da galeria ignorado: {e}")
+            return False
 
-    def detect_faces(
-        self, image: np.ndarray, high_precision: bool = False
-    ) -> List[dict]:
-        """Detecta faces na imagem com opção de alta precisão"""
+    def _write_encrypted_snapshot(
+        self, ids: np.ndarray, id_to_user: UserIdMap, generation: int, next_faiss_id: int
+    ):
+        """Grava o snapshot criptografado do checkpoint (vetores + mapeamento)
+
+        Se a gravação falhar o snapshot anterior é apagado: ele não cobre o
+        journal descartado por este checkpoint.
+        """
         try:
-            print(f"DEBUG DETECT: Processando imagem - Shape: {image.shape}")
-            faces = self.face_app.get(image)
-            print(f"DEBUG DETECT: Faces detectadas: {len(faces)}")
-
-            # Escolher threshold baseado na precisão desejada
-            confidence_threshold = (
-                FACE_DETECTION_CONFIDENCE_HIGH
-                if high_precision
-                else FACE_DETECTION_CONFIDENCE
+            write_encrypted_snapshot(
+                self.encrypted_snapshot_path,
+                encryption_manager.snapshot_key,
+                ids,
+                id_to_user.lookup(ids),
+                self.vector_store.get,
+                generation,
+                next_faiss_id,
             )
+        except Exception as e:
+            print(f"⚠️  Erro ao gravar snapshot criptografado da galeria: {e}")
+            if self.encrypted_snapshot_path.exists():
+                self.encrypted_snapshot_path.unlink()
 
-            # Filtrar faces por confiança e qualidade
-            valid_faces = []
+    def _replay_journal(self):
+        """Aplica ao índice carregado as alterações gravadas no journal
 
-            for i, face in enumerate(faces):
-                if face.det_score >= confidence_threshold:
-                    # Verificar qualidade da face detectada
-                    quality_ok = self._is_face_quality_good(face, image)
-
-                    if quality_ok:
-                        valid_faces.append(
-                            {
-                                "bbox": face.bbox.astype(int),
-                                "embedding": face.embedding,
-                                "det_score": face.det_score,
-                                "landmarks": face.kps if hasattr(face, "kps") else None,
-                                "quality_score": self._calculate_face_quality(
-                                    face, image
-                                ),
-                            }
-                        )
+        A aplicação é idempotente: registros já incluídos no snapshot (checkpoint
+        interrompido antes de apagar o journal antigo) não duplicam vetores.
+        """
+        with self._index_lock:
+            present = set(self._get_index_ids(self.faiss_index).tolist())
+            applied = self._apply_journal_records(
+                self.journal.replay(self.generation, include_previous=True), present
+            )
 
-            print(f"DEBUG DETECT: Faces válidas finais: {len(valid_faces)}")
+            if applied:
+                self._refresh_search_params()
+                print(f"📜 Journal do índice aplicado: {applied} alterações desde o último checkpoint")
 
-            # Ordenar por qualidade combinada (det_score + quality_score)
-            valid_faces.sort(
-                key=lambda x: x["det_score"] * x["quality_score"], reverse=True
+    def _apply_journal_records(self, records, present: Optional[set] = None) -> int:
+        """Aplica registros do journal ao estado em memória (chamar com _index_lock)
+
+        Com `present` (faiss_ids já no índice) a aplicação é idempotente, para a
+        carga do snapshot. Sem ele os registros são de outros workers e ainda
+        não foram aplicados; um salto de geração (registros que só existem no
+        snapshot novo) ou um checkpoint de outro worker pedem recarga.
+
+        Returns:
+            Número de registros aplicados
+        """
+        applied = 0
+        for generation, record_type, faiss_id, user_id, vector in records:
+            if present is None and generation > self.generation + 1:
+                self._needs_reload = True
+
+            if record_type == RECORD_ADD:
+                if present is None or faiss_id not in present:
+                    ids = np.array([faiss_id], dtype=np.int64)
+                    vector = vector.reshape(1, -1)
+                    self.vector_store.put(ids, vector)
+                    self.faiss_index.add_with_ids(vector, ids)
+                    if present is not None:
+                        present.add(faiss_id)
+                if user_id is not None:
+                    self.id_to_user[faiss_id] = user_id
+                    self.tombstones.discard(faiss_id)
+                self.next_faiss_id = max(self.next_faiss_id, faiss_id + 1)
+            elif record_type == RECORD_MAP:
+                if present is None or faiss_id in present:
+                    self.id_to_user[faiss_id] = user_id
+                    self.tombstones.discard(faiss_id)
+            elif record_type == RECORD_REMOVE:
+                if faiss_id in self.id_to_user:
+                    # Usuário removido por outro worker: a trilha não reaproveita a identidade
+                    self.face_tracker.forget_user(self.id_to_user[faiss_id])
+                    del self.id_to_user[faiss_id]
+                    self.tombstones.add(faiss_id)
+                elif present is None or faiss_id in present:
+                    # Embedding sem usuário descartado pela reconciliação
+                    self.tombstones.add(faiss_id)
+            elif record_type == RECORD_CHECKPOINT:
+                # Snapshot novo de outro worker: recarregar fora dos locks
+                if present is None:
+                    self._needs_reload = True
+                self.generation = max(self.generation, generation)
+                continue
+
+            self.generation = max(self.generation, generation)
+            applied += 1
+        return applied
+
+    def sync_gallery(self):
+        """Aplica as alterações gravadas por outros workers, se houver
+
+        Sem alterações custa uma leitura de memória (gallery.version); chamado a
+        cada reconhecimento e periodicamente pela thread gallery-sync.
+        """
+        if self.version.current() != self.generation:
+            with self.version.lock():
+                self._catch_up()
+        if self._needs_reload:
+            self._reload_snapshot()
+
+    def _catch_up(self):
+        """Lê o journal compartilhado até a geração atual (chamar com o lock da galeria)"""
+        with self._index_lock:
+            if self.version.current() == self.generation or self.faiss_index is None:
+                return
+            applied = self._apply_journal_records(self.journal.read_new(self.generation))
+            if applied:
+                self._refresh_search_params()
+
+    def _reload_snapshot(self):
+        """Recarrega o índice a partir do snapshot publicado por outro worker"""
+        print("🔄 Snapshot novo publicado por outro worker, recarregando índice...")
+        with self.version.file_lock("checkpoint", shared=True):
+            with self.version.lock():
+                self._load_faiss_index_locked(keep_current_on_error=True)
+        self._forget_removed_users()
+
+    def _forget_removed_users(self):
+        """Descarta as trilhas de usuários que não estão mais na galeria"""
+        user_ids = self.face_tracker.user_ids()
+        if not user_ids:
+            return
+        with self._index_lock:
+            present = self.id_to_user.contains_users(user_ids)
+        self.face_tracker.forget_users(np.asarray(user_ids)[~present].tolist())
+
+    def is_user_in_gallery(self, user_id: int) -> bool:
+        """O usuário continua com embedding na galeria (em dia com os outros workers)"""
+        self.sync_gallery()
+        with self._index_lock:
+            return self.id_to_user.contains_user(user_id)
+
+    def user_embeddings(self, user_id: int) -> np.ndarray:
+        """Vetores normalizados do usuário na galeria (em dia com os outros workers)"""
+        self.sync_gallery()
+        with self._index_lock:
+            vectors = self.vector_store.get(self.id_to_user.faiss_ids_of(user_id))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[norms[:, 0] > 0] / norms[norms[:, 0] > 0]
+
+    def verify_track(
+        self, session_id: str, bbox: np.ndarray, user_id: Optional[int], distance: float
+    ) -> dict:
+        """Registra na trilha da sessão o resultado do reconhecimento completo
+
+        Guarda os vetores do usuário reconhecido, com os quais os frames
+        seguintes da trilha são conferidos (FaceTracker.check).
+        """
+        reference = self.user_embeddings(user_id) if user_id is not None else None
+        if reference is not None and len(reference) == 0:
+            user_id, reference = None, None
+        return self.face_tracker.verify(session_id, bbox, user_id, distance, reference)
+
+    def _journal_append(self, record_type: int, faiss_id: int, user_id: Optional[int], vector=None):
+        """Grava um registro com a próxima geração e a publica aos outros workers
+
+        Chamar com o lock da galeria (já em dia com o journal) e _index_lock.
+        """
+        generation = max(self.generation, self.version.current()) + 1
+        self.journal.append(record_type, faiss_id, user_id, vector, generation)
+        self.generation = generation
+        self.version.publish(generation)
+
+    def _gallery_sync_loop(self):
+        """Mantém o worker em dia com a galeria mesmo sem requisições"""
+        while not self._closing.wait(FAISS_SYNC_INTERVAL):
+            try:
+                self.sync_gallery()
+            except Exception as e:
+                print(f"⚠️  Erro ao sincronizar galeria com outros workers: {e}")
+
+    def _upgrade_legacy_index(self, legacy_index):
+        """Converte índice sequencial antigo para índice endereçado por ID"""
+        print("🔄 Convertendo índice FAISS legado para índice com IDs...")
+        index = new_index("flat")
+        if legacy_index.ntotal > 0:
+            # No formato antigo o faiss_id é a posição do vetor no índice
+            vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+            ids = np.arange(legacy_index.ntotal, dtype=np.int64)
+            index.add_with_ids(vectors, ids)
+            self.vector_store.put(ids, vectors)
+        return index
+
+    def _check_vector_store(self, index):
+        """Garante que o arquivo de vetores exatos cobre todos os IDs do índice
+
+        Índices sem compressão reconstroem os vetores exatos; índices
+        comprimidos sem os vetores exigem reconstrução a partir do banco.
+        """
+        ids = self._get_index_ids(index)
+        if self.vector_store.covers(ids):
+            return
+        if index_compression(index) != "none":
+            raise RuntimeError("Vetores exatos ausentes para índice comprimido")
+
+        print("🔄 Regravando vetores exatos da galeria a partir do índice...")
+        for part in self._shards(index):
+            base = part.base if isinstance(part, LayeredIndex) else part
+            vectors = faiss.downcast_index(base.index).reconstruct_n(0, base.ntotal)
+            self.vector_store.put(faiss.vector_to_array(base.id_map), vectors)
+        self.vector_store.flush()
+
+    @staticmethod
+    def _shards(index) -> list:
+        """Shards do índice (o próprio índice se não for dividido)"""
+        return index.shards if isinstance(index, ShardedIndex) else [index]
+
+    @classmethod
+    def _is_mapped(cls, index) -> bool:
+        """Verifica se o índice é servido a partir de snapshots mapeados em memória"""
+        return any(isinstance(part, LayeredIndex) for part in cls._shards(index))
+
+    def _snapshot_paths(self, n_shards: int, generation: Optional[int] = None) -> list:
+        """Arquivos do snapshot: um único ou um por shard
+
+        Com a geração no nome (face_index.g<geração>[.shardN].faiss) um
+        checkpoint nunca sobrescreve os arquivos de um manifesto publicado;
+        sem ela, os nomes fixos das versões antigas.
+        """
+        prefix = "face_index" if generation is None else f"face_index.g{generation}"
+        if n_shards <= 1:
+            return [self.index_dir / f"{prefix}.faiss"]
+        return [self.index_dir / f"{prefix}.shard{i}.faiss" for i in range(n_shards)]
+
+    def _manifest_snapshot_files(self, manifest: dict) -> Optional[Tuple[list, object]]:
+        """(arquivos do índice, arquivo do mapeamento) do snapshot de um manifesto
+
+        Manifestos antigos não listam os arquivos: vale o snapshot de nomes
+        fixos encontrado no diretório. Retorna None se não houver snapshot.
+        """
+        if "index_files" in manifest:
+            return (
+                [self.index_dir / name for name in manifest["index_files"]],
+                self.index_dir / manifest["id_mapping"],
             )
 
-            return valid_faces
+        snapshot_paths = self._find_snapshot_paths()
+        id_map_path = self.index_dir / "id_mapping.npy"
+        if not id_map_path.exists():
+            # Formato antigo: dict em pickle
+            id_map_path = self.index_dir / "id_mapping.pkl"
+        if snapshot_paths and id_map_path.exists():
+            return snapshot_paths, id_map_path
+        return None
+
+    def _remove_stale_snapshot_files(self):
+        """Apaga arquivos de snapshot que nem o manifesto atual nem o anterior usam"""
+        keep = set()
+        for name in (MANIFEST, PREVIOUS_MANIFEST):
+            manifest = read_manifest(self.index_dir, name)
+            snapshot_files = self._manifest_snapshot_files(manifest) if manifest else None
+            if snapshot_files is not None:
+                keep.update(snapshot_files[0])
+                keep.add(snapshot_files[1])
+
+        for pattern in ("face_index*.faiss", "id_mapping*"):
+            for path in self.index_dir.glob(pattern):
+                if path not in keep:
+                    path.unlink()
+
+    def _find_snapshot_paths(self) -> Optional[list]:
+        """Arquivos do snapshot de nomes fixos (único ou um por shard)
+
+        Um snapshot com número de shards diferente do configurado é carregado
+        como está e redistribuído pela compactação em background. Se restarem
+        arquivos dos dois formatos (checkpoint interrompido), vale o mais novo.
+        """
+        candidates = [self._snapshot_paths(1)]
+        n_saved = len(list(self.index_dir.glob("face_index.shard*.faiss")))
+        if n_saved > 1:
+            candidates.append(self._snapshot_paths(n_saved))
+
+        candidates = [
+            paths for paths in candidates if all(path.exists() for path in paths)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda paths: min(p.stat().st_mtime for p in paths))
+
+    def _set_index(self, index):
+        """Troca o índice ativo (chamar com o lock do índice)"""
+        self.faiss_index = index
+        self.index_kind = index_kind(index)
+        self.index_compression = index_compression(index)
+        self._refresh_search_params()
+
+    def _select_index_spec(self, n_vectors: int) -> Tuple[str, str]:
+        """(tipo, compressão) desejados para uma galeria com n_vectors embeddings"""
+        spec = (
+            select_index_kind(n_vectors, self.index_kind),
+            select_index_compression(n_vectors),
+        )
+        if spec == self._rejected_index_spec:
+            return ("flat", "none")
+        return spec
+
+    def _build_gallery_index(self, vectors: np.ndarray, ids: np.ndarray):
+        """Monta índice do tipo adequado ao tamanho da galeria
+
+        Na troca para ANN e/ou compressão o índice novo só é aceito se o
+        recall@1 (com re-ranking exato, no modo comprimido) contra a busca
+        exata atingir FAISS_ANN_MIN_RECALL; caso contrário a galeria continua
+        em FlatIP sem compressão.
+        """
+        kind, compression = self._select_index_spec(len(ids))
+        index = build_sharded_index(vectors, ids, kind, compression, FAISS_SHARDS)
+        spec = (index_kind(index), index_compression(index))
+
+        if spec != ("flat", "none") and spec != (self.index_kind, self.index_compression):
+            recall = measure_recall(
+                index,
+                vectors,
+                ids,
+                params=make_search_params(index),
+                rerank_k=FAISS_RERANK_K if spec[1] != "none" else 0,
+            )
+            print(
+                f"📐 Recall do índice {spec[0]}/{spec[1]} vs FlatIP: "
+                f"recall@1={recall['recall_at_1']:.4f}, "
+                f"recall@{recall['k']}={recall['recall_at_k']:.4f}"
+            )
+            if recall["recall_at_1"] < FAISS_ANN_MIN_RECALL:
+                print(
+                    f"⚠️  Recall abaixo de {FAISS_ANN_MIN_RECALL}, mantendo FlatIP "
+                    f"(aumente nprobe/efSearch/FAISS_RERANK_K para habilitar {spec[0]}/{spec[1]})"
+                )
+                self._rejected_index_spec = spec
+                index = build_sharded_index(vectors, ids, "flat", "none", FAISS_SHARDS)
 
-        except Exception as e:
-            print(f"Erro na detecção de faces: {e}")
-            return []
+        return index
+
+    @staticmethod
+    def _get_index_ids(index) -> np.ndarray:
+        """Retorna os faiss_ids armazenados no índice, na ordem interna"""
+        if isinstance(index, (LayeredIndex, ShardedIndex)):
+            return index.get_ids()
+        return faiss.vector_to_array(index.id_map)
 
-    def _is_face_quality_good(self, face, image: np.ndarray) -> bool:
-        """Verifica se a qualidade da face detectada é adequada"""
+    def _create_new_index(self):
+        """Cria novo índice FAISS"""
         try:
-            bbox = face.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
+            with self._index_lock:
+                self.id_to_user = UserIdMap()
+                self.next_faiss_id = 0
+                self.tombstones = set()
+                self._set_index(new_sharded_index(FAISS_SHARDS))
+            print("Novo índice FAISS criado")
+        except Exception as e:
+            print(f"❌ Erro ao criar índice FAISS: {e}")
+            # Criar índice vazio como fallback
+            self.faiss_index = None
+            self.id_to_user = UserIdMap()
+            self.next_faiss_id = 0
+            self.tombstones = set()
+            self._search_params = None
 
-            # Verificar tamanho da face
-            face_width = x2 - x1
-            face_height = y2 - y1
+    def save_faiss_index(self, only_if_needed: bool = False):
+        """Salva índice FAISS e mapeamento (checkpoint)
 
-            if face_width < MIN_FACE_SIZE or face_height < MIN_FACE_SIZE:
-                return False
+        O estado é copiado e o journal rotacionado sob o lock do índice; a
+        gravação em disco acontece fora dele, sem bloquear buscas e cadastros.
+        Depois da gravação o processo passa a usar o snapshot novo mapeado em
+        memória e os outros workers são avisados para recarregá-lo. Não chamar
+        segurando _index_lock.
 
-            if face_width > MAX_FACE_SIZE or face_height > MAX_FACE_SIZE:
-                return False
+        Args:
+            only_if_needed: Desistir se outro worker acabou de fazer o checkpoint
+                (journal de novo abaixo de FAISS_CHECKPOINT_RECORDS)
+        """
+        try:
+            with self._checkpoint_lock, self.version.file_lock("checkpoint"):
+                with self.version.lock():
+                    self._catch_up()
+                    if self._needs_reload:
+                        # Registros que só existem no último snapshot publicado
+                        self._load_faiss_index_locked()
+                    if only_if_needed and self.journal.records < FAISS_CHECKPOINT_RECORDS:
+                        return
+
+                    with self._index_lock:
+                        index = self.faiss_index
+                        # faiss_ids são sequenciais: os >= snapshot_next_id são posteriores
+                        snapshot_next_id = self.next_faiss_id
+                        snapshot_generation = self.generation
+                        shards_data = [serialize_snapshot(part) for part in self._shards(index)]
+                        id_to_user = self.id_to_user.copy()
+                        if FAISS_ENCRYPTED_SNAPSHOT:
+                            # Removidos não entram no snapshot criptografado
+                            snapshot_ids = self._get_index_ids(index)
+                            snapshot_ids = snapshot_ids[
+                                ~np.isin(snapshot_ids, list(self.tombstones))
+                            ]
+                        self.vector_store.flush()
+                        # Alterações a partir daqui vão para o journal novo
+                        self.journal.rotate()
+
+                # Salvar índice, um arquivo por shard, em arquivos novos da
+                # geração: o snapshot atual segue intacto até o manifesto novo
+                snapshot_paths = self._snapshot_paths(len(shards_data), snapshot_generation)
+                files = {}
+                for data, path in zip(shards_data, snapshot_paths):
+                    publish_snapshot(data, path)
+                    files[path.name] = snapshot_file_info(path, data)
+                del shards_data
+
+                # Salvar mapeamento
+                id_map_path = self.index_dir / f"id_mapping.g{snapshot_generation}.npy"
+                id_to_user.save(id_map_path)
+                files[id_map_path.name] = snapshot_file_info(id_map_path)
+
+                if FAISS_ENCRYPTED_SNAPSHOT:
+                    self._write_encrypted_snapshot(
+                        snapshot_ids, id_to_user, snapshot_generation, snapshot_next_id
+                    )
+
+                # Manifesto por último (publicação do snapshot): geração
+                # coberta, arquivos e seus checksums
+                write_manifest(
+                    {
+                        "generation": snapshot_generation,
+                        "next_faiss_id": snapshot_next_id,
+                        "shards": len(snapshot_paths),
+                        "index_files": [path.name for path in snapshot_paths],
+                        "id_mapping": id_map_path.name,
+                        "files": files,
+                    },
+                    self.index_dir,
+                )
 
-            # Verificar se a face está dentro dos limites da imagem
-            img_height, img_width = image.shape[:2]
-            if x1 < 0 or y1 < 0 or x2 > img_width or y2 > img_height:
-                return False
+                # Snapshot cobre o journal antigo
+                self.journal.discard_rotated()
+                self._remove_stale_snapshot_files()
 
-            # Verificar proporção da face (não muito alongada)
-            aspect_ratio = face_width / face_height
-            if aspect_ratio < 0.5 or aspect_ratio > 2.0:
-                return False
+                # Avisar os outros workers do snapshot novo
+                with self.version.lock():
+                    self._catch_up()
+                    with self._index_lock:
+                        self._journal_append(RECORD_CHECKPOINT, 0, None)
 
-            return True
+                self._swap_to_snapshot(index, snapshot_next_id, snapshot_paths)
+
+            print("Índice FAISS salvo com sucesso!")
 
         except Exception as e:
-            print(f"Erro na verificação de qualidade: {e}")
-            return False
+            print(f"Erro ao salvar índice FAISS: {e}")
 
-    def _calculate_face_quality(self, face, image: np.ndarray) -> float:
-        """Calcula score de qualidade da face"""
-        try:
-            bbox = face.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
+    def _swap_to_snapshot(self, index, snapshot_next_id: int, snapshot_paths: list):
+        """Troca o índice em heap pelo snapshot recém-publicado, mapeado em memória
 
-            # Extrair região da face
-            face_roi = image[y1:y2, x1:x2]
+        Cadastros feitos durante a gravação são copiados para o delta do
+        snapshot antes da troca, como na compactação.
+        """
+        shards = [open_snapshot(path) for path in snapshot_paths]
+        if not all(isinstance(part, LayeredIndex) for part in shards):
+            return
+        mapped = ShardedIndex(shards) if len(shards) > 1 else shards[0]
+
+        with self._index_lock:
+            # Índice foi substituído (compactação ou limpeza) durante a gravação
+            if self.faiss_index is not index:
+                return
+
+            ids = self._get_index_ids(index)
+            late_ids = ids[ids >= snapshot_next_id]
+            if len(late_ids) > 0:
+                mapped.add_with_ids(self.vector_store.get(late_ids), late_ids)
+
+            configure_search(mapped)
+            self._set_index(mapped)
+
+    def _maybe_schedule_checkpoint(self):
+        """Agenda checkpoint em background quando o journal passa do limite"""
+        if self.journal.records < FAISS_CHECKPOINT_RECORDS or self._closing.is_set():
+            return
+        if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+            return
+
+        self._checkpoint_thread = threading.Thread(
+            target=self.save_faiss_index,
+            kwargs={"only_if_needed": True},
+            name="faiss-checkpoint",
+            daemon=True,
+        )
+        self._checkpoint_thread.start()
+
+    def close(self):
+        """Grava os registros pendentes do journal (encerramento da aplicação)
+
+        Espera a inicialização, o checkpoint e a compactação em andamento: os
+        arquivos da galeria não ficam sendo gravados depois do encerramento.
+        """
+        self._closing.set()
+        self.inference_scheduler.close()
+        for thread in (
+            self._init_thread,
+            self._sync_thread,
+            self._reconcile_thread,
+            self._compaction_thread,
+            self._checkpoint_thread,
+        ):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+        if self._owns_pipeline:
+            self.pipeline.close()
+        self.journal.close()
 
-            if face_roi.size == 0:
-                return 0.0
+    def detect_faces(
+        self,
+        image: np.ndarray,
+        high_precision: bool = False,
+        max_faces: Optional[int] = None,
+        session_id: Optional[str] = None,
+        track: bool = False,
+    ) -> List[dict]:
+        """Detecta faces na imagem com opção de alta precisão
 
-            # Converter para escala de cinza
-            gray_face = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
+        Pipeline em duas etapas: o detector roda na imagem inteira, faces com
+        confiança ou qualidade insuficientes são descartadas e só as escolhidas
+        (as max_faces de maior det_score, ou todas as válidas) passam pela
+        rede de reconhecimento, em um único lote de recortes alinhados.
 
-            # Calcular nitidez usando Laplacian
-            laplacian_var = cv2.Laplacian(gray_face, cv2.CV_64F).var()
+        A resolução de entrada do detector é escolhida por requisição (ver
+        _choose_det_size); com session_id o tamanho da face do frame anterior
+        da sessão permite usar uma resolução menor.
 
-            # Calcular brilho médio
-            brightness = np.mean(gray_face)
+        Com track, a face que continua a trilha confirmada da sessão e cujo
+        embedding continua próximo dos vetores do usuário da trilha
+        (FaceTracker.check) vem com a trilha em "track" e dispensa a busca
+        no FAISS.
+        """
+        return self.detect_faces_batch([(image, high_precision, max_faces, session_id, track)])[0]
+
+    def submit_detection(
+        self,
+        image: np.ndarray,
+        high_precision: bool = False,
+        max_faces: Optional[int] = None,
+        session_id: Optional[str] = None,
+        track: bool = False,
+    ) -> Future:
+        """Enfileira o frame no agendador de inferência (lotes entre requisições)
+
+        O Future resolve com o mesmo resultado de detect_faces.
+        """
+        return self.inference_scheduler.submit((image, high_precision, max_faces, session_id, track))
+
+    def detect_faces_batch(self, requests: List[tuple]) -> List[List[dict]]:
+        """detect_faces para vários frames, com o reconhecimento em um só lote
 
-            # Calcular contraste
-            contrast = np.std(gray_face)
+        Args:
+            requests: (image, high_precision, max_faces, session_id, track) por frame
 
-            # Normalizar scores (valores empíricos)
-            sharpness_score = min(laplacian_var / 1000.0, 1.0)  # Normalizar para 0-1
-            brightness_score = 1.0 - abs(brightness - 128) / 128.0  # Ideal é 128
-            contrast_score = min(contrast / 64.0, 1.0)  # Normalizar para 0-1
+        Returns:
+            Lista de faces válidas de cada frame, na ordem de requests
+        """
+        det_sizes = []
+        for image, high_precision, _, session_id, _ in requests:
+            try:
+                det_sizes.append(self._choose_det_size(image, session_id, high_precision))
+            except Exception as e:
+                print(f"Erro na detecção de faces: {e}")
+                det_sizes.append(self.pipeline.detector_sizes[-1])
 
-            # Score combinado
-            quality_score = (
-                sharpness_score * 0.4 + brightness_score * 0.3 + contrast_score * 0.3
+        try:
+            detected = self.pipeline.run(
+                [
+                    (image, det_size, high_precision, max_faces)
+                    for (image, high_precision, max_faces, _, _), det_size in zip(requests, det_sizes)
+                ]
             )
+        except Exception as e:
+            print(f"Erro na detecção de faces: {e}")
+            return [[] for _ in requests]
 
-            return max(0.0, min(1.0, quality_score))
+        results = []
+        for (_, _, _, session_id, track), faces, det_size in zip(requests, detected, det_sizes):
+            self._remember_face_size(session_id, faces)
+            if track and not faces:
+                self.face_tracker.drop(session_id)
+            valid_faces = []
+            for face in faces:
+                valid_face = {
+                    "bbox": face["bbox"].astype(int),
+                    "embedding": face["embedding"],
+                    "det_score": face["det_score"],
+                    "landmarks": face["kps"],
+                    "quality_score": face["quality_score"],
+                    "det_size": det_size,
+                    "track": None,
+                }
+                if track and not any(other["track"] for other in valid_faces):
+                    # Mesma face e embedding próximo do usuário da trilha:
+                    # identidade confirmada reaproveitada sem busca no FAISS
+                    valid_face["track"] = self.face_tracker.check(
+                        session_id, valid_face["bbox"], valid_face["embedding"], FACE_RECOGNITION_THRESHOLD
+                    )
+                valid_faces.append(valid_face)
+            print(f"DEBUG DETECT: Faces válidas finais: {len(valid_faces)}")
 
-        except Exception as e:
-            print(f"Erro no cálculo de qualidade: {e}")
-            return 0.0
+            # Ordenar por qualidade combinada (det_score + quality_score)
+            valid_faces.sort(
+                key=lambda x: x["det_score"] * x["quality_score"], reverse=True
+            )
+            results.append(valid_faces)
+        return results
+
+    def _choose_det_size(
+        self, image: np.ndarray, session_id: Optional[str], high_precision: bool = False
+    ) -> int:
+        """Menor resolução do detector em que a menor face esperada ainda é detectável
+
+        A imagem é reduzida para caber em det_size x det_size; a menor face
+        esperada (MIN_FACE_SIZE, ou uma fração da face vista no frame anterior
+        da sessão) precisa ficar com FACE_DETECTION_MIN_FACE_PIXELS na entrada
+        do detector. Resoluções maiores que a própria imagem não trazem ganho.
+        O custo da detecção em CPU cresce com o número de pixels.
+        """
+        sizes = self.pipeline.detector_sizes
+        if high_precision or len(sizes) == 1:
+            return sizes[-1]
+
+        min_face = MIN_FACE_SIZE
+        previous = self._session_face_size(session_id)
+        if previous is not None:
+            # A face pode se afastar entre frames
+            min_face = max(min_face, previous * 0.6)
+
+        longest_side = max(image.shape[:2])
+        for size in sizes:
+            if size >= longest_side:
+                return size
+            if min_face * size / longest_side >= FACE_DETECTION_MIN_FACE_PIXELS:
+                return size
+        return sizes[-1]
+
+    def _session_face_size(self, session_id: Optional[str]) -> Optional[float]:
+        """Tamanho da maior face do frame anterior da sessão (None se expirou)"""
+        if session_id is None:
+            return None
+        with self._sessions_lock:
+            entry = self._session_faces.get(session_id)
+        if entry is None or time.monotonic() - entry[1] > FACE_DETECTION_SESSION_TTL:
+            return None
+        return entry[0]
+
+    def _remember_face_size(self, session_id: Optional[str], faces: list):
+        """Guarda o tamanho da maior face escolhida para o próximo frame da sessão"""
+        if session_id is None:
+            return
+        now = time.monotonic()
+        with self._sessions_lock:
+            if not faces:
+                # Sem face no frame: o próximo volta a procurar faces pequenas
+                self._session_faces.pop(session_id, None)
+                return
+            self._session_faces[session_id] = (
+                max(
+                    float(min(face["bbox"][2] - face["bbox"][0], face["bbox"][3] - face["bbox"][1]))
+                    for face in faces
+                ),
+                now,
+            )
+            if len(self._session_faces) > 1000:
+                self._session_faces = {
+                    key: entry
+                    for key, entry in self._session_faces.items()
+                    if now - entry[1] <= FACE_DETECTION_SESSION_TTL
+                }
 
     def extract_embedding(self, image: np.ndarray) -> Optional[np.ndarray]:
         """Extrai embedding de uma face na imagem"""
-        faces = self.detect_faces(image)
+        # Só a face com maior confiança passa pelo reconhecimento
+        faces = self.detect_faces(image, max_faces=1)
 
         if not faces:
             return None
 
-        # Retornar embedding da face com maior confiança
-        best_face = max(faces, key=lambda x: x["det_score"])
-        return best_face["embedding"]
+        return faces[0]["embedding"]
 
     def add_user_embedding(self, embedding: np.ndarray, user_id: Optional[int] = None) -> int:
         """Adiciona embedding de usuário ao índice FAISS
@@ -332,24 +1192,34 @@ class FaceRecognitionSystem:
             embedding_normalized = embedding / np.linalg.norm(embedding)
             print(f"DEBUG FAISS: Embedding normalizado")
 
-            # Adicionar ao índice FAISS
-            faiss_id = self.next_faiss_id
-            print(f"DEBUG FAISS: Usando faiss_id: {faiss_id}")
+            with self.version.lock():
+                # Aplicar cadastros de outros workers antes de reservar o ID
+                self._catch_up()
+                with self._index_lock:
+                    # Adicionar ao índice FAISS
+                    faiss_id = self.version.reserve_ids(1, self.next_faiss_id)
+                    print(f"DEBUG FAISS: Usando faiss_id: {faiss_id}")
 
-            self.faiss_index.add(embedding_normalized.reshape(1, -1))
-            print(f"DEBUG FAISS: Embedding adicionado ao índice")
+                    vector = embedding_normalized.reshape(1, -1).astype(np.float32)
+                    ids = np.array([faiss_id], dtype=np.int64)
+                    self.vector_store.put(ids, vector)
+                    self.faiss_index.add_with_ids(vector, ids)
+                    print(f"DEBUG FAISS: Embedding adicionado ao índice")
 
-            # Mapear ID do FAISS para ID do usuário (se fornecido)
-            if user_id is not None:
-                self.id_to_user[faiss_id] = user_id
-                print(f"DEBUG FAISS: Mapeamento criado: {faiss_id} -> {user_id}")
+                    # Mapear ID do FAISS para ID do usuário (se fornecido)
+                    if user_id is not None:
+                        self.id_to_user[faiss_id] = user_id
+                        print(f"DEBUG FAISS: Mapeamento criado: {faiss_id} -> {user_id}")
 
-            self.next_faiss_id += 1
+                    self.next_faiss_id = faiss_id + 1
 
-            # Salvar índice atualizado
-            print("DEBUG FAISS: Salvando índice...")
-            self.save_faiss_index()
-            print("DEBUG FAISS: Índice salvo com sucesso")
+                    # Registrar no journal em vez de reescrever o índice
+                    self._journal_append(RECORD_ADD, faiss_id, user_id, vector)
+                    print("DEBUG FAISS: Cadastro registrado no journal")
+
+            self._maybe_schedule_checkpoint()
+            # Galeria pode ter passado do limite de troca para ANN
+            self._maybe_schedule_compaction()
 
             return faiss_id
 
@@ -357,160 +1227,401 @@ class FaceRecognitionSystem:
             print(f"Erro ao adicionar embedding: {e}")
             raise
 
+    def set_user_mapping(self, faiss_id: int, user_id: int):
+        """Associa um embedding já adicionado (sem user_id) ao usuário criado no banco"""
+        with self.version.lock():
+            self._catch_up()
+            with self._index_lock:
+                self.id_to_user[faiss_id] = user_id
+                self.tombstones.discard(faiss_id)
+                self._journal_append(RECORD_MAP, faiss_id, user_id)
+        self._maybe_schedule_checkpoint()
+
     def recognize_face(
         self, embedding: np.ndarray, k: int = 5, adaptive_threshold: bool = True
     ) -> Tuple[Optional[int], float]:
         """Reconhece face comparando com embeddings conhecidos com threshold adaptativo"""
         try:
-            if self.faiss_index.ntotal == 0:
-                return None, 1.0
-
-            # Normalizar embedding
-            embedding_normalized = embedding / np.linalg.norm(embedding)
-
-            # Buscar k vizinhos mais próximos
-            similarities, indices = self.faiss_index.search(
-                embedding_normalized.reshape(1, -1), min(k, self.faiss_index.ntotal)
+            user_ids, distances = self.recognize_faces(
+                embedding.reshape(1, -1), k=k, adaptive_threshold=adaptive_threshold
             )
+            user_id = int(user_ids[0])
+            distance = float(distances[0])
 
-            # Pegar melhor resultado
-            best_similarity = similarities[0][0]
-            best_index = indices[0][0]
-
-            # Converter similaridade para distância (1 - similaridade)
-            distance = 1.0 - best_similarity
-
-            # Threshold adaptativo baseado na qualidade dos resultados
-            if adaptive_threshold:
-                threshold = self._get_adaptive_threshold(similarities[0])
-            else:
-                threshold = FACE_RECOGNITION_THRESHOLD
-
-            # Verificar se está dentro do threshold
-            if distance <= threshold:
-                user_id = self.id_to_user.get(best_index)
-                print(f"🔍 Reconhecimento: best_index={best_index}, distance={distance:.4f}, threshold={threshold:.4f}, user_id={user_id}")
-                print(f"🔍 Mapeamento disponível: {list(self.id_to_user.keys())}")
+            if user_id >= 0:
+                print(f"🔍 Reconhecimento: distance={distance:.4f}, user_id={user_id}")
                 return user_id, distance
             else:
-                print(f"❌ Reconhecimento falhou: distance={distance:.4f} > threshold={threshold:.4f}")
+                print(f"❌ Reconhecimento falhou: distance={distance:.4f}")
                 return None, distance
 
         except Exception as e:
             print(f"Erro no reconhecimento: {e}")
             return None, 1.0
 
-    def _get_adaptive_threshold(self, similarities: np.ndarray) -> float:
-        """Calcula threshold adaptativo baseado na distribuição de similaridades"""
-        try:
-            if len(similarities) < 2:
-                return FACE_RECOGNITION_THRESHOLD
+    def recognize_faces(
+        self, embeddings: np.ndarray, k: int = 5, adaptive_threshold: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Reconhece várias faces com uma única busca no índice FAISS
+
+        Args:
+            embeddings: Matriz [N, 512] com um embedding por linha
+            k: Vizinhos considerados por face (para o threshold adaptativo)
+            adaptive_threshold: Usar threshold adaptativo por face
 
-            # Calcular diferença entre melhor e segundo melhor resultado
-            best_sim = similarities[0]
-            second_best_sim = similarities[1] if len(similarities) > 1 else best_sim
+        Returns:
+            (user_ids, distances): arrays [N] com o user_id reconhecido (-1 se
+            nenhum) e a distância (1 - similaridade) do melhor resultado válido
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIMENSION)
+        n_queries = len(embeddings)
+        user_ids = np.full(n_queries, -1, dtype=np.int64)
+        distances = np.ones(n_queries, dtype=np.float32)
+
+        # Cadastros e remoções feitos por outros workers
+        self.sync_gallery()
+
+        index = self.faiss_index
+        active_total = index.ntotal - len(self.tombstones) if index is not None else 0
+        if n_queries == 0 or active_total <= 0:
+            return user_ids, distances
+
+        # Normalizar todos os embeddings de uma vez
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        queries = embeddings / np.maximum(norms, 1e-12)
+
+        # Buscar k vizinhos mais próximos, ignorando embeddings removidos
+        similarities, indices = self._search_gallery(index, queries, min(k, active_total))
+
+        # Descartar resultados sem usuário mapeado (removidos ou pendentes),
+        # movendo os válidos para o início de cada linha
+        users = self.id_to_user.lookup(indices)
+        mapped = users >= 0
+        order = np.argsort(~mapped, axis=1, kind="stable")
+        similarities = np.take_along_axis(similarities, order, axis=1)
+        users = np.take_along_axis(users, order, axis=1)
+        valid_counts = mapped.sum(axis=1)
+        has_result = valid_counts > 0
+
+        # Converter similaridade para distância (1 - similaridade)
+        distances[has_result] = 1.0 - similarities[has_result, 0]
+
+        # Threshold adaptativo baseado na qualidade dos resultados
+        if adaptive_threshold:
+            thresholds = self._get_adaptive_thresholds(similarities, valid_counts)
+        else:
+            thresholds = np.full(n_queries, FACE_RECOGNITION_THRESHOLD, dtype=np.float64)
 
-            gap = best_sim - second_best_sim
+        # Verificar se está dentro do threshold
+        accepted = has_result & (distances <= thresholds)
+        user_ids[accepted] = users[accepted, 0]
 
-            # Se há uma grande diferença, usar threshold mais relaxado
-            if gap > 0.1:  # Diferença significativa
-                return FACE_RECOGNITION_THRESHOLD_RELAXED
-            # Se há pouca diferença, usar threshold mais rigoroso
-            elif gap < 0.05:  # Diferença pequena
-                return FACE_RECOGNITION_THRESHOLD_STRICT
-            else:
-                return FACE_RECOGNITION_THRESHOLD
+        return user_ids, distances
+
+    def _search_gallery(self, index, queries: np.ndarray, k: int):
+        """Busca os k vizinhos das consultas no índice
+
+        No modo comprimido (SQ8/PQ) as similaridades do índice são aproximadas:
+        busca FAISS_RERANK_K candidatos e reordena pela similaridade exata com
+        os vetores do EmbeddingStore.
+        """
+        # Cópia por busca: buscas simultâneas não podem compartilhar os parâmetros
+        params = copy_search_params(self._search_params)
+
+        if self.index_compression == "none":
+            return index.search(queries, k, params=params)
+
+        active_total = index.ntotal - len(self.tombstones)
+        n_candidates = min(max(k, FAISS_RERANK_K), active_total)
+        _, candidates = index.search(queries, n_candidates, params=params)
+
+        # -1 indica que a busca retornou menos candidatos que o pedido
+        exact = self.vector_store.get(np.maximum(candidates, 0))
+        similarities = np.einsum("qcd,qd->qc", exact, queries)
+        similarities[candidates < 0] = -np.inf
+
+        order = np.argsort(-similarities, axis=1)[:, :k]
+        return (
+            np.take_along_axis(similarities, order, axis=1),
+            np.take_along_axis(candidates, order, axis=1),
+        )
+
+    def _get_adaptive_threshold(self, similarities: np.ndarray) -> float:
+        """Calcula threshold adaptativo baseado na distribuição de similaridades"""
+        try:
+            similarities = np.asarray(similarities).reshape(1, -1)
+            return float(
+                self._get_adaptive_thresholds(similarities, np.array([similarities.shape[1]]))[0]
+            )
 
         except Exception as e:
             print(f"Erro no cálculo de threshold adaptativo: {e}")
             return FACE_RECOGNITION_THRESHOLD
 
+    def _get_adaptive_thresholds(
+        self, similarities: np.ndarray, valid_counts: np.ndarray
+    ) -> np.ndarray:
+        """Threshold adaptativo por linha de uma matriz de similaridades [N, k]
+
+        Args:
+            similarities: Similaridades ordenadas (válidas no início de cada linha)
+            valid_counts: Quantidade de similaridades válidas em cada linha
+        """
+        n_queries = similarities.shape[0]
+        thresholds = np.full(n_queries, FACE_RECOGNITION_THRESHOLD, dtype=np.float64)
+        if similarities.shape[1] < 2:
+            return thresholds
+
+        # Calcular diferença entre melhor e segundo melhor resultado
+        gap = similarities[:, 0] - similarities[:, 1]
+        has_second = valid_counts >= 2
+
+        # Se há uma grande diferença, usar threshold mais relaxado
+        thresholds[has_second & (gap > 0.1)] = FACE_RECOGNITION_THRESHOLD_RELAXED
+        # Se há pouca diferença, usar threshold mais rigoroso
+        thresholds[has_second & (gap < 0.05)] = FACE_RECOGNITION_THRESHOLD_STRICT
+
+        return thresholds
+
     def remove_user_embedding(self, faiss_id: int):
-        """Remove embedding do usuário (implementação simplificada)"""
-        # FAISS não suporta remoção eficiente, então marcamos como removido
-        if faiss_id in self.id_to_user:
-            del self.id_to_user[faiss_id]
+        """Remove embedding do usuário do índice
+
+        A remoção é imediata para a busca (o faiss_id vira tombstone e é
+        excluído via IDSelector); o espaço é recuperado pela compactação em
+        background quando a fração de tombstones passa do limite configurado.
+        """
+        self.remove_user_embeddings([faiss_id])
+
+    def remove_user_embeddings(self, faiss_ids) -> int:
+        """Remove vários embeddings do índice de uma vez
+
+        Todos viram tombstones sob um único lock e o seletor de exclusão da
+        busca é reconstruído uma vez só (remover em laço o reconstruiria a
+        cada usuário, O(N²) para remoções em massa).
+
+        Returns:
+            Quantidade de embeddings removidos da busca
+        """
+        removed_users = []
+        with self.version.lock():
+            # Os usuários podem ter sido cadastrados por outro worker
+            self._catch_up()
+            with self._index_lock:
+                for faiss_id in faiss_ids:
+                    faiss_id = int(faiss_id)
+                    if self._rebuild_removals is not None:
+                        # Usuário pode estar no índice que está sendo reconstruído
+                        self._rebuild_removals.add(faiss_id)
+                    if faiss_id not in self.id_to_user:
+                        continue
+                    removed_users.append(self.id_to_user[faiss_id])
+                    del self.id_to_user[faiss_id]
+                    self.tombstones.add(faiss_id)
+                    self._journal_append(RECORD_REMOVE, faiss_id, None)
+                if removed_users:
+                    self._refresh_search_params()
+        # Trilhas desses usuários não podem mais liberar acesso
+        self.face_tracker.forget_users(removed_users)
+        self._maybe_schedule_checkpoint()
+        self._maybe_schedule_compaction()
+        return len(removed_users)
+
+    def _refresh_search_params(self):
+        """Atualiza os parâmetros de busca (nprobe/efSearch e exclusão dos tombstones)"""
+        if not self.tombstones:
+            self._search_params = make_search_params(self.faiss_index)
+            return
+
+        batch = faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64))
+        selector = faiss.IDSelectorNot(batch)
+        params = make_search_params(self.faiss_index, selector)
+        # Manter referências Python aos seletores junto dos parâmetros (o FAISS
+        # guarda apenas ponteiros), inclusive em buscas que ainda usam os antigos
+        params.selector_refs = (batch, selector)
+        self._search_params = params
+
+    def _tombstone_ratio(self) -> float:
+        """Fração do índice ocupada por embeddings removidos"""
+        if self.faiss_index is None or self.faiss_index.ntotal == 0:
+            return 0.0
+        return len(self.tombstones) / self.faiss_index.ntotal
+
+    def _index_needs_rebuild(self) -> bool:
+        """Verifica se há tombstones demais ou se a galeria deve trocar de tipo de índice ou de número de shards"""
+        if self.faiss_index is None:
+            return False
+        if self._tombstone_ratio() > FAISS_COMPACTION_TOMBSTONE_RATIO:
+            return True
+        if len(self._shards(self.faiss_index)) != max(FAISS_SHARDS, 1):
+            return True
+
+        active_total = self.faiss_index.ntotal - len(self.tombstones)
+        spec = self._select_index_spec(active_total)
+        return spec != (self.index_kind, self.index_compression)
+
+    def _maybe_schedule_compaction(self):
+        """Agenda compactação/troca de tipo do índice em background se necessário"""
+        if self._closing.is_set() or not self._index_needs_rebuild():
+            return
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+
+        self._compaction_thread = threading.Thread(
+            target=self.compact_index, name="faiss-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def compact_index(self):
+        """Reconstrói o índice apenas com os embeddings ativos
+
+        Também é onde a galeria troca de tipo (FlatIP, IVF ou HNSW) conforme o
+        tamanho. O índice novo é montado fora do lock; buscas e cadastros
+        continuam no índice atual e os cadastros feitos durante a compactação
+        são copiados para o índice novo antes da troca.
+        """
+        try:
+            with self._index_lock:
+                old_index = self.faiss_index
+                if not self._index_needs_rebuild():
+                    return
+                dropped = set(self.tombstones)
+                snapshot_total = old_index.ntotal
+                snapshot_next_id = self.next_faiss_id
+                ids = self._get_index_ids(old_index)
+            vectors = self.vector_store.get(ids)
+
+            if dropped:
+                print(
+                    f"🧹 Compactando índice FAISS: removendo {len(dropped)} de "
+                    f"{snapshot_total} embeddings..."
+                )
+            else:
+                print(f"🔄 Reconstruindo índice FAISS com {snapshot_total} embeddings...")
+            keep = ~np.isin(ids, np.fromiter(dropped, dtype=np.int64))
+            new_index = self._build_gallery_index(vectors[keep], ids[keep])
+
+            with self._index_lock:
+                # Índice foi limpo ou reconstruído enquanto compactávamos
+                if self.faiss_index is not old_index:
+                    return
+
+                # faiss_ids são sequenciais: cadastros novos têm IDs acima do snapshot
+                current_ids = self._get_index_ids(old_index)
+                late_ids = current_ids[current_ids >= snapshot_next_id]
+                if len(late_ids) > 0:
+                    new_index.add_with_ids(self.vector_store.get(late_ids), late_ids)
+
+                self.tombstones -= dropped
+                self._set_index(new_index)
+
             self.save_faiss_index()
 
+            print(
+                f"✅ Índice FAISS compactado: {new_index.ntotal} embeddings ativos "
+                f"(tipo {self.index_kind})"
+            )
+
+        except Exception as e:
+            print(f"❌ Erro ao compactar índice FAISS: {e}")
+            import traceback
+            traceback.print_exc()
+
     def rebuild_index_from_database(self):
-        """Reconstrói o índice FAISS a partir do banco de dados PostgreSQL"""
+        """Reconstrói o índice FAISS a partir do banco de dados PostgreSQL
+
+        Os usuários são lidos em lotes por cursor no servidor (só id, faiss_id e
+        o embedding criptografado), descriptografados em paralelo num pool de processos e
+        gravados direto numa matriz float32 pré-alocada. Buscas e cadastros
+        continuam no índice atual durante a leitura; o índice novo entra numa
+        troca atômica, com os cadastros e remoções feitos nesse intervalo.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            print("ℹ️  Reconstrução do índice já em andamento")
+            return
+
         try:
-            from app.database import SessionLocal
+            from sqlalchemy import func
             from app.models import User
-            from app.encryption import encryption_manager
-            
+
             print("🔄 Iniciando reconstrução do índice FAISS do banco de dados...")
-            
-            # Criar novo índice vazio
-            self._create_new_index()
-            
-            # Buscar todos os usuários ativos do banco, ordenados por faiss_id
-            db = SessionLocal()
+            start_time = time.perf_counter()
+
+            db = self._open_session()
             try:
-                users = db.query(User).filter(User.is_active == True).order_by(User.faiss_id).all()
-                print(f"📊 Encontrados {len(users)} usuários no banco de dados")
-                
-                if len(users) == 0:
-                    print("ℹ️  Nenhum usuário encontrado no banco, índice permanece vazio")
-                    return
-                
-                # Preparar embeddings e mapeamento
-                embeddings_list = []
-                # IMPORTANTE: Mapear posição no índice FAISS (sequencial 0,1,2...) para user_id
-                # Como adicionamos na ordem do faiss_id do banco, a posição = faiss_id do banco
-                position_to_user = []
-                
-                for user in users:
-                    try:
-                        # Descriptografar embedding
-                        embedding = encryption_manager.decrypt_embedding(user.embedding_hash)
-                        
-                        # Normalizar embedding
-                        embedding_normalized = embedding / np.linalg.norm(embedding)
-                        embeddings_list.append(embedding_normalized)
-                        
-                        # Guardar user_id na mesma posição do array
-                        position_to_user.append(user.id)
-                        
-                        print(f"✅ Embedding do usuário {user.name} (ID: {user.id}, faiss_id: {user.faiss_id}) preparado")
-                    except Exception as e:
-                        print(f"⚠️  Erro ao processar usuário {user.name} (ID: {user.id}): {e}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
-                
-                # Adicionar todos os embeddings de uma vez (mais eficiente)
-                if embeddings_list:
-                    embeddings_array = np.array(embeddings_list)
-                    self.faiss_index.add(embeddings_array)
-                    
-                    # Restaurar mapeamento id_to_user
-                    # A posição no índice FAISS (0, 1, 2...) corresponde à ordem de adição
-                    # Como adicionamos na ordem do faiss_id do banco, posição = faiss_id do banco
-                    for position, user_id in enumerate(position_to_user):
-                        self.id_to_user[position] = user_id
-                        print(f"🔗 Mapeamento: posição FAISS {position} -> user_id {user_id}")
-                    
-                    # Atualizar next_faiss_id para o próximo disponível
-                    if self.id_to_user:
-                        self.next_faiss_id = max(self.id_to_user.keys()) + 1
-                    else:
-                        self.next_faiss_id = len(embeddings_list)
-                    
-                    # Salvar índice reconstruído
-                    self.save_faiss_index()
-                    
-                    print(f"✅ Índice FAISS reconstruído com sucesso! {len(embeddings_list)} embeddings adicionados")
-                    print(f"📊 Total de embeddings no índice: {self.faiss_index.ntotal}")
-                    print(f"🔑 Próximo faiss_id disponível: {self.next_faiss_id}")
-                    print(f"👥 Usuários mapeados: {len(self.id_to_user)}")
-                    print(f"📋 Mapeamento completo: {self.id_to_user}")
+                total, max_db_id = (
+                    db.query(func.count(User.id), func.max(User.faiss_id))
+                    .filter(User.is_active == True)
+                    .one()
+                )
+                # Alterações posteriores à leitura ficam para a reconciliação
+                watermark = db.query(func.max(User.updated_at)).scalar()
+                print(f"📊 Encontrados {total} usuários no banco de dados")
+
+                with self.version.lock(), self._index_lock:
+                    # Cadastros feitos durante a leitura (em qualquer worker)
+                    # recebem IDs acima dos do banco e são copiados do índice
+                    # atual na troca
+                    floor = self.next_faiss_id
+                    if max_db_id is not None:
+                        floor = max(floor, max_db_id + 1)
+                    self.next_faiss_id = self.version.reserve_ids(0, floor)
+                    rebuild_next_id = self.next_faiss_id
+                    self._rebuild_removals = set()
+
+                if total == 0:
+                    print("ℹ️  Nenhum usuário encontrado no banco, índice fica vazio")
+                    embeddings_array = np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+                    ids_array = np.zeros(0, dtype=np.int64)
+                    user_ids = np.zeros(0, dtype=np.int64)
                 else:
-                    print("⚠️  Nenhum embedding válido encontrado para reconstruir o índice")
-                    
+                    embeddings_array, ids_array, user_ids = self._load_database_embeddings(
+                        db, total, rebuild_next_id
+                    )
+                    if len(ids_array) == 0:
+                        print("⚠️  Nenhum embedding válido encontrado, mantendo o índice atual")
+                        return
             finally:
                 db.close()
-                
+            load_time = time.perf_counter() - start_time
+
+            # Normalizar embeddings para similaridade de cosseno
+            norms = np.linalg.norm(embeddings_array, axis=1, keepdims=True)
+            embeddings_array /= np.maximum(norms, 1e-12)
+
+            build_start = time.perf_counter()
+            if len(ids_array) > 0:
+                new_index = self._build_gallery_index(embeddings_array, ids_array)
+            else:
+                new_index = new_sharded_index(FAISS_SHARDS)
+
+            # Restaurar mapeamento id_to_user
+            id_to_user = UserIdMap()
+            id_to_user.assign(ids_array, user_ids)
+
+            if not self._swap_rebuilt_index(
+                new_index, id_to_user, embeddings_array, ids_array, rebuild_next_id
+            ):
+                print("ℹ️  Índice limpo durante a reconstrução, resultado descartado")
+                return
+            build_time = time.perf_counter() - build_start
+
+            # Salvar índice reconstruído
+            save_start = time.perf_counter()
+            self.save_faiss_index()
+            save_time = time.perf_counter() - save_start
+            self._unmapped_seen = set()
+            self._write_reconcile_state(watermark)
+
+            print(f"✅ Índice FAISS reconstruído com sucesso! {len(ids_array)} embeddings adicionados")
+            print(f"📊 Total de embeddings no índice: {self.faiss_index.ntotal}")
+            print(f"🔑 Próximo faiss_id disponível: {self.next_faiss_id}")
+            print(f"👥 Usuários mapeados: {len(self.id_to_user)}")
+            print(
+                f"⏱️  Tempo: leitura/descriptografia {load_time:.1f}s, "
+                f"índice {build_time:.1f}s, gravação {save_time:.1f}s, "
+                f"total {time.perf_counter() - start_time:.1f}s"
+            )
+
         except ImportError as e:
             print(f"⚠️  Não foi possível importar módulos do banco: {e}")
             print("💡 Isso é normal se o banco ainda não estiver configurado")
@@ -518,15 +1629,489 @@ class FaceRecognitionSystem:
             print(f"❌ Erro ao reconstruir índice do banco: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            with self._index_lock:
+                self._rebuild_removals = None
+            self._rebuild_lock.release()
+
+    def _swap_rebuilt_index(
+        self,
+        new_index,
+        id_to_user: UserIdMap,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        rebuild_next_id: int,
+    ) -> bool:
+        """Troca atomicamente o índice ativo pelo reconstruído do banco
+
+        Cadastros feitos durante a reconstrução (faiss_id >= rebuild_next_id)
+        são copiados do índice atual e remoções do mesmo intervalo viram
+        tombstones. Retorna False se o índice foi limpo nesse meio tempo.
+        """
+        with self._index_lock:
+            removals = self._rebuild_removals
+            if removals is None:
+                return False
+
+            self.vector_store.put(ids, vectors)
+
+            tombstones = set()
+            if self.faiss_index is not None:
+                current_ids = self._get_index_ids(self.faiss_index)
+                late_ids = current_ids[current_ids >= rebuild_next_id]
+                if len(late_ids) > 0:
+                    new_index.add_with_ids(self.vector_store.get(late_ids), late_ids)
+                    id_to_user.assign(late_ids, self.id_to_user.lookup(late_ids))
+                    tombstones.update(
+                        faiss_id for faiss_id in late_ids.tolist() if faiss_id in self.tombstones
+                    )
+
+            for faiss_id in removals:
+                if faiss_id in id_to_user:
+                    del id_to_user[faiss_id]
+                    tombstones.add(faiss_id)
+
+            self.id_to_user = id_to_user
+            self.tombstones = tombstones
+            # Atualizar next_faiss_id para o próximo disponível
+            self.next_faiss_id = max(self.next_faiss_id, id_to_user.max_id() + 1)
+            self._set_index(new_index)
+            return True
+
+    def _reserve_faiss_ids(self, count: int) -> int:
+        """Reserva `count` faiss_ids consecutivos e retorna o primeiro"""
+        with self.version.lock(), self._index_lock:
+            first_id = self.version.reserve_ids(count, self.next_faiss_id)
+            self.next_faiss_id = first_id + count
+            return first_id
+
+    def _load_database_embeddings(self, db, total: int, max_faiss_id: int):
+        """Lê e descriptografa os embeddings dos usuários ativos em lotes
+
+        Só usuários com faiss_id < max_faiss_id: os posteriores foram cadastrados
+        durante a leitura e já estão no índice atual. Embeddings ainda no
+        formato antigo (texto em embedding_hash) são regravados no envelope
+        binário depois de lidos (migração sob demanda).
+
+        Returns:
+            (vectors, faiss_ids, user_ids) apenas das linhas válidas, ordenadas
+            por faiss_id
+        """
+        from sqlalchemy import select, update
+        from app.models import User
+
+        n_workers = FAISS_REBUILD_WORKERS or os.cpu_count() or 1
+        batch_size = FAISS_REBUILD_BATCH_SIZE
+
+        # Pré-alocar (a tabela pode crescer durante a leitura)
+        vectors = np.zeros((total, EMBEDDING_DIMENSION), dtype=np.float32)
+        faiss_ids = np.zeros(total, dtype=np.int64)
+        user_ids = np.zeros(total, dtype=np.int64)
+        valid = np.zeros(total, dtype=bool)
+        legacy = np.zeros(total, dtype=bool)
+
+        stmt = (
+            select(User.id, User.faiss_id, User.embedding, User.embedding_hash)
+            .where(User.is_active == True, User.faiss_id < max_faiss_id)
+            .order_by(User.faiss_id)
+            .execution_options(yield_per=batch_size)
+        )
+
+        # Poucos usuários: iniciar processos custa mais do que descriptografar
+        pool = None
+        if n_workers > 1 and total > batch_size and _spawn_pool_available():
+            pool = ProcessPoolExecutor(
+                max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            print(f"🔐 Descriptografando em {n_workers} processos, lotes de {batch_size}")
+
+        pending = deque()  # (linha inicial, tamanho, criptografados, future ou resultado)
+        loaded = 0
+        start_time = time.perf_counter()
+        last_report = start_time
+
+        def collect():
+            nonlocal last_report, pool
+            offset, size, encrypted, result = pending.popleft()
+            if isinstance(result, Future):
+                try:
+                    result = result.result()
+                except BrokenProcessPool:
+                    # Processo filho não conseguiu iniciar: seguir descriptografando aqui
+                    if pool:
+                        print("⚠️  Pool de processos falhou, descriptografando no processo atual")
+                        pool.shutdown(cancel_futures=True)
+                        pool = None
+                    result = decrypt_embedding_batch(encrypted)
+            batch_vectors, batch_valid = result
+            vectors[offset : offset + size] = batch_vectors
+            valid[offset : offset + size] = batch_valid
+
+            done = offset + size
+            now = time.perf_counter()
+            if now - last_report >= 2.0 or done >= total:
+                rate = done / max(now - start_time, 1e-9)
+                print(
+                    f"   ⏳ {done}/{max(total, done)} embeddings "
+                    f"({done / max(total, done):.0%}) - {rate:.0f}/s"
+                )
+                last_report = now
+
+        try:
+            for rows in db.execute(stmt).partitions():
+                size = len(rows)
+                if loaded + size > len(vectors):
+                    # Usuários cadastrados depois da contagem
+                    grow = loaded + size - len(vectors)
+                    vectors = np.vstack(
+                        [vectors, np.zeros((grow, EMBEDDING_DIMENSION), dtype=np.float32)]
+                    )
+                    faiss_ids = np.concatenate([faiss_ids, np.zeros(grow, dtype=np.int64)])
+                    user_ids = np.concatenate([user_ids, np.zeros(grow, dtype=np.int64)])
+                    valid = np.concatenate([valid, np.zeros(grow, dtype=bool)])
+                    legacy = np.concatenate([legacy, np.zeros(grow, dtype=bool)])
+
+                user_ids[loaded : loaded + size] = [row.id for row in rows]
+                faiss_ids[loaded : loaded + size] = [row.faiss_id for row in rows]
+                legacy[loaded : loaded + size] = [row.embedding is None for row in rows]
+                encrypted = [
+                    row.embedding if row.embedding is not None else row.embedding_hash
+                    for row in rows
+                ]
+                if pool:
+                    pending.append(
+                        (loaded, size, encrypted, pool.submit(decrypt_embedding_batch, encrypted))
+                    )
+                    # Limitar lotes em memória aguardando descriptografia
+                    while len(pending) > 2 * n_workers:
+                        collect()
+                else:
+                    pending.append((loaded, size, encrypted, decrypt_embedding_batch(encrypted)))
+                    collect()
+                loaded += size
+
+            while pending:
+                collect()
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        vectors, faiss_ids, user_ids, valid, legacy = (
+            vectors[:loaded],
+            faiss_ids[:loaded],
+            user_ids[:loaded],
+            valid[:loaded],
+            legacy[:loaded],
+        )
+        failed = int(np.count_nonzero(~valid))
+        if failed:
+            print(f"⚠️  {failed} embeddings não puderam ser descriptografados e foram ignorados")
+        vectors, faiss_ids, user_ids = vectors[valid], faiss_ids[valid], user_ids[valid]
+        legacy = legacy[valid]
+
+        # faiss_id duplicado (índices antigos reaproveitavam posições):
+        # atribuir um novo ID e gravar no banco. As linhas vêm ordenadas
+        # por faiss_id, então duplicados são vizinhos.
+        duplicated = np.flatnonzero(faiss_ids[1:] == faiss_ids[:-1]) + 1
+        if len(duplicated) > 0:
+            next_free_id = self._reserve_faiss_ids(len(duplicated))
+            faiss_ids[duplicated] = np.arange(
+                next_free_id, next_free_id + len(duplicated), dtype=np.int64
+            )
+            for row in duplicated:
+                db.execute(
+                    update(User)
+                    .where(User.id == int(user_ids[row]))
+                    .values(faiss_id=int(faiss_ids[row]), updated_at=datetime.utcnow())
+                )
+            db.commit()
+            print(f"🔧 {len(duplicated)} faiss_ids duplicados reatribuídos no banco")
+
+        if np.any(legacy):
+            self._migrate_legacy_embeddings(db, user_ids[legacy], vectors[legacy])
+
+        return vectors, faiss_ids, user_ids
+
+    def _migrate_legacy_embeddings(self, db, user_ids: np.ndarray, vectors: np.ndarray):
+        """Regrava embeddings do formato antigo (texto) no envelope binário
+
+        Falhas não interrompem a reconstrução: as linhas continuam legíveis no
+        formato antigo e são migradas na próxima leitura.
+        """
+        from sqlalchemy import update
+        from app.models import User
+
+        try:
+            for start in range(0, len(user_ids), FAISS_REBUILD_BATCH_SIZE):
+                db.execute(
+                    update(User),
+                    [
+                        {
+                            "id": int(user_id),
+                            "embedding": encryption_manager.encrypt_embedding_binary(vector),
+                            "embedding_hash": "",
+                        }
+                        for user_id, vector in zip(
+                            user_ids[start : start + FAISS_REBUILD_BATCH_SIZE],
+                            vectors[start : start + FAISS_REBUILD_BATCH_SIZE],
+                        )
+                    ],
+                )
+                db.commit()
+            print(f"🔄 {len(user_ids)} embeddings migrados para o formato binário")
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️  Erro ao migrar embeddings para o formato binário: {e}")
+
+    def reconcile_with_database(self, full: bool = False) -> dict:
+        """Reconcilia o índice com o banco aplicando só as diferenças
+
+        Compara o mapeamento faiss_id -> user_id da galeria com os usuários
+        alterados desde a última reconciliação (updated_at acima da marca
+        d'água, compartilhada pelos workers) e corrige só o que diverge:
+        embedding ausente do índice é adicionado com o faiss_id do banco,
+        mapeamento faltante é refeito e usuário desativado é removido.
+        Embeddings sem usuário por duas reconciliações seguidas (cadastro cujo
+        commit no banco falhou) são descartados. Com full=True compara todos
+        os usuários.
+
+        Returns:
+            Resumo: usuários conferidos, alterações aplicadas e tempo
+        """
+        summary = {
+            "checked": 0,
+            "added": 0,
+            "mapped": 0,
+            "removed": 0,
+            "orphans": 0,
+            "conflicts": 0,
+        }
+        if self.faiss_index is None or self._rebuild_lock.locked():
+            summary["skipped"] = True
+            return summary
+        if not self._reconcile_lock.acquire(blocking=False):
+            summary["skipped"] = True
+            return summary
+
+        try:
+            from sqlalchemy import or_, select
+            from app.models import User
+
+            start_time = time.perf_counter()
+            # Um worker por vez; os outros encontram a marca d'água adiantada
+            with self.version.file_lock("reconcile"):
+                self.sync_gallery()
+                watermark = None if full else self._read_reconcile_state()
+
+                stmt = (
+                    select(User.id, User.faiss_id, User.is_active, User.updated_at)
+                    .order_by(User.id)
+                    .execution_options(yield_per=FAISS_REBUILD_BATCH_SIZE)
+                )
+                if watermark is not None:
+                    since = watermark - timedelta(seconds=FAISS_RECONCILE_OVERLAP)
+                    stmt = stmt.where(or_(User.updated_at > since, User.updated_at.is_(None)))
+
+                db = self._open_session()
+                try:
+                    with self._index_lock:
+                        index_ids = self._get_index_ids(self.faiss_index)
+                    new_watermark = watermark
+                    for rows in db.execute(stmt).partitions():
+                        self._reconcile_rows(db, rows, index_ids, summary)
+                        updated = [row.updated_at for row in rows if row.updated_at is not None]
+                        if updated:
+                            new_watermark = max([new_watermark or updated[0]] + updated)
+
+                    self._reconcile_orphans(db, summary)
+                finally:
+                    db.close()
+
+                if new_watermark is not None:
+                    self._write_reconcile_state(new_watermark)
+
+            summary["watermark"] = new_watermark.isoformat() if new_watermark else None
+            summary["elapsed_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+            self.last_reconcile = summary
+
+            changes = sum(summary[key] for key in ("added", "mapped", "removed", "orphans"))
+            if changes or summary["conflicts"]:
+                print(
+                    f"🔧 Reconciliação banco ↔ índice: {summary['checked']} usuários conferidos, "
+                    f"{summary['added']} adicionados, {summary['mapped']} remapeados, "
+                    f"{summary['removed']} removidos, {summary['orphans']} órfãos descartados, "
+                    f"{summary['conflicts']} conflitos ({summary['elapsed_ms']:.0f}ms)"
+                )
+            return summary
+
+        finally:
+            self._reconcile_lock.release()
+
+    def _reconcile_rows(self, db, rows, index_ids: np.ndarray, summary: dict):
+        """Corrige a galeria para um lote de usuários do banco"""
+        from sqlalchemy import select
+        from app.models import User
+
+        if not rows:
+            return
+        user_ids = np.array([row.id for row in rows], dtype=np.int64)
+        faiss_ids = np.array([row.faiss_id for row in rows], dtype=np.int64)
+        active = np.array([bool(row.is_active) for row in rows])
+        with self._index_lock:
+            mapped = self.id_to_user.lookup(faiss_ids)
+        present = np.isin(faiss_ids, index_ids)
+        summary["checked"] += len(rows)
+
+        # Desativados no banco que continuam na galeria
+        inactive = faiss_ids[~active & (mapped == user_ids)]
+        if len(inactive):
+            summary["removed"] += self.remove_user_embeddings(inactive)
+
+        diverged = active & (mapped != user_ids)
+        # faiss_id associado a outro usuário (IDs duplicados de índices antigos)
+        conflicts = diverged & (mapped >= 0)
+        if conflicts.any():
+            summary["conflicts"] += int(conflicts.sum())
+            print(
+                f"⚠️  faiss_ids associados a outros usuários: "
+                f"{faiss_ids[conflicts][:10].tolist()} (reconstrua o índice do banco)"
+            )
+
+        remap = diverged & ~conflicts & present
+        for faiss_id, user_id in zip(faiss_ids[remap].tolist(), user_ids[remap].tolist()):
+            self.set_user_mapping(faiss_id, user_id)
+            summary["mapped"] += 1
+
+        missing = diverged & ~conflicts & ~present
+        if not missing.any():
+            return
+        # Só os embeddings que faltam no índice são lidos e descriptografados
+        embeddings = db.execute(
+            select(User.id, User.embedding, User.embedding_hash).where(
+                User.id.in_(user_ids[missing].tolist())
+            )
+        ).all()
+        vectors, valid = decrypt_embedding_batch(
+            [
+                row.embedding if row.embedding is not None else row.embedding_hash
+                for row in embeddings
+            ]
+        )
+        faiss_by_user = dict(zip(user_ids[missing].tolist(), faiss_ids[missing].tolist()))
+        for row, vector, ok in zip(embeddings, vectors, valid):
+            if ok:
+                self._add_embedding_with_id(faiss_by_user[row.id], row.id, vector)
+                summary["added"] += 1
+
+    def _reconcile_orphans(self, db, summary: dict):
+        """Trata embeddings sem usuário que já existiam na reconciliação anterior
+
+        Se o banco tem um usuário ativo com o faiss_id, falhou só o mapeamento;
+        caso contrário o commit do cadastro falhou e o embedding é descartado.
+        """
+        from sqlalchemy import select
+        from app.models import User
+
+        with self._index_lock:
+            index_ids = self._get_index_ids(self.faiss_index)
+            unmapped = set(index_ids[self.id_to_user.lookup(index_ids) < 0].tolist())
+            unmapped -= self.tombstones
+        candidates = unmapped & self._unmapped_seen
+        self._unmapped_seen = unmapped - candidates
+        if not candidates:
+            return
+
+        owners = dict(
+            db.execute(
+                select(User.faiss_id, User.id).where(
+                    User.faiss_id.in_(sorted(candidates)), User.is_active == True
+                )
+            ).all()
+        )
+        for faiss_id, user_id in owners.items():
+            self.set_user_mapping(faiss_id, user_id)
+            summary["mapped"] += 1
+
+        orphans = sorted(candidates - set(owners))
+        if orphans:
+            self._discard_orphan_embeddings(orphans)
+            summary["orphans"] += len(orphans)
+
+    def _add_embedding_with_id(self, faiss_id: int, user_id: int, embedding: np.ndarray):
+        """Adiciona ao índice um embedding do banco com o faiss_id já gravado nele"""
+        vector = (embedding / np.linalg.norm(embedding)).reshape(1, -1).astype(np.float32)
+        ids = np.array([faiss_id], dtype=np.int64)
+        with self.version.lock():
+            self._catch_up()
+            with self._index_lock:
+                # Novos cadastros continuam acima do faiss_id restaurado
+                self.version.reserve_ids(0, faiss_id + 1)
+                self.next_faiss_id = max(self.next_faiss_id, faiss_id + 1)
+                self.vector_store.put(ids, vector)
+                self.faiss_index.add_with_ids(vector, ids)
+                self.id_to_user[faiss_id] = user_id
+                self.tombstones.discard(faiss_id)
+                self._journal_append(RECORD_ADD, faiss_id, user_id, vector)
+        self._maybe_schedule_checkpoint()
+
+    def _discard_orphan_embeddings(self, faiss_ids: list):
+        """Exclui da busca embeddings sem usuário (viram tombstones)"""
+        with self.version.lock():
+            self._catch_up()
+            with self._index_lock:
+                for faiss_id in faiss_ids:
+                    # Mapeado ou removido nesse meio tempo
+                    if faiss_id in self.id_to_user or faiss_id in self.tombstones:
+                        continue
+                    self.tombstones.add(faiss_id)
+                    self._journal_append(RECORD_REMOVE, faiss_id, None)
+                self._refresh_search_params()
+        self._maybe_schedule_checkpoint()
+        self._maybe_schedule_compaction()
+
+    def _read_reconcile_state(self) -> Optional[datetime]:
+        """Marca d'água da última reconciliação (None se nunca houve)"""
+        state = read_manifest(self.index_dir, "reconcile.json")
+        if not state.get("watermark"):
+            return None
+        return datetime.fromisoformat(state["watermark"])
+
+    def _write_reconcile_state(self, watermark: Optional[datetime]):
+        """Grava a marca d'água: usuários alterados até ela já estão no índice"""
+        if watermark is None:
+            return
+        data = json.dumps({"watermark": watermark.isoformat()}).encode("utf-8")
+        publish_snapshot(np.frombuffer(data, dtype=np.uint8), self.index_dir / "reconcile.json")
+
+    def _reconcile_loop(self):
+        """Reconciliação periódica em background"""
+        while not self._closing.wait(FAISS_RECONCILE_INTERVAL):
+            try:
+                self.reconcile_with_database()
+            except Exception as e:
+                print(f"⚠️  Erro na reconciliação do índice com o banco: {e}")
 
     def clear_index(self):
         """Limpa completamente o índice FAISS"""
         try:
-            # Criar novo índice vazio
-            self._create_new_index()
+            with self.version.lock():
+                # Alterações de outros workers anteriores à limpeza
+                self._catch_up()
+                with self._index_lock:
+                    # Descartar reconstrução em andamento (leu usuários agora apagados)
+                    self._rebuild_removals = None
+                    # Criar novo índice vazio
+                    self._create_new_index()
+                    self.vector_store.clear()
+            # Nenhuma identidade rastreada continua na galeria
+            self.face_tracker.clear()
 
             # Salvar índice limpo
             self.save_faiss_index()
+            # O snapshot anterior à limpeza não serve mais de alternativa
+            (self.index_dir / PREVIOUS_MANIFEST).unlink(missing_ok=True)
+            (self.index_dir / "reconcile.json").unlink(missing_ok=True)
+            self._unmapped_seen = set()
 
             print("Índice FAISS limpo com sucesso!")
 
@@ -537,17 +2122,29 @@ class FaceRecognitionSystem:
     def get_stats(self) -> dict:
         """Retorna estatísticas do sistema"""
         try:
-            # Garantir que o índice existe
-            if self.faiss_index is None:
+            # Garantir que o índice existe (depois da inicialização em background)
+            if self.faiss_index is None and self._ready.is_set():
                 self.load_faiss_index()
             
             # Verificar se o modelo está carregado
-            model_loaded = self.face_app is not None and self.faiss_index is not None
+            model_loaded = self.pipeline.models_loaded and self.faiss_index is not None
             
             return {
                 "total_embeddings": self.faiss_index.ntotal if self.faiss_index else 0,
                 "registered_users": len(self.id_to_user),
+                "removed_embeddings": len(self.tombstones),
+                "index_type": self.index_kind,
+                "index_compression": self.index_compression,
+                "index_shards": len(self._shards(self.faiss_index)) if self.faiss_index else 0,
+                "journal_records": self.journal.records,
+                "generation": self.generation,
+                "last_reconcile": self.last_reconcile,
+                "inference": self.inference_scheduler.stats(),
+                "tracking": self.face_tracker.stats(),
+                "phase": self.phase,
                 "device": DEVICE,
+                "model_pack": INSIGHTFACE_MODEL_PACK,
+                "models": self.pipeline.model_names,
                 "threshold": FACE_RECOGNITION_THRESHOLD,
                 "model_loaded": model_loaded,
             }
@@ -576,6 +2173,7 @@ except Exception as e:
     class DummyFaceRecognitionSystem:
         def __init__(self):
             self.face_app = None
+            self.face_tracker = FaceTracker()
             self.faiss_index = None
             self.id_to_user = {}
             self.next_faiss_id = 0
@@ -593,13 +2191,46 @@ except Exception as e:
         def extract_embedding(self, image):
             return None
         
-        def detect_faces(self, image):
+        def detect_faces(self, image, high_precision=False, max_faces=None, session_id=None, track=False):
             return []
+
+        def submit_detection(self, image, high_precision=False, max_faces=None, session_id=None, track=False):
+            future = Future()
+            future.set_result([])
+            return future
         
         def recognize_face(self, embedding, k=5, adaptive_threshold=True):
             return None, 1.0
+
+        def recognize_faces(self, embeddings, k=5, adaptive_threshold=True):
+            n_queries = len(embeddings)
+            return np.full(n_queries, -1, dtype=np.int64), np.ones(n_queries, dtype=np.float32)
         
         def add_user_embedding(self, embedding, user_id):
             raise RuntimeError("Sistema de reconhecimento não inicializado")
+
+        def reconcile_with_database(self, full=False):
+            raise RuntimeError("Sistema de reconhecimento não inicializado")
+
+        def is_user_in_gallery(self, user_id):
+            return False
+
+        def verify_track(self, session_id, bbox, user_id, distance):
+            return self.face_tracker.verify(session_id, bbox, None, distance)
+
+        def readiness(self):
+            return {
+                "phase": "failed",
+                "ready": False,
+                "models_loaded": False,
+                "total_embeddings": 0,
+                "error": "Sistema não inicializado",
+            }
+
+        def wait_until_ready(self, timeout=None):
+            return True
+
+        def close(self):
+            pass
     
     face_recognition = DummyFaceRecognitionSystem()
@@ -0,0 +1,242 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import (
+    FACE_TRACK_CENTROID_SHIFT,
+    FACE_TRACK_IOU,
+    FACE_TRACK_MAX_GAP,
+    FACE_TRACK_REVERIFY_FRAMES,
+    FACE_TRACK_SIMILARITY_DROP,
+    FACE_TRACK_TTL,
+)
+
+MAX_SESSIONS = 1000  # Sessões acompanhadas; acima disso as expiradas são descartadas
+
+
+def same_face(bbox: np.ndarray, previous: np.ndarray) -> bool:
+    """A caixa do frame atual continua a do frame anterior (IoU ou deslocamento do centro)"""
+    x1 = max(bbox[0], previous[0])
+    y1 = max(bbox[1], previous[1])
+    x2 = min(bbox[2], previous[2])
+    y2 = min(bbox[3], previous[3])
+    intersection = max(0.0, float(x2 - x1)) * max(0.0, float(y2 - y1))
+    area = float((bbox[2] - bbox[0]) * (bbox[3] - bbox[1]))
+    previous_area = float((previous[2] - previous[0]) * (previous[3] - previous[1]))
+    union = area + previous_area - intersection
+    if union > 0 and intersection / union >= FACE_TRACK_IOU:
+        return True
+
+    # Frames espaçados: a face pode andar mais que o IoU permite, mas o
+    # tamanho precisa ser parecido (outra pessoa no mesmo lugar costuma não ser)
+    width = float(previous[2] - previous[0])
+    shift = np.hypot(
+        (bbox[0] + bbox[2] - previous[0] - previous[2]) / 2.0,
+        (bbox[1] + bbox[3] - previous[1] - previous[3]) / 2.0,
+    )
+    size_ratio = area / previous_area if previous_area > 0 else 0.0
+    return width > 0 and shift <= FACE_TRACK_CENTROID_SHIFT * width and 0.7 <= size_ratio <= 1.4
+
+
+class FaceTracker:
+    """Trilha da face de cada sessão (câmera) entre frames de validação
+
+    A trilha guarda a caixa da face, a identidade confirmada pelo último
+    reconhecimento completo e os vetores desse usuário na galeria. O frame
+    seguinte só reaproveita a identidade (sem busca no FAISS) se chegar em
+    até max_gap segundos, a face for a mesma (same_face) e o embedding dela
+    continuar próximo dos vetores do usuário: distância até o threshold e
+    similaridade no máximo similarity_drop abaixo da confirmada. A caixa
+    sozinha não basta, outra pessoa no mesmo lugar herdaria o acesso.
+
+    A cada reverify_frames frames o reconhecimento completo roda de novo e
+    confirma, troca ou descarta a identidade. Trilhas sem face por ttl
+    segundos expiram.
+    """
+
+    def __init__(
+        self,
+        reverify_frames: int = FACE_TRACK_REVERIFY_FRAMES,
+        similarity_drop: float = FACE_TRACK_SIMILARITY_DROP,
+        ttl: float = FACE_TRACK_TTL,
+        max_gap: float = FACE_TRACK_MAX_GAP,
+    ):
+        self.reverify_frames = max(0, reverify_frames)
+        self.similarity_drop = similarity_drop
+        self.ttl = ttl
+        self.max_gap = max_gap
+        self._tracks = {}  # session_id -> trilha (dict)
+        self._lock = threading.Lock()
+        self._track_ids = itertools.count(1)
+        self._tracked_frames = 0  # Frames com identidade reaproveitada
+        self._verified_frames = 0  # Frames com reconhecimento completo
+
+    def _active(self, session_id: str, now: float) -> Optional[dict]:
+        track = self._tracks.get(session_id)
+        if track is None or now - track["last_seen"] > self.ttl:
+            return None
+        return track
+
+    def check(
+        self, session_id: Optional[str], bbox: np.ndarray, embedding: Optional[np.ndarray], threshold: float
+    ) -> Optional[dict]:
+        """Confere se a face do frame continua a trilha confirmada da sessão
+
+        Compara o embedding com os vetores do usuário da trilha (produto
+        interno com poucos vetores, sem busca na galeria).
+
+        Returns:
+            Cópia da trilha com a distância medida neste frame, ou None quando
+            o frame precisa do reconhecimento completo
+        """
+        if session_id is None or embedding is None or self.reverify_frames == 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            track = self._active(session_id, now)
+            if (
+                track is None
+                or track["user_id"] is None
+                or track["reference"] is None
+                or track["frames"] >= self.reverify_frames
+                or now - track["last_seen"] > self.max_gap
+                or not same_face(bbox, track["bbox"])
+            ):
+                return None
+
+            norm = np.linalg.norm(embedding)
+            if norm == 0:
+                return None
+            similarity = float(np.max(track["reference"] @ (np.asarray(embedding, dtype=np.float32) / norm)))
+            distance = 1.0 - similarity
+            if distance > threshold or similarity < track["confirmed_similarity"] - self.similarity_drop:
+                return None
+
+            track["bbox"] = np.asarray(bbox, dtype=np.float32)
+            track["frames"] += 1
+            track["last_seen"] = now
+            track["distance"] = distance
+            self._tracked_frames += 1
+            return dict(track)
+
+    def verify(
+        self,
+        session_id: str,
+        bbox: np.ndarray,
+        user_id: Optional[int],
+        distance: float,
+        reference: Optional[np.ndarray] = None,
+    ) -> dict:
+        """Resultado de um reconhecimento completo: confirma, troca ou descarta a identidade
+
+        Args:
+            reference: Vetores normalizados do usuário na galeria, usados por
+                check nos frames seguintes (sem eles a identidade não é reaproveitada)
+
+        Returns:
+            Cópia da trilha
+        """
+        now = time.monotonic()
+        bbox = np.asarray(bbox, dtype=np.float32)
+        with self._lock:
+            self._verified_frames += 1
+            track = self._active(session_id, now)
+            if track is None or not same_face(bbox, track["bbox"]):
+                track = {
+                    "track_id": next(self._track_ids),
+                    "user_id": None,
+                    "reference": None,
+                    "distance": 1.0,
+                    "confirmed_similarity": 0.0,
+                }
+                self._tracks[session_id] = track
+                self._discard_expired(now)
+
+            track["bbox"] = bbox
+            track["frames"] = 0
+            track["last_seen"] = now
+            similarity = 1.0 - distance
+            if user_id is None:
+                track["user_id"] = None
+                track["reference"] = None
+            elif user_id == track["user_id"] and similarity < track["confirmed_similarity"] - self.similarity_drop:
+                # Mesma pessoa com similaridade bem menor: os próximos frames reconhecem de novo
+                track["user_id"] = None
+                track["reference"] = None
+            else:
+                if user_id != track["user_id"]:
+                    track["confirmed_similarity"] = similarity
+                track["user_id"] = user_id
+                track["reference"] = reference
+                track["distance"] = distance
+
+            return dict(track)
+
+    def drop(self, session_id: Optional[str]):
+        """Frame sem face: a pessoa saiu e a próxima face começa outra trilha"""
+        if session_id is None:
+            return
+        with self._lock:
+            self._tracks.pop(session_id, None)
+
+    def user_ids(self) -> list:
+        """Identidades confirmadas nas trilhas"""
+        with self._lock:
+            return [track["user_id"] for track in self._tracks.values() if track["user_id"] is not None]
+
+    def forget_users(self, user_ids):
+        """Usuários removidos da galeria: suas trilhas são descartadas
+
+        Sem isso a identidade confirmada continuaria sendo reaproveitada (e o
+        acesso liberado) até a próxima reverificação.
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        with self._lock:
+            self._tracks = {
+                session_id: track
+                for session_id, track in self._tracks.items()
+                if track["user_id"] not in user_ids
+            }
+
+    def forget_user(self, user_id: int):
+        """Usuário removido da galeria: suas trilhas são descartadas"""
+        self.forget_users([user_id])
+
+    def clear(self):
+        """Descarta todas as trilhas (galeria limpa)"""
+        with self._lock:
+            self._tracks = {}
+
+    def _discard_expired(self, now: float):
+        if len(self._tracks) > MAX_SESSIONS:
+            self._tracks = {
+                session_id: track
+                for session_id, track in self._tracks.items()
+                if now - track["last_seen"] <= self.ttl
+            }
+
+    def stats(self) -> dict:
+        """Trilhas ativas e fração dos frames que reaproveitaram a identidade"""
+        with self._lock:
+            now = time.monotonic()
+            total = self._tracked_frames + self._verified_frames
+            return {
+                "active_tracks": sum(1 for track in self._tracks.values() if now - track["last_seen"] <= self.ttl),
+                "tracked_frames": self._tracked_frames,
+                "verified_frames": self._verified_frames,
+                "reuse_ratio": self._tracked_frames / total if total else 0.0,
+                "reverify_frames": self.reverify_frames,
+                "max_gap": self.max_gap,
+            }
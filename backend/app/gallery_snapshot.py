@@ -0,0 +1,150 @@
+import hashlib
+import numpy as np
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Callable, Tuple
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import EMBEDDING_DIMENSION
+
+# Cabeçalho: magic, versão, geração, próximo faiss_id, linhas, dimensão, linhas por bloco
+HEADER = struct.Struct("<4sBqqqHI")
+MAGIC = b"FGSN"
+VERSION = 1
+# Bloco: linhas, nonce; seguidos dos dados criptografados e da tag
+CHUNK_HEADER = struct.Struct("<I12s")
+CHUNK_INDEX = struct.Struct("<Q")
+TAG_SIZE = 16
+CHECKSUM_SIZE = 32  # SHA-256 de todo o arquivo antes dele
+CHUNK_ROWS = 4096
+
+
+def write_encrypted_snapshot(
+    path: Path,
+    key: bytes,
+    faiss_ids: np.ndarray,
+    user_ids: np.ndarray,
+    read_vectors: Callable[[np.ndarray], np.ndarray],
+    generation: int,
+    next_faiss_id: int,
+    chunk_rows: int = CHUNK_ROWS,
+):
+    """Grava o snapshot criptografado da galeria (vetores + mapeamento)
+
+    Os dados são escritos em blocos de chunk_rows linhas (faiss_ids, user_ids
+    e vetores float32), cada um criptografado com AES-256-GCM; o cabeçalho e a
+    posição do bloco entram como dados autenticados. Um SHA-256 do arquivo
+    fecha o snapshot. read_vectors(ids) é chamado bloco a bloco, sem montar a
+    matriz inteira em memória. O arquivo é publicado atomicamente.
+    """
+    path = Path(path)
+    faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    tmp_path = path.with_name(path.name + ".tmp")
+    checksum = hashlib.sha256()
+    header = HEADER.pack(
+        MAGIC, VERSION, generation, next_faiss_id, len(faiss_ids), EMBEDDING_DIMENSION, chunk_rows
+    )
+
+    with open(tmp_path, "wb") as f:
+
+        def write(data: bytes):
+            checksum.update(data)
+            f.write(data)
+
+        write(header)
+        for index, start in enumerate(range(0, len(faiss_ids), chunk_rows)):
+            ids = faiss_ids[start : start + chunk_rows]
+            vectors = np.ascontiguousarray(read_vectors(ids), dtype=np.float32)
+
+            cipher = AES.new(key, AES.MODE_GCM, nonce=get_random_bytes(12))
+            cipher.update(header + CHUNK_INDEX.pack(index))
+            ciphertext, tag = cipher.encrypt_and_digest(
+                ids.tobytes() + user_ids[start : start + chunk_rows].tobytes() + vectors.tobytes()
+            )
+            write(CHUNK_HEADER.pack(len(ids), cipher.nonce))
+            write(ciphertext)
+            write(tag)
+
+        f.write(checksum.digest())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def read_encrypted_snapshot(path: Path, key: bytes) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray]:
+    """Lê o snapshot criptografado, descriptografando bloco a bloco
+
+    Os blocos são gravados direto em matrizes pré-alocadas; a leitura fica
+    limitada pelo disco. Lança ValueError se o arquivo estiver corrompido,
+    truncado ou tiver sido gravado com outra chave.
+
+    Returns:
+        (info, faiss_ids, user_ids, vectors), com info contendo generation e
+        next_faiss_id
+    """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+
+        def read(size: int) -> bytes:
+            data = f.read(size)
+            if len(data) < size:
+                raise ValueError("snapshot truncado")
+            checksum.update(data)
+            return data
+
+        header = read(HEADER.size)
+        magic, version, generation, next_faiss_id, rows, dimension, chunk_rows = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or dimension != EMBEDDING_DIMENSION:
+            raise ValueError("formato de snapshot desconhecido")
+
+        faiss_ids = np.empty(rows, dtype=np.int64)
+        user_ids = np.empty(rows, dtype=np.int64)
+        vectors = np.empty((rows, dimension), dtype=np.float32)
+        row_bytes = 16 + dimension * 4
+
+        loaded = 0
+        index = 0
+        while loaded < rows:
+            size, nonce = CHUNK_HEADER.unpack(read(CHUNK_HEADER.size))
+            if size == 0 or size > min(chunk_rows, rows - loaded):
+                raise ValueError("bloco do snapshot inválido")
+            ciphertext = read(size * row_bytes)
+            tag = read(TAG_SIZE)
+
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+            cipher.update(header + CHUNK_INDEX.pack(index))
+            try:
+                data = cipher.decrypt_and_verify(ciphertext, tag)
+            except ValueError:
+                raise ValueError("falha na autenticação do snapshot (chave ou dados inválidos)")
+
+            end = loaded + size
+            faiss_ids[loaded:end] = np.frombuffer(data, dtype=np.int64, count=size)
+            user_ids[loaded:end] = np.frombuffer(data, dtype=np.int64, count=size, offset=size * 8)
+            vectors[loaded:end] = np.frombuffer(
+                data, dtype=np.float32, offset=size * 16
+            ).reshape(size, dimension)
+            loaded = end
+            index += 1
+
+        if f.read(CHECKSUM_SIZE) != checksum.digest() or f.read(1):
+            raise ValueError("checksum do snapshot inválido")
+
+    info = {"generation": generation, "next_faiss_id": next_faiss_id}
+    return info, faiss_ids, user_ids, vectors
@@ -0,0 +1,106 @@
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sem lock entre processos (usar um único worker)
+    fcntl = None
+
+# gallery.version: geração atual e próximo faiss_id livre, compartilhados
+VERSION = struct.Struct("<qq")
+
+
+class GalleryVersion:
+    """Versão da galeria compartilhada entre os workers do servidor
+
+    Todos os workers usam o mesmo diretório do índice. Cada alteração gravada
+    no journal recebe a próxima geração (número crescente), publicada em
+    gallery.version, um arquivo pequeno mapeado em memória: conferir se outro
+    worker alterou a galeria custa uma leitura de memória por requisição. O
+    mesmo arquivo guarda o próximo faiss_id livre, para que workers diferentes
+    nunca usem o mesmo ID.
+
+    Gravações no journal e reserva de faiss_ids são serializadas entre os
+    processos por flock em gallery.lock (lock()); file_lock() dá locks
+    nomeados para operações mais longas, como o checkpoint.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.version_path = self.directory / "gallery.version"
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._lock_fd = None
+        self._map = None
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            fd = os.open(self.version_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < VERSION.size:
+                    os.ftruncate(fd, VERSION.size)
+                self._map = mmap.mmap(fd, VERSION.size)
+            finally:
+                os.close(fd)
+        return self._map
+
+    def current(self) -> int:
+        """Geração mais recente gravada por qualquer worker"""
+        return VERSION.unpack_from(self._mapped(), 0)[0]
+
+    def publish(self, generation: int):
+        """Publica a geração de um registro gravado no journal (chamar com lock())"""
+        _, next_id = VERSION.unpack_from(self._mapped(), 0)
+        VERSION.pack_into(self._mapped(), 0, generation, next_id)
+
+    def reserve_ids(self, count: int, floor: int = 0) -> int:
+        """Reserva `count` faiss_ids consecutivos, a partir de `floor` no mínimo
+
+        Retorna o primeiro ID reservado (chamar com lock()). Com count == 0 só
+        garante que os próximos IDs reservados sejam >= floor.
+        """
+        generation, next_id = VERSION.unpack_from(self._mapped(), 0)
+        first_id = max(next_id, floor)
+        VERSION.pack_into(self._mapped(), 0, generation, first_id + count)
+        return first_id
+
+    @contextmanager
+    def lock(self):
+        """Lock exclusivo entre threads e processos (reentrante na mesma thread)"""
+        with self._lock:
+            if self._depth == 0 and fcntl is not None:
+                self._lock_fd = os.open(
+                    self.directory / "gallery.lock", os.O_RDWR | os.O_CREAT, 0o644
+                )
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._lock_fd is not None:
+                    os.close(self._lock_fd)  # Fechar o descritor libera o flock
+                    self._lock_fd = None
+
+    @contextmanager
+    def file_lock(self, name: str, shared: bool = False):
+        """Lock nomeado entre processos (não reentrante)
+
+        Cada chamada abre seu próprio descritor: threads do mesmo processo
+        também se excluem (ou compartilham, com shared=True).
+        """
+        if fcntl is None:
+            yield
+            return
+
+        fd = os.open(self.directory / f"{name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
@@ -0,0 +1,132 @@
+import numpy as np
+import os
+import pickle
+from pathlib import Path
+from typing import Optional
+
+# Valor das posições sem usuário (removidas ou ainda não associadas)
+NO_USER = -1
+# Capacidade mínima (em faiss_ids) ao crescer o array
+MIN_CAPACITY = 1024
+
+
+class UserIdMap:
+    """Mapeamento faiss_id -> user_id em array int64 contíguo
+
+    A posição i guarda o user_id do faiss_id i, ou NO_USER. Como os faiss_ids
+    são sequenciais, o array é denso; é salvo como .npy e carregado com mmap
+    copy-on-write, sem desserializar objetos. Mantém a interface de dict usada
+    antes (in, get, [], del, len, keys) e oferece consulta vetorizada.
+    """
+
+    def __init__(self, users: Optional[np.ndarray] = None):
+        self._users = users if users is not None else np.empty(0, dtype=np.int64)
+        self._count = int(np.count_nonzero(self._users != NO_USER))
+
+    @classmethod
+    def load(cls, path: Path) -> "UserIdMap":
+        """Carrega o mapeamento salvo (.npy, ou o dict .pkl do formato antigo)"""
+        path = Path(path)
+        if path.suffix == ".pkl":
+            with open(path, "rb") as f:
+                return cls.from_dict(pickle.load(f))
+        return cls(np.load(path, mmap_mode="c"))
+
+    @classmethod
+    def from_dict(cls, id_to_user: dict) -> "UserIdMap":
+        mapping = cls()
+        if id_to_user:
+            mapping.assign(
+                np.fromiter(id_to_user.keys(), dtype=np.int64, count=len(id_to_user)),
+                np.fromiter(id_to_user.values(), dtype=np.int64, count=len(id_to_user)),
+            )
+        return mapping
+
+    def _ensure_capacity(self, size: int):
+        """Cresce o array (dobrando) para caber `size` faiss_ids"""
+        capacity = len(self._users)
+        if size <= capacity:
+            return
+        users = np.full(max(size, capacity * 2, MIN_CAPACITY), NO_USER, dtype=np.int64)
+        users[:capacity] = self._users
+        self._users = users
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, faiss_id) -> bool:
+        faiss_id = int(faiss_id)
+        return 0 <= faiss_id < len(self._users) and self._users[faiss_id] != NO_USER
+
+    def __getitem__(self, faiss_id) -> int:
+        if faiss_id not in self:
+            raise KeyError(faiss_id)
+        return int(self._users[int(faiss_id)])
+
+    def get(self, faiss_id, default=None):
+        return self[faiss_id] if faiss_id in self else default
+
+    def __setitem__(self, faiss_id, user_id):
+        faiss_id = int(faiss_id)
+        self._ensure_capacity(faiss_id + 1)
+        if self._users[faiss_id] == NO_USER:
+            self._count += 1
+        self._users[faiss_id] = int(user_id)
+
+    def __delitem__(self, faiss_id):
+        if faiss_id not in self:
+            raise KeyError(faiss_id)
+        self._users[int(faiss_id)] = NO_USER
+        self._count -= 1
+
+    def keys(self) -> np.ndarray:
+        """faiss_ids com usuário associado, em ordem crescente"""
+        return np.flatnonzero(self._users != NO_USER)
+
+    def max_id(self) -> int:
+        """Maior faiss_id com usuário associado (-1 se vazio)"""
+        keys = self.keys()
+        return int(keys[-1]) if len(keys) > 0 else -1
+
+    def lookup(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """user_ids dos faiss_ids (qualquer formato), NO_USER onde não há usuário"""
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        users = np.full(faiss_ids.shape, NO_USER, dtype=np.int64)
+        valid = (faiss_ids >= 0) & (faiss_ids < len(self._users))
+        users[valid] = self._users[faiss_ids[valid]]
+        return users
+
+    def contains_user(self, user_id) -> bool:
+        """O user_id tem algum embedding associado (uma comparação vetorizada no array)"""
+        return bool(np.any(self._users == int(user_id)))
+
+    def faiss_ids_of(self, user_id) -> np.ndarray:
+        """faiss_ids associados ao user_id"""
+        return np.flatnonzero(self._users == int(user_id)).astype(np.int64)
+
+    def contains_users(self, user_ids) -> np.ndarray:
+        """Máscara dos user_ids que têm algum embedding associado"""
+        return np.isin(np.asarray(user_ids, dtype=np.int64), self._users)
+
+    def assign(self, faiss_ids: np.ndarray, user_ids: np.ndarray):
+        """Associa vários faiss_ids de uma vez"""
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        if len(faiss_ids) == 0:
+            return
+        self._ensure_capacity(int(faiss_ids.max()) + 1)
+        self._users[faiss_ids] = np.asarray(user_ids, dtype=np.int64)
+        self._count = int(np.count_nonzero(self._users != NO_USER))
+
+    def copy(self) -> "UserIdMap":
+        """Cópia em memória (sem a capacidade livre do fim do array)"""
+        return UserIdMap(np.array(self._users[: self.max_id() + 1]))
+
+    def save(self, path: Path):
+        """Grava o array em .npy, trocando o arquivo atomicamente"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(self._users[: self.max_id() + 1]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,304 @@
+import math
+import faiss
+import numpy as np
+import os
+import sys
+from typing import Optional
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import (
+    EMBEDDING_DIMENSION,
+    FAISS_INDEX_TYPE,
+    FAISS_ANN_TYPE,
+    FAISS_ANN_THRESHOLD,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_COMPRESSION,
+    FAISS_COMPRESSION_MIN_VECTORS,
+    FAISS_PQ_M,
+)
+
+INDEX_KINDS = ("flat", "ivf", "hnsw")
+COMPRESSIONS = ("none", "sq8", "pq")
+
+# Mínimo de vetores de treino por centróide recomendado pelo FAISS
+IVF_MIN_POINTS_PER_CENTROID = 39
+IVF_MAX_POINTS_PER_CENTROID = 256
+# Amostra de treino para SQ8/PQ (PQ usa 256 centróides por subquantizador)
+COMPRESSION_TRAIN_SIZE = 256 * IVF_MAX_POINTS_PER_CENTROID
+
+
+def select_index_kind(n_vectors: int, current_kind: Optional[str] = None) -> str:
+    """Escolhe o tipo de índice para uma galeria com n_vectors embeddings
+
+    No modo "auto" a galeria usa busca exata (FlatIP) até FAISS_ANN_THRESHOLD e
+    passa para FAISS_ANN_TYPE acima disso. Uma galeria que já está em ANN só
+    volta para FlatIP abaixo de 90% do limite, para não alternar a cada cadastro.
+    """
+    if FAISS_INDEX_TYPE != "auto":
+        return FAISS_INDEX_TYPE
+
+    threshold = FAISS_ANN_THRESHOLD
+    if current_kind is not None and current_kind != "flat":
+        threshold = int(FAISS_ANN_THRESHOLD * 0.9)
+
+    return FAISS_ANN_TYPE if n_vectors >= threshold else "flat"
+
+
+def select_index_compression(n_vectors: int) -> str:
+    """Escolhe a compressão dos vetores no índice para a galeria
+
+    Galerias pequenas ficam sem compressão: a economia de memória é
+    irrelevante e SQ8/PQ precisam de vetores suficientes para treinar.
+    """
+    if FAISS_COMPRESSION == "none" or n_vectors < FAISS_COMPRESSION_MIN_VECTORS:
+        return "none"
+    return FAISS_COMPRESSION
+
+
+def _inner_index(index):
+    """Índice FAISS sob o IDMap2 (o do snapshot no LayeredIndex, o do 1º shard no ShardedIndex)"""
+    index = getattr(index, "base", index)
+    return faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+
+
+def _is_exhaustive_pq(inner) -> bool:
+    """FlatIP com PQ: IVF de uma só lista (ver _factory_string)"""
+    return isinstance(inner, faiss.IndexIVFPQ) and inner.nlist == 1
+
+
+def index_kind(index) -> str:
+    """Identifica o tipo ("flat", "ivf" ou "hnsw") de um índice da galeria"""
+    # LayeredIndex: o tipo é o do snapshot
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return "flat" if _is_exhaustive_pq(inner) else "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_compression(index) -> str:
+    """Identifica a compressão ("none", "sq8" ou "pq") de um índice da galeria"""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def _ivf_nlist(n_vectors: int) -> int:
+    """Número de listas invertidas: configurado ou ~4*sqrt(N), limitado pelo treino"""
+    nlist = FAISS_IVF_NLIST or int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // IVF_MIN_POINTS_PER_CENTROID))
+
+
+def _factory_string(kind: str, n_vectors: int, compression: str = "none") -> str:
+    """Monta a string do faiss.index_factory para o tipo de índice e compressão"""
+    codec = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{FAISS_PQ_M}"}[compression]
+    if kind == "ivf":
+        return f"IDMap2,IVF{_ivf_nlist(n_vectors)},{codec}"
+    if kind == "hnsw":
+        # HNSW+PQ tem sintaxe própria no index_factory
+        if compression == "pq":
+            return f"IDMap2,HNSW{FAISS_HNSW_M}_PQ{FAISS_PQ_M}"
+        return f"IDMap2,HNSW{FAISS_HNSW_M},{codec}"
+    if compression == "pq":
+        # IndexPQ não aceita parâmetros de busca (nem o seletor dos
+        # tombstones); um IVF de uma só lista é a mesma busca exaustiva
+        return f"IDMap2,IVF1,{codec}"
+    return f"IDMap2,{codec}"
+
+
+def new_index(kind: str = "flat", n_vectors: int = 0, compression: str = "none"):
+    """Cria índice vazio endereçado por faiss_id
+
+    Todos os tipos ficam sob IDMap2: os rótulos retornados pela busca são
+    sempre faiss_ids. Com compressão (SQ8/PQ) o índice guarda apenas códigos
+    e a distância exata vem do EmbeddingStore.
+    """
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Tipo de índice FAISS inválido: {kind}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Compressão FAISS inválida: {compression}")
+
+    index = faiss.index_factory(
+        EMBEDDING_DIMENSION,
+        _factory_string(kind, n_vectors, compression),
+        faiss.METRIC_INNER_PRODUCT,
+    )
+    if kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    configure_search(index)
+    return index
+
+
+def build_index(
+    vectors: np.ndarray, ids: np.ndarray, kind: str = "flat", compression: str = "none"
+):
+    """Cria, treina (se necessário) e popula um índice com os vetores dados"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+
+    # IVF precisa de vetores suficientes para treinar os centróides
+    if kind == "ivf" and len(vectors) < IVF_MIN_POINTS_PER_CENTROID:
+        kind = "flat"
+    # PQ treina 256 centróides por subquantizador
+    if compression == "pq" and len(vectors) < 256:
+        compression = "none"
+    if compression == "sq8" and len(vectors) == 0:
+        compression = "none"
+
+    index = new_index(kind, len(vectors), compression)
+    if not index.is_trained:
+        train_size = COMPRESSION_TRAIN_SIZE
+        if kind == "ivf":
+            nlist = faiss.downcast_index(index.index).nlist
+            train_size = max(train_size, nlist * IVF_MAX_POINTS_PER_CENTROID)
+        train_size = min(len(vectors), train_size)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(vectors), train_size, replace=False)
+        index.train(vectors[np.sort(sample)])
+
+    if len(vectors) > 0:
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def configure_search(index):
+    """Aplica nprobe/efSearch configurados ao índice"""
+    kind = index_kind(index)
+    parameter_space = faiss.ParameterSpace()
+    # ShardedIndex: configurar cada shard; LayeredIndex: o snapshot
+    for part in getattr(index, "shards", [index]):
+        part = getattr(part, "base", part)
+        if kind == "ivf":
+            parameter_space.set_index_parameter(part, "nprobe", FAISS_IVF_NPROBE)
+        elif kind == "hnsw":
+            parameter_space.set_index_parameter(part, "efSearch", FAISS_HNSW_EF_SEARCH)
+
+
+def make_search_params(index, selector=None):
+    """Cria parâmetros de busca do tipo certo para o índice
+
+    O FAISS exige SearchParametersIVF/HNSW para índices IVF/HNSW e esses
+    parâmetros substituem os valores do índice, por isso nprobe/efSearch são
+    repetidos aqui.
+    """
+    kind = index_kind(index)
+    if kind == "ivf":
+        params = faiss.SearchParametersIVF()
+        params.nprobe = FAISS_IVF_NPROBE
+    elif _is_exhaustive_pq(_inner_index(index)):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = 1
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = FAISS_HNSW_EF_SEARCH
+    else:
+        params = faiss.SearchParameters()
+
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def copy_search_params(params):
+    """Cópia dos parâmetros de busca para uma busca concorrente
+
+    IndexIDMap troca params.sel temporariamente durante a busca (para traduzir
+    os IDs), então o mesmo objeto não pode ser usado por duas buscas ao mesmo
+    tempo. O seletor em si é só lido e pode ser compartilhado.
+    """
+    if params is None:
+        return None
+    copy = type(params)()
+    copy.sel = params.sel
+    if hasattr(params, "selector_refs"):
+        copy.selector_refs = params.selector_refs
+    for name in ("nprobe", "max_codes", "efSearch", "check_relative_distance"):
+        if hasattr(params, name):
+            setattr(copy, name, getattr(params, name))
+    return copy
+
+
+def merge_search_results(results, k: int):
+    """Junta resultados (similaridades, faiss_ids) de vários índices nos k melhores por consulta"""
+    similarities = np.hstack([r[0] for r in results])
+    labels = np.hstack([r[1] for r in results])
+    # -1 indica que o índice retornou menos resultados que o pedido
+    similarities[labels < 0] = -np.inf
+
+    order = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+    return (
+        np.take_along_axis(similarities, order, axis=1),
+        np.take_along_axis(labels, order, axis=1),
+    )
+
+
+def measure_recall(
+    index,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    k: int = 10,
+    n_queries: int = 500,
+    noise: float = 0.03,
+    params=None,
+    rerank_k: int = 0,
+) -> dict:
+    """Mede o recall do índice contra busca exata (FlatIP) nos mesmos vetores
+
+    As consultas são embeddings da galeria com ruído gaussiano (similaridade
+    de cosseno ~0.8 com o original), simulando uma nova captura da mesma pessoa.
+    Com rerank_k > 0 mede o pipeline comprimido: busca rerank_k candidatos e
+    reordena pela similaridade exata, como em FaceRecognitionSystem.
+
+    Returns:
+        dict com recall@1 (o que decide o acesso), recall@k e o k usado
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(vectors) == 0:
+        return {"recall_at_1": 1.0, "recall_at_k": 1.0, "k": k}
+
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+    queries = vectors[sample] + rng.normal(
+        0.0, noise, (len(sample), vectors.shape[1])
+    ).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_positions = exact.search(queries, k)
+    expected = ids[exact_positions]
+
+    if rerank_k > 0:
+        n_candidates = min(max(k, rerank_k), len(vectors))
+        _, candidates = index.search(queries, n_candidates, params=params)
+        # Linha de cada faiss_id candidato na matriz de vetores
+        order = np.argsort(ids)
+        rows = order[np.searchsorted(ids[order], np.maximum(candidates, 0))]
+        exact_sims = np.einsum("qcd,qd->qc", vectors[rows], queries)
+        exact_sims[candidates < 0] = -np.inf
+        best = np.argsort(-exact_sims, axis=1)[:, :k]
+        found = np.take_along_axis(candidates, best, axis=1)
+    else:
+        _, found = index.search(queries, k, params=params)
+
+    recall_at_1 = float(np.mean(found[:, 0] == expected[:, 0]))
+    hits = [len(np.intersect1d(f, e)) for f, e in zip(found, expected)]
+    recall_at_k = float(np.mean(hits) / k)
+
+    return {"recall_at_1": recall_at_1, "recall_at_k": recall_at_k, "k": k}
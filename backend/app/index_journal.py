@@ -0,0 +1,309 @@
+import numpy as np
+import os
+import struct
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import (
+    EMBEDDING_DIMENSION,
+    FAISS_JOURNAL_FSYNC_BATCH,
+    FAISS_JOURNAL_FSYNC_INTERVAL,
+)
+
+# Tipos de registro
+RECORD_ADD = 1  # Embedding adicionado (faiss_id, user_id ou -1, vetor)
+RECORD_MAP = 2  # faiss_id associado ao user_id
+RECORD_REMOVE = 3  # faiss_id removido
+RECORD_CHECKPOINT = 4  # Snapshot novo publicado (os outros workers recarregam)
+RECORD_TYPES = (RECORD_ADD, RECORD_MAP, RECORD_REMOVE, RECORD_CHECKPOINT)
+
+# Início de cada arquivo de journal no formato com gerações
+FILE_HEADER = b"FJNL\x02\x00\x00\x00"
+# Cabeçalho do registro: tipo, geração, faiss_id, user_id, crc32 (campos + vetor)
+HEADER = struct.Struct("<BqqqI")
+FIELDS = struct.Struct("<Bqqq")
+# Formato antigo (sem cabeçalho de arquivo nem geração), convertido na carga
+LEGACY_HEADER = struct.Struct("<BqqI")
+VECTOR_BYTES = EMBEDDING_DIMENSION * np.dtype(np.float32).itemsize
+
+# (geração, tipo, faiss_id, user_id ou None, vetor ou None)
+JournalRecord = Tuple[int, int, int, Optional[int], Optional[np.ndarray]]
+
+
+class IndexJournal:
+    """Journal append-only das alterações da galeria entre checkpoints
+
+    Cada cadastro/remoção grava um registro pequeno em vez de reescrever o
+    índice inteiro. O fsync é feito em lotes: a cada FAISS_JOURNAL_FSYNC_BATCH
+    registros ou, no máximo, FAISS_JOURNAL_FSYNC_INTERVAL segundos depois do
+    primeiro registro pendente. No checkpoint o journal é rotacionado
+    (index.journal -> index.journal.old) e, com o snapshot novo no disco, o
+    antigo vira index.journal.prev: junto com o manifesto anterior ele permite
+    voltar ao último snapshot bom se o atual estiver corrompido.
+
+    O journal é compartilhado pelos workers: cada registro leva a geração da
+    galeria e read_new() lê só o que outros workers gravaram desde a última
+    leitura. Gravar e ler exige o lock da galeria (GalleryVersion.lock()).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + ".old")
+        self.previous_path = self.path.with_name(self.path.name + ".prev")
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0  # Registros escritos ainda sem fsync
+        self._sync_timer = None
+        self.records = 0  # Registros desde o último checkpoint
+        # Posição já lida do journal atual: (inode, offset)
+        self._tail = None
+
+    def _open(self):
+        if self._file is not None:
+            try:
+                current_inode = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current_inode = None
+            if current_inode == os.fstat(self._file.fileno()).st_ino:
+                return
+            # Outro worker rotacionou o journal: gravar no arquivo novo
+            self._sync_locked()
+            self._file.close()
+            self._file = None
+
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER)
+            self._file.flush()
+            self._tail = (os.fstat(self._file.fileno()).st_ino, self._file.tell())
+
+    def append(
+        self,
+        record_type: int,
+        faiss_id: int,
+        user_id: Optional[int],
+        vector=None,
+        generation: int = 0,
+    ):
+        """Grava um registro no fim do journal"""
+        user_id = -1 if user_id is None else int(user_id)
+        payload = b""
+        if record_type == RECORD_ADD:
+            payload = np.asarray(vector, dtype=np.float32).reshape(EMBEDDING_DIMENSION).tobytes()
+
+        fields = FIELDS.pack(record_type, int(generation), int(faiss_id), user_id)
+        crc = zlib.crc32(payload, zlib.crc32(fields))
+
+        with self._lock:
+            self._open()
+            self._file.write(
+                HEADER.pack(record_type, int(generation), int(faiss_id), user_id, crc) + payload
+            )
+            self._file.flush()
+            # Registros próprios não precisam ser lidos de volta
+            self._tail = (self._tail[0], self._file.tell())
+            self._pending += 1
+            self.records += 1
+
+            if self._pending >= FAISS_JOURNAL_FSYNC_BATCH:
+                self._sync_locked()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(FAISS_JOURNAL_FSYNC_INTERVAL, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def _sync_locked(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def sync(self):
+        """Força o fsync dos registros pendentes"""
+        with self._lock:
+            self._sync_locked()
+
+    def rotate(self):
+        """Inicia um checkpoint: novos registros vão para um journal vazio"""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path.exists():
+                # Um .old restante é de checkpoint interrompido e ainda não
+                # foi coberto por snapshot: preservar os dois registros
+                if self.rotated_path.exists():
+                    with open(self.rotated_path, "ab") as old, open(self.path, "rb") as cur:
+                        cur.seek(len(FILE_HEADER))
+                        old.write(cur.read())
+                        old.flush()
+                        os.fsync(old.fileno())
+                    self.path.unlink()
+                else:
+                    os.replace(self.path, self.rotated_path)
+            self.records = 0
+            self._tail = None
+
+    def discard_rotated(self):
+        """Conclui o checkpoint: o journal coberto pelo snapshot vira o anterior
+
+        Ele só é necessário para recarregar o snapshot anterior e é substituído
+        no próximo checkpoint.
+        """
+        if self.rotated_path.exists():
+            os.replace(self.rotated_path, self.previous_path)
+        elif self.previous_path.exists():
+            self.previous_path.unlink()
+
+    def replay(
+        self, after_generation: int = 0, include_previous: bool = False
+    ) -> Iterator[JournalRecord]:
+        """Lê os registros ainda não cobertos por snapshot, na ordem de gravação
+
+        Só registros com geração maior que after_generation (a do snapshot
+        carregado); include_previous inclui o journal do checkpoint anterior,
+        para a carga do snapshot anterior. Um registro incompleto ou com CRC
+        inválido no fim do journal (escrita interrompida por queda) encerra a
+        leitura e é truncado.
+        """
+        self.records = 0
+        self._tail = None
+        paths = (self.rotated_path, self.path)
+        if include_previous:
+            paths = (self.previous_path,) + paths
+        for path in paths:
+            if path.exists():
+                yield from self._read_file(path, 0, after_generation)
+
+    def read_new(self, after_generation: int) -> Iterator[JournalRecord]:
+        """Lê os registros gravados por outros workers desde a última leitura
+
+        Continua do ponto já lido do journal atual; se ele foi rotacionado por
+        um checkpoint, relê o journal antigo e o novo a partir do início.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is not None and self._tail is not None and self._tail[0] == stat.st_ino:
+            if stat.st_size > self._tail[1]:
+                yield from self._read_file(self.path, self._tail[1], after_generation)
+            return
+        yield from self.replay(after_generation)
+
+    def _read_file(self, path: Path, offset: int, after_generation: int) -> Iterator[JournalRecord]:
+        """Lê os registros de um arquivo do journal a partir de `offset`"""
+        with open(path, "rb") as f:
+            if offset == 0:
+                if f.read(len(FILE_HEADER)) != FILE_HEADER:
+                    print(f"⚠️  Journal {path.name} em formato desconhecido, ignorado")
+                    return
+                offset = f.tell()
+            f.seek(offset)
+            inode = os.fstat(f.fileno()).st_ino
+
+            valid_size = offset
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                record_type, generation, faiss_id, user_id, crc = HEADER.unpack(header)
+                payload = f.read(VECTOR_BYTES) if record_type == RECORD_ADD else b""
+                fields = FIELDS.pack(record_type, generation, faiss_id, user_id)
+                if (
+                    record_type not in RECORD_TYPES
+                    or (record_type == RECORD_ADD and len(payload) < VECTOR_BYTES)
+                    or zlib.crc32(payload, zlib.crc32(fields)) != crc
+                ):
+                    break
+
+                valid_size = f.tell()
+                if generation <= after_generation:
+                    continue
+                self.records += 1
+                vector = (
+                    np.frombuffer(payload, dtype=np.float32)
+                    if record_type == RECORD_ADD
+                    else None
+                )
+                yield generation, record_type, faiss_id, (None if user_id < 0 else user_id), vector
+
+            size = os.fstat(f.fileno()).st_size
+
+        if valid_size < size:
+            print(f"⚠️  Journal {path.name} com registro incompleto no fim, truncando")
+            with open(path, "r+b") as f:
+                f.truncate(valid_size)
+        if path == self.path:
+            self._tail = (inode, valid_size)
+
+    def upgrade_legacy(self, generation: int) -> int:
+        """Converte journals do formato antigo (sem gerações) para o atual
+
+        Os registros recebem gerações a partir de generation + 1, na ordem de
+        gravação. Retorna a última geração atribuída.
+        """
+        for path in (self.rotated_path, self.path):
+            if not path.exists() or path.stat().st_size == 0:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            if data.startswith(FILE_HEADER):
+                continue
+
+            print(f"🔄 Convertendo journal {path.name} para o formato com gerações...")
+            converted = [FILE_HEADER]
+            offset = 0
+            while offset + LEGACY_HEADER.size <= len(data):
+                record_type, faiss_id, user_id, crc = LEGACY_HEADER.unpack_from(data, offset)
+                start = offset + LEGACY_HEADER.size
+                payload = data[start : start + VECTOR_BYTES] if record_type == RECORD_ADD else b""
+                legacy_fields = struct.pack("<Bqq", record_type, faiss_id, user_id)
+                if (
+                    record_type not in (RECORD_ADD, RECORD_MAP, RECORD_REMOVE)
+                    or (record_type == RECORD_ADD and len(payload) < VECTOR_BYTES)
+                    or zlib.crc32(payload, zlib.crc32(legacy_fields)) != crc
+                ):
+                    break
+                offset = start + len(payload)
+
+                generation += 1
+                fields = FIELDS.pack(record_type, generation, faiss_id, user_id)
+                converted.append(
+                    HEADER.pack(
+                        record_type,
+                        generation,
+                        faiss_id,
+                        user_id,
+                        zlib.crc32(payload, zlib.crc32(fields)),
+                    )
+                    + payload
+                )
+
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(converted))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return generation
+
+    def close(self):
+        """Grava pendências e fecha o arquivo"""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
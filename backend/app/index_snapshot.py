@@ -0,0 +1,189 @@
+import faiss
+import hashlib
+import json
+import numpy as np
+import os
+import sys
+from pathlib import Path
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import FAISS_INDEX_MMAP
+from app.index_factory import merge_search_results, new_index
+
+# Leitura zero-copy: os dados do índice ficam no page cache, compartilhados
+# entre os workers. Versões antigas do FAISS não têm a flag.
+MMAP_FLAGS = (
+    faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC")
+    else None
+)
+
+
+class LayeredIndex:
+    """Snapshot mapeado em memória (somente leitura) + índice em heap com os cadastros posteriores
+
+    O FAISS aborta o processo ao adicionar vetores num índice aberto com
+    IO_FLAG_MMAP_IFC, então cadastros feitos depois do carregamento vão para
+    um índice FlatIP pequeno (delta), que o próximo checkpoint incorpora ao
+    snapshot. Expõe a parte da API de índice FAISS usada pela galeria.
+    """
+
+    def __init__(self, base, delta=None):
+        self.base = base
+        self.delta = delta if delta is not None else new_index("flat")
+        self.d = base.d
+        self.is_trained = True
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + self.delta.ntotal
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        self.delta.add_with_ids(vectors, ids)
+
+    def search(self, queries: np.ndarray, k: int, params=None):
+        """Busca nos dois índices e junta os k melhores de cada consulta"""
+        similarities, labels = self.base.search(queries, k, params=params)
+        if self.delta.ntotal == 0:
+            return similarities, labels
+
+        return merge_search_results(
+            [(similarities, labels), self.delta.search(queries, k, params=params)], k
+        )
+
+    def get_ids(self) -> np.ndarray:
+        """faiss_ids do snapshot seguidos dos cadastrados depois dele"""
+        return np.concatenate(
+            [
+                faiss.vector_to_array(self.base.id_map),
+                faiss.vector_to_array(self.delta.id_map),
+            ]
+        )
+
+    def merged(self):
+        """Cópia em heap do snapshot com os cadastros do delta incorporados"""
+        index = faiss.deserialize_index(faiss.serialize_index(self.base))
+        if self.delta.ntotal > 0:
+            vectors = faiss.downcast_index(self.delta.index).reconstruct_n(
+                0, self.delta.ntotal
+            )
+            index.add_with_ids(vectors, faiss.vector_to_array(self.delta.id_map))
+        return index
+
+
+def open_snapshot(path: Path):
+    """Abre o snapshot do índice
+
+    Com FAISS_INDEX_MMAP o arquivo é mapeado em memória e envolvido num
+    LayeredIndex; caso contrário é lido inteiro para a memória do processo.
+    """
+    if FAISS_INDEX_MMAP and MMAP_FLAGS is not None:
+        base = faiss.read_index(str(path), MMAP_FLAGS)
+        if isinstance(base, faiss.IndexIDMap2):
+            return LayeredIndex(base)
+        # Índice legado (sem IDs) é convertido pelo chamador
+        return base
+    return faiss.read_index(str(path))
+
+
+def serialize_snapshot(index) -> np.ndarray:
+    """Serializa o índice ativo (com o delta, se houver) para gravação"""
+    if isinstance(index, LayeredIndex):
+        if index.delta.ntotal == 0:
+            return faiss.serialize_index(index.base)
+        return faiss.serialize_index(index.merged())
+    return faiss.serialize_index(index)
+
+
+def publish_snapshot(data: np.ndarray, path: Path):
+    """Grava o snapshot e o publica atomicamente
+
+    O arquivo novo é escrito ao lado e trocado com os.replace: quem abrir o
+    caminho vê o snapshot antigo ou o novo completo, e processos que já mapearam
+    o antigo continuam lendo o arquivo original até reabrirem.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+MANIFEST = "manifest.json"
+# Manifesto anterior: último snapshot bom caso o atual esteja corrompido
+PREVIOUS_MANIFEST = "manifest.prev.json"
+
+
+def file_checksum(path: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 de um arquivo, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_file_info(path: Path, data: np.ndarray = None) -> dict:
+    """Tamanho e SHA-256 de um arquivo do snapshot (dos bytes já em memória, se houver)"""
+    if data is None:
+        return {"size": Path(path).stat().st_size, "sha256": file_checksum(path)}
+    return {"size": int(data.nbytes), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def verify_snapshot_files(manifest: dict, directory: Path, checksums: bool = True):
+    """Confere os arquivos listados no manifesto
+
+    Tamanho sempre; SHA-256 com checksums=True (lê os arquivos inteiros).
+    Lança ValueError no primeiro arquivo ausente ou divergente.
+    """
+    for name, info in manifest.get("files", {}).items():
+        path = Path(directory) / name
+        if not path.exists():
+            raise ValueError(f"arquivo {name} ausente")
+        if path.stat().st_size != info["size"]:
+            raise ValueError(f"arquivo {name} com tamanho divergente")
+        if checksums and file_checksum(path) != info["sha256"]:
+            raise ValueError(f"checksum de {name} divergente")
+
+
+def read_manifest(directory: Path, name: str = MANIFEST) -> dict:
+    """Lê o manifesto do último snapshot publicado ({} se não houver ou for ilegível)"""
+    path = Path(directory) / name
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Manifesto {name} ilegível, ignorado: {e}")
+        return {}
+
+
+def write_manifest(manifest: dict, directory: Path):
+    """Publica o manifesto do snapshot (último passo do checkpoint)
+
+    Registra a geração da galeria coberta pelo snapshot: ao carregar, só os
+    registros do journal com geração maior são aplicados. O manifesto atual
+    passa a ser o anterior, mantido como alternativa se o novo falhar na
+    validação.
+    """
+    directory = Path(directory)
+    current = directory / MANIFEST
+    if current.exists():
+        previous = np.frombuffer(current.read_bytes(), dtype=np.uint8)
+        publish_snapshot(previous, directory / PREVIOUS_MANIFEST)
+
+    data = np.frombuffer(json.dumps(manifest, indent=2).encode("utf-8"), dtype=np.uint8)
+    publish_snapshot(data, current)
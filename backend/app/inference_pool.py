@@ -0,0 +1,286 @@
+import hashlib
+import multiprocessing
+import numpy as np
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import List
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import ENCRYPTION_KEY, FACE_DETECTION_SIZES, INFERENCE_WORKERS
+
+SEGMENT_MIN_BYTES = 8 * 1024 * 1024  # Segmentos de memória compartilhada reaproveitados entre lotes
+FRAME_ALIGNMENT = 64  # Início de cada frame no segmento
+CONNECT_TIMEOUT = 120  # Espera (s) pelo servidor na inicialização da API
+MAX_ATTACHED_SEGMENTS = 64  # Segmentos de clientes mantidos abertos por processo do pool
+
+
+def _authkey() -> bytes:
+    """Chave da autenticação entre API e servidor (derivada de ENCRYPTION_KEY)"""
+    return hashlib.sha256(b"inference-server-v1:" + ENCRYPTION_KEY.encode("utf-8")).digest()
+
+
+# Estado de cada processo do pool (modelos carregados uma vez por processo)
+_pipeline = None
+_attached = {}
+
+
+def _init_worker():
+    global _pipeline
+    from app.face_pipeline import FacePipeline
+
+    _pipeline = FacePipeline()
+    try:
+        _pipeline.load_models()
+    except Exception as e:
+        print(f"⚠️  Processo {os.getpid()} sem modelos: {e}")
+
+
+def _attach(name: str) -> SharedMemory:
+    """Abre (uma vez) o segmento de memória compartilhada criado pelo cliente"""
+    segment = _attached.get(name)
+    if segment is None:
+        segment = SharedMemory(name=name)
+        # O segmento pertence ao cliente: este processo não deve removê-lo ao sair
+        resource_tracker.unregister(segment._name, "shared_memory")
+        if len(_attached) >= MAX_ATTACHED_SEGMENTS:
+            _attached.pop(next(iter(_attached))).close()
+        _attached[name] = segment
+    return segment
+
+
+def _describe_worker() -> dict:
+    return {
+        "pid": os.getpid(),
+        "models_loaded": _pipeline.models_loaded,
+        "models": _pipeline.model_names,
+        "detector_sizes": _pipeline.detector_sizes,
+    }
+
+
+def _run_in_worker(name: str, frames: list, params: list) -> List[List[dict]]:
+    """Roda o pipeline sobre frames lidos direto da memória compartilhada"""
+    segment = _attach(name)
+    requests = [
+        (np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=offset), *param)
+        for (offset, shape), param in zip(frames, params)
+    ]
+    return _pipeline.run(requests)
+
+
+class InferenceServer:
+    """Servidor de inferência: pool fixo de processos com os modelos carregados
+
+    Os workers da API (InferenceClient) se conectam por um socket Unix e
+    mandam só metadados: os pixels ficam em um segmento de memória
+    compartilhada do cliente, lido direto pelos processos do pool (sem
+    serializar os frames). A resposta traz só bbox, landmarks, scores e
+    embeddings. Vários workers leves da API compartilham um pool de modelos,
+    com CPUs e memória dimensionadas por INFERENCE_WORKERS.
+    """
+
+    def __init__(self, address: str, workers: int = INFERENCE_WORKERS):
+        self.address = address
+        self.workers = max(1, workers)
+        self.info = None
+        self._pool_lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _run_batch(self, name: str, frames: list, params: list) -> tuple:
+        """Roda um lote no pool; se um processo morreu, recria o pool e falha só este lote
+
+        Um processo que cai (falta de memória, crash no ONNX Runtime) quebra o
+        ProcessPoolExecutor inteiro. O lote não é repetido: o frame pode ser o
+        que derrubou o processo.
+        """
+        pool = self._pool
+        try:
+            return "ok", pool.submit(_run_in_worker, name, frames, params).result()
+        except BrokenProcessPool as e:
+            with self._pool_lock:
+                if self._pool is pool:
+                    print(f"⚠️  Processo do pool de inferência morreu, recriando o pool: {e}")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._new_pool()
+            return "error", f"Processo de inferência reiniciado: {e}"
+        except Exception as e:
+            return "error", str(e)
+
+    def serve_forever(self):
+        """Carrega os modelos em todos os processos e atende as conexões"""
+        start_time = time.perf_counter()
+        workers = [
+            future.result()
+            for future in [self._pool.submit(_describe_worker) for _ in range(self.workers)]
+        ]
+        self.info = dict(workers[0])
+        self.info["models_loaded"] = all(worker["models_loaded"] for worker in workers)
+        self.info["workers"] = self.workers
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # Socket de uma execução anterior
+        listener = Listener(self.address, family="AF_UNIX", authkey=_authkey())
+        print(
+            f"🚀 Servidor de inferência em {self.address}: {self.workers} processos, "
+            f"modelos {self.info['models']} ({time.perf_counter() - start_time:.1f}s)"
+        )
+
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    print(f"⚠️  Conexão recusada: {e}")
+                    continue
+                threading.Thread(
+                    target=self._handle, args=(connection,), name="inference-connection", daemon=True
+                ).start()
+        finally:
+            listener.close()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _handle(self, connection):
+        """Atende um worker da API (um lote por vez em cada conexão)"""
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == "info":
+                    connection.send(self.info)
+                elif message[0] == "run":
+                    _, name, frames, params = message
+                    connection.send(self._run_batch(name, frames, params))
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+
+class InferenceClient:
+    """Cliente do servidor de inferência, com a mesma interface de FacePipeline"""
+
+    face_app = None  # Modelos ficam nos processos do servidor
+
+    def __init__(self, address: str):
+        self.address = address
+        self.detector_sizes = [max(FACE_DETECTION_SIZES)]
+        self.model_names = []
+        self.models_loaded = False
+        self._lock = threading.Lock()
+        self._connections = []  # Conexões livres
+        self._segments = []  # Segmentos de memória compartilhada livres
+        self._all_segments = []
+
+    def load_models(self):
+        """Espera o servidor ficar disponível e lê a configuração dos modelos"""
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                connection = self._acquire_connection()
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Servidor de inferência indisponível em {self.address}")
+                time.sleep(1)
+
+        connection.send(("info",))
+        info = connection.recv()
+        self._release_connection(connection)
+
+        self.detector_sizes = info["detector_sizes"]
+        self.model_names = info["models"]
+        if not info["models_loaded"]:
+            raise RuntimeError("Servidor de inferência sem modelos carregados")
+        self.models_loaded = True
+        print(
+            f"✅ Conectado ao servidor de inferência {self.address}: "
+            f"{info['workers']} processos, modelos {self.model_names}"
+        )
+
+    def run(self, requests: List[tuple]) -> List[List[dict]]:
+        """Envia os frames pela memória compartilhada e espera as faces"""
+        images = [np.ascontiguousarray(request[0], dtype=np.uint8) for request in requests]
+        offsets = []
+        total = 0
+        for image in images:
+            offsets.append(total)
+            total += -(-image.nbytes // FRAME_ALIGNMENT) * FRAME_ALIGNMENT
+
+        segment = self._acquire_segment(total)
+        try:
+            for image, offset in zip(images, offsets):
+                np.ndarray(image.shape, dtype=np.uint8, buffer=segment.buf, offset=offset)[...] = image
+
+            connection = self._acquire_connection()
+            try:
+                connection.send(
+                    (
+                        "run",
+                        segment.name,
+                        [(offset, image.shape) for image, offset in zip(images, offsets)],
+                        [tuple(request[1:]) for request in requests],
+                    )
+                )
+                status, result = connection.recv()
+            except Exception:
+                connection.close()
+                raise
+            self._release_connection(connection)
+        finally:
+            self._release_segment(segment)
+
+        if status != "ok":
+            raise RuntimeError(f"Erro no servidor de inferência: {result}")
+        return result
+
+    def _acquire_connection(self):
+        with self._lock:
+            if self._connections:
+                return self._connections.pop()
+        return Client(self.address, family="AF_UNIX", authkey=_authkey())
+
+    def _release_connection(self, connection):
+        with self._lock:
+            self._connections.append(connection)
+
+    def _acquire_segment(self, size: int) -> SharedMemory:
+        with self._lock:
+            for segment in self._segments:
+                if segment.size >= size:
+                    self._segments.remove(segment)
+                    return segment
+            segment = SharedMemory(create=True, size=max(size, SEGMENT_MIN_BYTES))
+            self._all_segments.append(segment)
+            return segment
+
+    def _release_segment(self, segment: SharedMemory):
+        with self._lock:
+            self._segments.append(segment)
+
+    def close(self):
+        """Fecha as conexões e remove os segmentos de memória compartilhada"""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            for segment in self._all_segments:
+                segment.close()
+                segment.unlink()
+            self._all_segments = []
+            self._segments = []
@@ -0,0 +1,182 @@
+import numpy as np
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable
+
+from app.blocking_executor import ExecutorSaturated
+
+
+class InferenceScheduler:
+    """Agrupa frames de requisições concorrentes em lotes de inferência
+
+    Cada requisição entrega seu frame com submit() e recebe um Future. Uma
+    thread única junta os frames que chegam em até max_wait_ms (ou até
+    max_batch frames) e chama run_batch(items) uma vez por lote; o resultado
+    de cada item resolve o Future correspondente. Com uma só thread chamando o
+    ONNX Runtime as sessões não disputam os núcleos entre si, e os modelos que
+    aceitam lotes rodam uma vez para todos os frames. Com max_queue frames
+    aguardando, novos frames são recusados com ExecutorSaturated (0 = sem
+    limite). Futures cancelados antes de entrar em um lote são descartados.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list], list],
+        max_batch: int,
+        max_wait_ms: float,
+        name: str = "inference-scheduler",
+        max_queue: int = 0,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue = max(0, max_queue)
+        self.name = name
+        # O marcador de encerramento (None) não conta no limite
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._rejected = 0
+        self._cancelled = 0
+
+        # Métricas (janela das últimas requisições)
+        self._metrics_lock = threading.Lock()
+        self._frames = 0
+        self._batches = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._latency_ms = deque(maxlen=1000)
+        self._batch_sizes = deque(maxlen=1000)
+        self._completed = deque(maxlen=1000)  # Instantes de conclusão (vazão)
+
+    def submit(self, item) -> Future:
+        """Enfileira um item para o próximo lote
+
+        Raises:
+            ExecutorSaturated: fila com max_queue frames aguardando
+            RuntimeError: agendador encerrado (close)
+        """
+        if self._thread is None:
+            self._start()
+        future = Future()
+        with self._submit_lock:
+            if self._closing.is_set():
+                raise RuntimeError("Agendador de inferência encerrado")
+            if self.max_queue and self._queue.qsize() >= self.max_queue:
+                with self._metrics_lock:
+                    self._rejected += 1
+                raise ExecutorSaturated("Fila de inferência cheia")
+            self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Encerra a thread depois dos lotes já enfileirados (novos submit falham)"""
+        with self._submit_lock:
+            self._closing.set()
+            self._queue.put(None)
+
+    def _claim(self, entry) -> bool:
+        """Marca o Future como em execução; False se quem esperava já o cancelou"""
+        if entry[1].set_running_or_notify_cancel():
+            return True
+        with self._metrics_lock:
+            self._cancelled += 1
+        return False
+
+    def _collect(self, first) -> list:
+        """Junta ao primeiro item os que chegarem dentro da janela de espera"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)
+                break
+            if self._claim(entry):
+                batch.append(entry)
+        return batch
+
+    @staticmethod
+    def _deliver(future: Future, result=None, error: Exception = None):
+        """Resolve o Future sem derrubar a thread se ele já estiver resolvido"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except Exception as e:
+            print(f"⚠️  Resultado de inferência descartado: {e}")
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                if self._closing.is_set():
+                    return
+                continue
+            if not self._claim(first):
+                continue
+
+            batch = self._collect(first)
+            start = time.perf_counter()
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    self._deliver(future, error=e)
+                continue
+
+            end = time.perf_counter()
+            for (_, future, _), result in zip(batch, results):
+                self._deliver(future, result)
+            self._record(batch, start, end)
+
+    def _record(self, batch: list, start: float, end: float):
+        with self._metrics_lock:
+            self._frames += len(batch)
+            self._batches += 1
+            self._batch_sizes.append(len(batch))
+            for _, _, queued_at in batch:
+                self._wait_ms.append((start - queued_at) * 1000)
+                self._latency_ms.append((end - queued_at) * 1000)
+                self._completed.append(end)
+
+    def stats(self) -> dict:
+        """Vazão, tamanho médio dos lotes e latências (espera na fila e total)"""
+        with self._metrics_lock:
+            wait_ms = np.array(self._wait_ms) if self._wait_ms else np.zeros(1)
+            latency_ms = np.array(self._latency_ms) if self._latency_ms else np.zeros(1)
+            completed = list(self._completed)
+            stats = {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_ms,
+                "frames": self._frames,
+                "batches": self._batches,
+                "mean_batch_size": float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "rejected": self._rejected,
+                "cancelled": self._cancelled,
+                "wait_ms_p50": float(np.percentile(wait_ms, 50)),
+                "wait_ms_p95": float(np.percentile(wait_ms, 95)),
+                "latency_ms_p50": float(np.percentile(latency_ms, 50)),
+                "latency_ms_p95": float(np.percentile(latency_ms, 95)),
+            }
+        window = completed[-1] - completed[0] if len(completed) > 1 else 0.0
+        stats["frames_per_s"] = (len(completed) - 1) / window if window > 0 else 0.0
+        return stats
+
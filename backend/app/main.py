@@ -4,6 +4,7 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import Optional
+import asyncio
 import cv2
 import numpy as np
 import base64
@@ -31,6 +32,7 @@ from .models import User, AccessLog
 from .face_recognition import face_recognition
 from .liveness_detection import advanced_liveness_detector
 from .encryption import encryption_manager
+from .blocking_executor import ExecutorSaturated, blocking_executor
 from config import API_TITLE, API_VERSION, MAX_FILE_SIZE, ALLOWED_EXTENSIONS
 
 # Inicializar FastAPI
@@ -53,6 +55,116 @@ app.add_middleware(
 init_database()
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Grava os registros pendentes do journal do índice antes de encerrar"""
+    face_recognition.close()
+    blocking_executor.shutdown()
+
+
+def require_face_recognition_ready():
+    """Recusa a requisição (503) enquanto modelos/índice ainda estão carregando"""
+    status = face_recognition.readiness()
+    if not status["ready"]:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Sistema de reconhecimento facial inicializando (fase: {status['phase']})",
+        )
+
+
+async def run_blocking(func, *args):
+    """Executa trabalho bloqueante (CPU, FAISS, banco) no executor, fora do event loop"""
+    try:
+        return await blocking_executor.run(func, *args)
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Servidor sobrecarregado, tente novamente")
+
+
+async def detect_in_batch(image: np.ndarray, **kwargs) -> list:
+    """Detecta faces no lote de inferência compartilhado pelas requisições (503 com a fila cheia)"""
+    try:
+        future = face_recognition.submit_detection(image, **kwargs)
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Servidor sobrecarregado, tente novamente")
+    return await asyncio.wrap_future(future)
+
+
+def decode_upload_image(content: bytes) -> np.ndarray:
+    """Converte o arquivo enviado para imagem OpenCV (BGR)"""
+    image = Image.open(io.BytesIO(content))
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+
+def decode_validation_image(image_data: str) -> np.ndarray:
+    """Decodifica o frame base64 da validação, reduzido para no máximo 800x600"""
+    try:
+        if "," in image_data:
+            image_bytes = base64.b64decode(image_data.split(",")[1])
+        else:
+            image_bytes = base64.b64decode(image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Formato de imagem inválido")
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Redimensionar se muito grande para melhor performance
+        if image.width > 800 or image.height > 600:
+            image.thumbnail((800, 600), Image.Resampling.LANCZOS)
+        return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Erro ao processar imagem")
+
+
+def create_user(db: Session, name: str, email: str, embedding: np.ndarray) -> int:
+    """Grava o embedding no índice FAISS e cria o usuário no banco"""
+    # Criptografar embedding
+    print("DEBUG: Criptografando embedding...")
+    encrypted_embedding = encryption_manager.encrypt_embedding_binary(embedding)
+    print("DEBUG: Embedding criptografado com sucesso")
+
+    # Criar usuário no banco
+    print("DEBUG: Criando usuário no banco...")
+    # Adicionar embedding ao índice FAISS PRIMEIRO
+    print("DEBUG: Adicionando embedding ao FAISS...")
+    faiss_id = face_recognition.add_user_embedding(embedding, None)  # user_id será atualizado depois
+    print(f"DEBUG: Embedding adicionado ao FAISS com ID: {faiss_id}")
+
+    # Criar usuário no banco com o faiss_id correto
+    user = User(
+        name=name,
+        email=email,
+        embedding=encrypted_embedding,
+        faiss_id=faiss_id,
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    print(f"DEBUG: Usuário criado com ID: {user.id}, faiss_id: {faiss_id}")
+
+    # Atualizar mapeamento no FAISS com o user_id real
+    face_recognition.set_user_mapping(faiss_id, user.id)
+    print("DEBUG: Mapeamento FAISS atualizado com user_id")
+    return user.id
+
+
+def record_passage(db: Session, user_id: int) -> Optional[tuple]:
+    """Incrementa o contador de passagens; retorna (nome, passagens) ou None"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        return None
+    # Incrementar contador de passagens
+    user.passage_count += 1
+    db.commit()
+    return user.name, user.passage_count
+
+
+@app.get("/api/ready")
+async def readiness():
+    """Prontidão para receber tráfego (200) ou fase da inicialização em andamento (503)"""
+    status = face_recognition.readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
 @app.get("/")
 async def root():
     """API Root - Frontend agora é servido pelo Next.js"""
@@ -86,18 +198,21 @@ async def register_user(
                 status_code=400, detail="Formato de arquivo não suportado"
             )
 
+        require_face_recognition_ready()
+
         # Verificar tamanho
         content = await photo.read()
         if len(content) > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail="Arquivo muito grande")
 
         # Converter para imagem OpenCV
-        image = Image.open(io.BytesIO(content))
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        image_cv = await run_blocking(decode_upload_image, content)
 
         # Extrair embedding
         print("DEBUG: Extraindo embedding...")
-        embedding = face_recognition.extract_embedding(image_cv)
+        # Frame entra no lote de inferência junto com as validações em andamento
+        faces = await detect_in_batch(image_cv, max_faces=1)
+        embedding = faces[0]["embedding"] if faces else None
         if embedding is None:
             print("DEBUG: Erro - Nenhuma face detectada")
             raise HTTPException(
@@ -107,45 +222,20 @@ async def register_user(
 
         # Verificar se email já existe
         print("DEBUG: Verificando se email já existe...")
-        existing_user = db.query(User).filter(User.email == email).first()
+        existing_user = await run_blocking(
+            lambda: db.query(User).filter(User.email == email).first()
+        )
         if existing_user:
             print("DEBUG: Erro - Email já cadastrado")
             raise HTTPException(status_code=400, detail="Email já cadastrado")
         print("DEBUG: Email disponível")
 
-        # Criptografar embedding
-        print("DEBUG: Criptografando embedding...")
-        encrypted_embedding = encryption_manager.encrypt_embedding(embedding)
-        print("DEBUG: Embedding criptografado com sucesso")
-
-        # Criar usuário no banco
-        print("DEBUG: Criando usuário no banco...")
-        # Adicionar embedding ao índice FAISS PRIMEIRO
-        print("DEBUG: Adicionando embedding ao FAISS...")
-        faiss_id = face_recognition.add_user_embedding(embedding, None)  # user_id será atualizado depois
-        print(f"DEBUG: Embedding adicionado ao FAISS com ID: {faiss_id}")
-
-        # Criar usuário no banco com o faiss_id correto
-        user = User(
-            name=name,
-            email=email,
-            embedding_hash=encrypted_embedding,
-            faiss_id=faiss_id,
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        print(f"DEBUG: Usuário criado com ID: {user.id}, faiss_id: {faiss_id}")
-
-        # Atualizar mapeamento no FAISS com o user_id real
-        face_recognition.id_to_user[faiss_id] = user.id
-        face_recognition.save_faiss_index()
-        print("DEBUG: Mapeamento FAISS atualizado com user_id")
+        user_id = await run_blocking(create_user, db, name, email, embedding)
 
         return {
             "success": True,
             "message": "Usuário cadastrado com sucesso!",
-            "user_id": user.id,
+            "user_id": user_id,
         }
 
     except HTTPException:
@@ -165,28 +255,26 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
         if not image_data:
             raise HTTPException(status_code=400, detail="Imagem não fornecida")
 
-        # Decodificar imagem base64 de forma mais eficiente
-        try:
-            if "," in image_data:
-                image_bytes = base64.b64decode(image_data.split(",")[1])
-            else:
-                image_bytes = base64.b64decode(image_data)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="Formato de imagem inválido")
+        require_face_recognition_ready()
 
-        # Converter para imagem OpenCV de forma otimizada
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            # Redimensionar se muito grande para melhor performance
-            if image.width > 800 or image.height > 600:
-                image.thumbnail((800, 600), Image.Resampling.LANCZOS)
-            image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="Erro ao processar imagem")
+        # Decodificar imagem base64 e converter para OpenCV (fora do event loop)
+        image_cv = await run_blocking(decode_validation_image, image_data)
 
         # Detectar faces com timeout implícito
+        # Só com session_id do cliente a sessão (câmera) guarda o tamanho da
+        # face para o próximo frame e a identidade confirmada é reaproveitada
+        # sem busca no FAISS (se o embedding continuar próximo dos vetores do
+        # usuário); o IP não identifica a câmera (várias atrás do mesmo NAT
+        # ou proxy dividiriam a mesma trilha)
+        session_id = data.get("session_id") or None
+        tracking = session_id is not None
         try:
-            faces = face_recognition.detect_faces(image_cv)
+            # Só a melhor face (maior det_score) passa pelo reconhecimento
+            faces = await detect_in_batch(
+                image_cv, max_faces=1, session_id=session_id, track=tracking
+            )
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Erro na detecção de faces: {e}")
             faces = []
@@ -201,8 +289,8 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
                 error_message="Nenhuma face detectada",
             )
             db.add(log)
-            # Usar commit assíncrono para não bloquear
-            db.commit()
+            # Commit no executor para não bloquear o event loop
+            await run_blocking(db.commit)
 
             return {
                 "success": False,
@@ -213,10 +301,11 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
                 "user_id": None,
             }
 
-        # Pegar melhor face (otimizado)
-        best_face = max(faces, key=lambda x: x.get("det_score", 0))
+        best_face = faces[0]
         embedding = best_face.get("embedding")
         bbox = best_face.get("bbox")
+        track = best_face.get("track")
+        tracked = track is not None
 
         if embedding is None:
             return {
@@ -232,21 +321,41 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
         liveness_passed = True
 
         # Reconhecer face com tratamento de erro
-        try:
-            print(f"🔍 DEBUG VALIDATE: Iniciando reconhecimento facial...")
-            print(f"🔍 DEBUG VALIDATE: Índice FAISS tem {face_recognition.faiss_index.ntotal if face_recognition.faiss_index else 0} embeddings")
-            print(f"🔍 DEBUG VALIDATE: Mapeamento tem {len(face_recognition.id_to_user)} usuários: {list(face_recognition.id_to_user.keys())}")
-            user_id, distance = face_recognition.recognize_face(embedding)
-            print(f"🔍 DEBUG VALIDATE: Resultado - user_id={user_id}, distance={distance}")
-        except Exception as e:
-            print(f"❌ Erro no reconhecimento: {e}")
-            import traceback
-            traceback.print_exc()
-            user_id, distance = None, 1.0
+        if tracked:
+            # Mesma face do frame anterior e embedding conferido com os vetores
+            # do usuário da trilha: sem busca no FAISS
+            user_id, distance = track["user_id"], track["distance"]
+            print(f"🔍 DEBUG VALIDATE: Trilha {track['track_id']} - user_id={user_id}, distance={distance}")
+            if not await run_blocking(face_recognition.is_user_in_gallery, user_id):
+                # Usuário removido durante a trilha: a trilha recomeça e o frame
+                # passa pelo reconhecimento completo
+                print(f"⚠️  Usuário {user_id} removido da galeria, trilha {track['track_id']} descartada")
+                face_recognition.face_tracker.drop(session_id)
+                tracked = False
+        if not tracked:
+            try:
+                print(f"🔍 DEBUG VALIDATE: Iniciando reconhecimento facial...")
+                print(f"🔍 DEBUG VALIDATE: Índice FAISS tem {face_recognition.faiss_index.ntotal if face_recognition.faiss_index else 0} embeddings")
+                print(f"🔍 DEBUG VALIDATE: Mapeamento tem {len(face_recognition.id_to_user)} usuários")
+                user_id, distance = await run_blocking(face_recognition.recognize_face, embedding)
+                print(f"🔍 DEBUG VALIDATE: Resultado - user_id={user_id}, distance={distance}")
+            except HTTPException:
+                raise
+            except Exception as e:
+                print(f"❌ Erro no reconhecimento: {e}")
+                import traceback
+                traceback.print_exc()
+                user_id, distance = None, 1.0
 
         # Determinar se acesso foi concedido
         access_granted = user_id is not None and liveness_passed and distance < 0.6
 
+        if tracking and not tracked:
+            # Reconhecimento completo confirma, troca ou descarta a identidade da trilha
+            track = await run_blocking(
+                face_recognition.verify_track, session_id, bbox, user_id if access_granted else None, distance
+            )
+
         # Preparar resposta básica
         response = {
             "success": True,
@@ -255,22 +364,24 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
             "confidence": float(1.0 - distance) if user_id else 0.0,
             "user_id": int(user_id) if user_id else None,
             "user_name": None,
+            "det_size": best_face.get("det_size"),
+            "track_id": track["track_id"] if track else None,
+            "tracked": tracked,
         }
 
         # Processar acesso concedido
         if access_granted:
             try:
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    # Incrementar contador de passagens
-                    user.passage_count += 1
-                    db.commit()
-
-                    response["message"] = f"Acesso liberado para {user.name}!"
-                    response["user_name"] = user.name
-                    response["passage_count"] = user.passage_count
+                # Toda validação com acesso liberado conta uma passagem, com ou
+                # sem trilha (as estatísticas de passagem contam validações)
+                passage = await run_blocking(record_passage, db, user_id)
+                if passage:
+                    user_name, passage_count = passage
+                    response["message"] = f"Acesso liberado para {user_name}!"
+                    response["user_name"] = user_name
+                    response["passage_count"] = passage_count
                     print(
-                        f"✅ Usuário reconhecido: {user.name} (ID: {user_id}) - Passagem #{user.passage_count}"
+                        f"✅ Usuário reconhecido: {user_name} (ID: {user_id}) - Passagem #{passage_count}"
                     )
                 else:
                     response["access_granted"] = False
@@ -296,7 +407,7 @@ async def validate_face(request: Request, db: Session = Depends(get_db)):
                 user_agent=request.headers.get("user-agent"),
             )
             db.add(log)
-            db.commit()
+            await run_blocking(db.commit)
         except Exception as e:
             print(f"Erro ao salvar log: {e}")
 
@@ -455,6 +566,7 @@ async def get_stats(db: Session = Depends(get_db)):
                     (successful_access / total_logs * 100) if total_logs > 0 else 0
                 ),
                 "face_recognition": face_stats,
+                "executor": blocking_executor.stats(),
             },
         }
 
@@ -471,11 +583,11 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
         # Remover do índice FAISS
-        face_recognition.remove_user_embedding(user.faiss_id)
+        await run_blocking(face_recognition.remove_user_embedding, user.faiss_id)
 
         # Marcar como inativo no banco
         user.is_active = False
-        db.commit()
+        await run_blocking(db.commit)
 
         return {"success": True, "message": "Usuário removido com sucesso"}
 
@@ -499,16 +611,16 @@ async def delete_all_users(db: Session = Depends(get_db)):
                 "deleted_count": 0,
             }
 
-        # Remover todos do índice FAISS
-        for user in users:
-            if user.faiss_id > 0:
-                face_recognition.remove_user_embedding(user.faiss_id)
+        # Remover todos do índice FAISS (uma só atualização do seletor de busca)
+        await run_blocking(
+            face_recognition.remove_user_embeddings, [user.faiss_id for user in users]
+        )
 
         # Marcar todos como inativos
         for user in users:
             user.is_active = False
 
-        db.commit()
+        await run_blocking(db.commit)
 
         return {
             "success": True,
@@ -516,6 +628,22 @@ async def delete_all_users(db: Session = Depends(get_db)):
             "deleted_count": len(users),
         }
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+
+@app.post("/api/admin/reconcile")
+async def reconcile_index(full: bool = False):
+    """Reconcilia o índice FAISS com o banco aplicando só as diferenças"""
+    require_face_recognition_ready()
+    try:
+        summary = await run_blocking(face_recognition.reconcile_with_database, full)
+        return {"success": True, "reconciliation": summary}
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
@@ -0,0 +1,250 @@
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+
+class _CalibrationReader:
+    """Entrega as entradas de calibração ao quantize_static, uma por vez"""
+
+    def __init__(self, input_name: str, blobs: List[np.ndarray]):
+        self._inputs = iter([{input_name: blob} for blob in blobs])
+
+    def get_next(self):
+        return next(self._inputs, None)
+
+
+def detection_blob(det_model, image: np.ndarray, det_size: int) -> np.ndarray:
+    """Entrada do detector como o SCRFD monta em detect (redimensiona e completa o quadrado)"""
+    scale = min(det_size / image.shape[0], det_size / image.shape[1])
+    resized = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)))
+    det_img = np.zeros((det_size, det_size, 3), dtype=np.uint8)
+    det_img[: resized.shape[0], : resized.shape[1], :] = resized
+    return cv2.dnn.blobFromImage(
+        det_img,
+        1.0 / det_model.input_std,
+        (det_size, det_size),
+        (det_model.input_mean,) * 3,
+        swapRB=True,
+    )
+
+
+def recognition_blob(rec_model, crops: List[np.ndarray]) -> np.ndarray:
+    """Entrada do reconhecimento para faces alinhadas (como ArcFaceONNX.get_feat)"""
+    return cv2.dnn.blobFromImages(
+        crops,
+        1.0 / rec_model.input_std,
+        tuple(rec_model.input_size),
+        (rec_model.input_mean,) * 3,
+        swapRB=True,
+    )
+
+
+def aligned_crops(face_app, images: List[np.ndarray], det_size: int) -> List[List[np.ndarray]]:
+    """Faces alinhadas (112x112) de cada imagem, detectadas pelo modelo FP32"""
+    from insightface.utils import face_align
+
+    rec_model = face_app.models["recognition"]
+    crops = []
+    for image in images:
+        _, kpss = face_app.det_model.detect(
+            image, input_size=(det_size, det_size), max_num=0, metric="default"
+        )
+        crops.append(
+            [
+                face_align.norm_crop(image, landmark=kps, image_size=rec_model.input_size[0])
+                for kps in (kpss if kpss is not None else [])
+            ]
+        )
+    return crops
+
+
+def calibration_blobs(face_app, taskname: str, images: List[np.ndarray], det_size: int) -> List[np.ndarray]:
+    """Entradas reais de cada modelo para a quantização estática"""
+    if taskname == "detection":
+        return [detection_blob(face_app.det_model, image, det_size) for image in images]
+    rec_model = face_app.models["recognition"]
+    return [
+        recognition_blob(rec_model, [crop])
+        for image_crops in aligned_crops(face_app, images, det_size)
+        for crop in image_crops
+    ]
+
+
+def quantize_model(model_file: str, output_file: Path, mode: str, calibration: List[np.ndarray] = None, input_name: str = None):
+    """Gera a versão INT8 de um modelo ONNX
+
+    dynamic: só os pesos são quantizados, as ativações são quantizadas em
+    tempo de execução (não precisa de imagens). static: pesos e ativações
+    em INT8 no formato QDQ, com as escalas calibradas em entradas reais
+    (normalmente mais rápido na CPU que o dynamic nos modelos convolucionais).
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Modo de quantização inválido: {mode}")
+
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if mode == "dynamic":
+        # ConvInteger do ONNX Runtime na CPU só aceita pesos uint8
+        quantize_dynamic(model_file, str(output_file), weight_type=QuantType.QUInt8)
+        return
+
+    if not calibration:
+        raise ValueError("Quantização estática precisa de imagens de calibração com faces")
+    quantize_static(
+        model_file,
+        str(output_file),
+        _CalibrationReader(input_name, calibration),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def _box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def _timed(func, runs: int) -> tuple:
+    """Resultado da primeira execução (depois do aquecimento) e latências em ms"""
+    func()
+    result = None
+    timings = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        output = func()
+        timings.append((time.perf_counter() - start) * 1000)
+        result = output if result is None else result
+    return result, timings
+
+
+def _latency(timings: List[float]) -> dict:
+    return {"mean_ms": float(np.mean(timings)), "p95_ms": float(np.percentile(timings, 95))}
+
+
+def compare_detection(det_model, fp32_session, int8_session, images: List[np.ndarray], det_size: int, runs: int) -> dict:
+    """Faces encontradas, IoU das caixas e latência do detector INT8 contra o FP32"""
+    reports = {}
+    boxes = {}
+    for label, session in (("fp32", fp32_session), ("int8", int8_session)):
+        det_model.session = session
+        timings = []
+        boxes[label] = []
+        for image in images:
+            bboxes, timing = _timed(
+                lambda: det_model.detect(image, input_size=(det_size, det_size), max_num=0, metric="default")[0],
+                runs,
+            )
+            boxes[label].append(bboxes)
+            timings.extend(timing)
+        reports[label] = _latency(timings)
+    det_model.session = fp32_session
+
+    ious = []
+    fp32_faces = int8_faces = matched = 0
+    for reference, candidate in zip(boxes["fp32"], boxes["int8"]):
+        fp32_faces += len(reference)
+        int8_faces += len(candidate)
+        available = np.ones(len(candidate), dtype=bool)
+        for box in reference:
+            if not available.any():
+                break
+            overlaps = np.where(available, _box_iou(box, candidate), -1.0)
+            best = int(np.argmax(overlaps))
+            if overlaps[best] >= 0.5:
+                available[best] = False
+                matched += 1
+                ious.append(float(overlaps[best]))
+
+    return {
+        "fp32": reports["fp32"],
+        "int8": reports["int8"],
+        "fp32_faces": fp32_faces,
+        "int8_faces": int8_faces,
+        "recall": matched / fp32_faces if fp32_faces else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "speedup": reports["fp32"]["mean_ms"] / max(reports["int8"]["mean_ms"], 1e-9),
+    }
+
+
+def compare_recognition(rec_model, fp32_session, int8_session, crops: List[List[np.ndarray]], threshold: float, runs: int) -> dict:
+    """Similaridade dos embeddings INT8 com os FP32 e decisões de reconhecimento alteradas
+
+    As mesmas faces alinhadas passam pelos dois modelos. Além do cosseno
+    entre o embedding FP32 e o INT8 de cada face, compara a decisão
+    (distância <= threshold) entre todos os pares de faces nas duas versões.
+    """
+    embeddings = {}
+    reports = {}
+    for label, session in (("fp32", fp32_session), ("int8", int8_session)):
+        rec_model.session = session
+        timings = []
+        features = []
+        for image_crops in crops:
+            if not image_crops:
+                continue
+            feature, timing = _timed(lambda: rec_model.get_feat(image_crops), runs)
+            features.append(feature)
+            timings.extend(timing)
+        embeddings[label] = np.vstack(features) if features else np.zeros((0, 1), dtype=np.float32)
+        reports[label] = _latency(timings) if timings else {"mean_ms": 0.0, "p95_ms": 0.0}
+    rec_model.session = fp32_session
+
+    normalized = {
+        label: values / np.maximum(np.linalg.norm(values, axis=1, keepdims=True), 1e-12)
+        for label, values in embeddings.items()
+    }
+    cosines = np.sum(normalized["fp32"] * normalized["int8"], axis=1)
+
+    faces = len(cosines)
+    pairs = flipped = 0
+    if faces > 1:
+        upper = np.triu_indices(faces, k=1)
+        accepted = {
+            label: (1.0 - values @ values.T)[upper] <= threshold for label, values in normalized.items()
+        }
+        pairs = len(accepted["fp32"])
+        flipped = int(np.count_nonzero(accepted["fp32"] != accepted["int8"]))
+
+    return {
+        "fp32": reports["fp32"],
+        "int8": reports["int8"],
+        "faces": faces,
+        "mean_cosine": float(np.mean(cosines)) if faces else 0.0,
+        "min_cosine": float(np.min(cosines)) if faces else 0.0,
+        "pairs": pairs,
+        "flipped_decisions": flipped,
+        "speedup": reports["fp32"]["mean_ms"] / max(reports["int8"]["mean_ms"], 1e-9),
+    }
+
+
+def compare_models(face_app, quantized: Dict[str, Path], images: List[np.ndarray], det_size: int, threshold: float, runs: int = 10) -> dict:
+    """Relatório de precisão e latência dos modelos INT8 contra os FP32 carregados em face_app"""
+    import onnxruntime as ort
+
+    report = {}
+    crops = aligned_crops(face_app, images, det_size)
+    for taskname, quantized_file in quantized.items():
+        model = face_app.models[taskname]
+        fp32_session = model.session
+        int8_session = ort.InferenceSession(str(quantized_file), providers=["CPUExecutionProvider"])
+        if taskname == "detection":
+            report[taskname] = compare_detection(model, fp32_session, int8_session, images, det_size, runs)
+        else:
+            report[taskname] = compare_recognition(model, fp32_session, int8_session, crops, threshold, runs)
+        report[taskname]["model"] = Path(quantized_file).name
+    return report
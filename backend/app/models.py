@@ -6,6 +6,9 @@ from sqlalchemy import (
     Float,
     Text,
     Boolean,
+    LargeBinary,
+    event,
+    inspect,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -19,13 +22,37 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     email = Column(String(100), unique=True, index=True)
-    embedding_hash = Column(Text, nullable=False)  # Embedding criptografado
+    embedding_hash = Column(
+        Text, nullable=False, default=""
+    )  # Embedding criptografado no formato antigo (texto); vazio nos cadastros novos
+    embedding = Column(
+        LargeBinary, nullable=True
+    )  # Embedding criptografado (envelope binário AES-GCM)
     faiss_id = Column(Integer, nullable=False)  # ID no índice FAISS
     passage_count = Column(Integer, default=0)  # Contador de passagens
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, index=True
+    )  # Última alteração do que o índice usa (reconciliação incremental banco ↔ índice)
     is_active = Column(Boolean, default=True)
 
 
+# Colunas que a reconciliação compara com o índice FAISS
+INDEXED_COLUMNS = ("embedding", "embedding_hash", "faiss_id", "is_active")
+
+
+@event.listens_for(User, "before_update")
+def _touch_updated_at(mapper, connection, target):
+    """updated_at só muda com embedding, faiss_id ou is_active
+
+    Com onupdate cada passagem (passage_count) avançaria updated_at e a
+    reconciliação voltaria a conferir todo usuário validado recentemente.
+    """
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in INDEXED_COLUMNS):
+        target.updated_at = datetime.utcnow()
+
+
 class AccessLog(Base):
     __tablename__ = "access_logs"
 
@@ -41,7 +68,7 @@ class AccessLog(Base):
 
 
 # Criar tabelas
-def create_tables():
+def create_tables(engine):
     Base.metadata.create_all(bind=engine)
 
 
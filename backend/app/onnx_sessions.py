@@ -0,0 +1,223 @@
+import hashlib
+import os
+import platform
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import (
+    INSIGHTFACE_INT8_MODELS,
+    ONNX_CPU_MEM_ARENA,
+    ONNX_EXECUTION_MODE,
+    ONNX_GRAPH_OPTIMIZATION,
+    ONNX_INTER_OP_THREADS,
+    ONNX_INTRA_OP_THREADS,
+    ONNX_MODEL_SESSION_OPTIONS,
+    ONNX_OPTIMIZED_CACHE,
+    ONNX_OPTIMIZED_CACHE_DIR,
+    QUANTIZED_MODELS_DIR,
+)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+EXECUTION_MODES = {"sequential": "ORT_SEQUENTIAL", "parallel": "ORT_PARALLEL"}
+
+
+def session_settings(taskname: str) -> dict:
+    """Opções da sessão de um modelo: padrões ONNX_* com os ajustes de ONNX_MODEL_SESSION_OPTIONS"""
+    settings = {
+        "intra_op_threads": ONNX_INTRA_OP_THREADS,
+        "inter_op_threads": ONNX_INTER_OP_THREADS,
+        "graph_optimization": ONNX_GRAPH_OPTIMIZATION,
+        "execution_mode": ONNX_EXECUTION_MODE,
+        "cpu_mem_arena": ONNX_CPU_MEM_ARENA,
+    }
+    overrides = ONNX_MODEL_SESSION_OPTIONS.get(taskname, {})
+    unknown = set(overrides) - set(settings)
+    if unknown:
+        raise ValueError(f"Opções de sessão desconhecidas para {taskname}: {sorted(unknown)}")
+    settings.update(overrides)
+
+    if settings["graph_optimization"] not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Otimização de grafo inválida: {settings['graph_optimization']}")
+    if settings["execution_mode"] not in EXECUTION_MODES:
+        raise ValueError(f"Modo de execução inválido: {settings['execution_mode']}")
+    return settings
+
+
+def build_session_options(settings: dict):
+    """Converte as opções de session_settings em onnxruntime.SessionOptions"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(settings["intra_op_threads"])
+    options.inter_op_num_threads = int(settings["inter_op_threads"])
+    options.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[settings["graph_optimization"]]
+    )
+    options.execution_mode = getattr(ort.ExecutionMode, EXECUTION_MODES[settings["execution_mode"]])
+    options.enable_cpu_mem_arena = bool(settings["cpu_mem_arena"])
+    return options
+
+
+def quantized_model_path(model_file: str, pack: str) -> Path:
+    """Arquivo da versão INT8 de um modelo do pacote (gerado por scripts/quantize_models.py)"""
+    return QUANTIZED_MODELS_DIR / pack / f"{Path(model_file).stem}.int8.onnx"
+
+
+def _model_hash(model_file: str) -> str:
+    """SHA-256 do conteúdo do modelo (o cache vale enquanto o arquivo não mudar)"""
+    digest = hashlib.sha256()
+    with open(model_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _cpu_signature() -> str:
+    """Identifica o conjunto de instruções da CPU (flags do /proc/cpuinfo no Linux)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line for line in f if line.startswith("flags")), "")
+    except OSError:
+        flags = ""
+    description = f"{platform.machine()} {flags or platform.processor()}"
+    return f"{platform.machine().lower()}.{hashlib.sha256(description.encode()).hexdigest()[:8]}"
+
+
+def optimized_model_path(model_file: str, providers: List[str], settings: dict) -> Path:
+    """Arquivo do grafo otimizado de um modelo no cache
+
+    A chave inclui o hash do modelo, o provider principal, o nível de
+    otimização, a versão do ONNX Runtime e as instruções da CPU: os grafos
+    otimizados trazem nós fundidos e layouts específicos de cada um.
+    """
+    import onnxruntime as ort
+
+    key = "-".join(
+        [
+            _model_hash(model_file),
+            providers[0].replace("ExecutionProvider", "").lower(),
+            settings["graph_optimization"],
+            ort.__version__,
+            _cpu_signature(),
+        ]
+    )
+    return ONNX_OPTIMIZED_CACHE_DIR / f"{Path(model_file).stem}-{key}.onnx"
+
+
+def create_session(model_file: str, settings: dict, providers: List[str]) -> tuple:
+    """Sessão ONNX Runtime, reaproveitando o grafo otimizado do cache
+
+    Na primeira carga o ONNX Runtime grava o grafo otimizado (arquivo
+    temporário renomeado no fim, seguro com vários processos); nas seguintes
+    o grafo do cache é aberto sem otimizar de novo.
+
+    Returns:
+        (sessão, "hit", "miss" ou "off")
+    """
+    import onnxruntime as ort
+
+    if not ONNX_OPTIMIZED_CACHE or settings["graph_optimization"] == "disable":
+        options = build_session_options(settings)
+        return ort.InferenceSession(model_file, sess_options=options, providers=providers), "off"
+
+    cached = optimized_model_path(model_file, providers, settings)
+    if cached.exists():
+        options = build_session_options(settings)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return ort.InferenceSession(str(cached), sess_options=options, providers=providers), "hit"
+        except Exception as e:
+            print(f"⚠️  Grafo otimizado inválido ({cached.name}), otimizando de novo: {e}")
+            cached.unlink(missing_ok=True)
+
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    temporary = cached.with_name(f".{cached.stem}.{os.getpid()}.onnx")
+    options = build_session_options(settings)
+    options.optimized_model_filepath = str(temporary)
+    try:
+        session = ort.InferenceSession(model_file, sess_options=options, providers=providers)
+    except Exception as e:
+        # Alguns providers não permitem salvar o grafo otimizado
+        print(f"⚠️  Grafo otimizado de {Path(model_file).name} não salvo: {e}")
+        temporary.unlink(missing_ok=True)
+        options = build_session_options(settings)
+        return ort.InferenceSession(model_file, sess_options=options, providers=providers), "off"
+    if temporary.exists():
+        os.replace(temporary, cached)
+    return session, "miss"
+
+
+def configure_sessions(face_app, pack: str) -> Dict[str, dict]:
+    """Recria a sessão ONNX de cada modelo com as opções configuradas
+
+    O FaceAnalysis só repassa providers ao ONNX Runtime; aqui cada modelo
+    ganha threads, otimização de grafo, modo de execução e arena de memória
+    próprios (vários workers na mesma máquina não disputam todos os núcleos).
+    Os modelos de INSIGHTFACE_INT8_MODELS trocam para a versão quantizada,
+    que tem as mesmas entradas e saídas do FP32 (só na CPU: com CUDA o FP32
+    continua mais rápido). Os grafos otimizados ficam em cache
+    (ONNX_OPTIMIZED_CACHE_DIR).
+
+    Returns:
+        {taskname: opções aplicadas, "model" (arquivo carregado) e
+        "optimized_cache" (hit, miss ou off)}
+    """
+    applied = {}
+    for taskname, model in face_app.models.items():
+        settings = session_settings(taskname)
+        providers = model.session.get_providers()
+        model_file = model.model_file
+
+        if taskname in INSIGHTFACE_INT8_MODELS:
+            quantized = quantized_model_path(model_file, pack)
+            if "CUDAExecutionProvider" in providers:
+                print(f"⚠️  {taskname}: modelo INT8 ignorado na GPU, usando FP32")
+            elif not quantized.exists():
+                print(f"⚠️  {taskname}: {quantized} não encontrado, usando FP32")
+            else:
+                model_file = str(quantized)
+
+        model.session, cache = create_session(model_file, settings, providers)
+        model.model_file = model_file
+        applied[taskname] = {"model": os.path.basename(model_file), "optimized_cache": cache, **settings}
+    return applied
+
+
+def load_face_analysis(pack: str, allowed_modules: Optional[List[str]], providers: List[str]):
+    """Cria o FaceAnalysis sem otimizar os grafos
+
+    O FaceAnalysis abre cada modelo do pacote só para identificar a tarefa
+    (detecção, reconhecimento...) e repassa apenas providers ao ONNX Runtime.
+    Essas sessões são criadas sem otimização de grafo: configure_sessions
+    cria as definitivas (com o grafo otimizado do cache), e a carga não paga
+    a otimização duas vezes.
+    """
+    import onnxruntime as ort
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo import model_zoo
+
+    routing_options = ort.SessionOptions()
+    routing_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    original_session = model_zoo.PickableInferenceSession
+
+    class _RoutingSession(original_session):
+        def __init__(self, model_path, **kwargs):
+            kwargs.setdefault("sess_options", routing_options)
+            super().__init__(model_path, **kwargs)
+
+    model_zoo.PickableInferenceSession = _RoutingSession
+    try:
+        return FaceAnalysis(name=pack, allowed_modules=allowed_modules, providers=providers)
+    finally:
+        model_zoo.PickableInferenceSession = original_session
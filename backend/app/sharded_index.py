@@ -0,0 +1,144 @@
+import faiss
+import numpy as np
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from app.index_factory import (
+    build_index,
+    copy_search_params,
+    index_compression,
+    index_kind,
+    merge_search_results,
+    new_index,
+)
+
+# Pools de threads compartilhados por número de shards (o FAISS libera o GIL
+# durante a busca, então os shards são pesquisados em paralelo)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(n_shards: int) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(n_shards)
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=n_shards, thread_name_prefix="faiss-shard"
+            )
+            _pools[n_shards] = pool
+        return pool
+
+
+def shard_of(ids: np.ndarray, n_shards: int) -> np.ndarray:
+    """Shard de cada faiss_id (faiss_id % n_shards: cadastros alternam entre shards)"""
+    return np.asarray(ids, dtype=np.int64) % n_shards
+
+
+class ShardedIndex:
+    """Galeria dividida em K shards por faiss_id, com busca paralela e merge do top-k
+
+    Cada shard é um índice da galeria completo (FlatIP/IVF/HNSW, em heap ou
+    LayeredIndex mapeado em memória), salvo em arquivo próprio e montado de
+    forma independente. Expõe a parte da API de índice FAISS usada pela galeria.
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self.d = self.shards[0].d
+        self.is_trained = True
+
+    @property
+    def base(self):
+        """Índice FAISS representativo (tipo e compressão são iguais em todos os shards)"""
+        shard = self.shards[0]
+        return getattr(shard, "base", shard)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        targets = shard_of(ids, len(self.shards))
+        for shard_id, shard in enumerate(self.shards):
+            mask = targets == shard_id
+            if np.any(mask):
+                shard.add_with_ids(vectors[mask], ids[mask])
+
+    def search(self, queries: np.ndarray, k: int, params=None):
+        """Busca em todos os shards em paralelo e junta os k melhores de cada consulta"""
+        pool = _get_pool(len(self.shards))
+        futures = [
+            pool.submit(shard.search, queries, k, params=copy_search_params(params))
+            for shard in self.shards
+            if shard.ntotal > 0
+        ]
+        if not futures:
+            return self.shards[0].search(queries, k, params=params)
+        return merge_search_results([future.result() for future in futures], k)
+
+    def get_ids(self) -> np.ndarray:
+        """faiss_ids de todos os shards (em ordem de shard)"""
+        return np.concatenate(
+            [
+                shard.get_ids()
+                if hasattr(shard, "get_ids")
+                else faiss.vector_to_array(shard.id_map)
+                for shard in self.shards
+            ]
+        )
+
+
+def new_sharded_index(n_shards: int, kind: str = "flat"):
+    """Índice vazio da galeria: único (n_shards == 1) ou dividido em shards"""
+    if n_shards <= 1:
+        return new_index(kind)
+    return ShardedIndex([new_index(kind) for _ in range(n_shards)])
+
+
+def build_sharded_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    kind: str = "flat",
+    compression: str = "none",
+    n_shards: int = 1,
+):
+    """Monta a galeria com build_index, dividida em n_shards montados em paralelo"""
+    if n_shards <= 1:
+        return build_index(vectors, ids, kind, compression)
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    targets = shard_of(ids, n_shards)
+
+    # Pool próprio: a montagem é longa e não deve ocupar as threads de busca
+    with ThreadPoolExecutor(max_workers=n_shards, thread_name_prefix="faiss-build") as pool:
+        futures = [
+            pool.submit(
+                build_index,
+                vectors[targets == shard_id],
+                ids[targets == shard_id],
+                kind,
+                compression,
+            )
+            for shard_id in range(n_shards)
+        ]
+        shards = [future.result() for future in futures]
+
+    # Shards pequenos demais para IVF/PQ caem para FlatIP em build_index:
+    # manter o mesmo tipo em todos para que os parâmetros de busca sirvam a todos
+    specs = {(index_kind(shard), index_compression(shard)) for shard in shards}
+    if len(specs) > 1:
+        shards = [
+            build_index(vectors[targets == shard_id], ids[targets == shard_id], "flat")
+            for shard_id in range(n_shards)
+        ]
+    return ShardedIndex(shards)
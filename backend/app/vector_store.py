@@ -0,0 +1,126 @@
+import numpy as np
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Adicionar o diretório raiz do projeto ao path
+project_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, project_root)
+from config import EMBEDDING_DIMENSION
+
+# Capacidade mínima (em linhas) ao criar ou crescer o arquivo
+MIN_CAPACITY = 1024
+
+
+class EmbeddingStore:
+    """Vetores exatos (float32 normalizados) da galeria em arquivo memory-mapped
+
+    A linha i do arquivo guarda o embedding de faiss_id == i. Como os faiss_ids
+    são sequenciais, o arquivo só cresce no fim; linhas nunca escritas ficam
+    zeradas. As páginas ficam no page cache do SO, compartilhadas entre os
+    workers, e só as linhas consultadas (candidatos da busca) são lidas.
+    """
+
+    def __init__(self, path: Path, dimension: int = EMBEDDING_DIMENSION):
+        self.path = Path(path)
+        self.dimension = dimension
+        self._row_bytes = dimension * np.dtype(np.float32).itemsize
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._inode = None
+        self._open()
+
+    def _open(self):
+        """Mapeia o arquivo existente (se houver) em memória"""
+        if self.path.exists() and self.path.stat().st_size >= self._row_bytes:
+            stat = self.path.stat()
+            rows = stat.st_size // self._row_bytes
+            self._vectors = np.memmap(
+                self.path, dtype=np.float32, mode="r+", shape=(rows, self.dimension)
+            )
+            self._inode = stat.st_ino
+        else:
+            self._vectors = None
+            self._inode = None
+
+    @property
+    def capacity(self) -> int:
+        """Número de linhas (faiss_ids) que cabem no arquivo atual"""
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    def _ensure_capacity(self, rows: int):
+        """Cresce o arquivo (dobrando) para caber pelo menos `rows` linhas"""
+        if rows <= self.capacity:
+            return
+
+        new_capacity = max(rows, self.capacity * 2, MIN_CAPACITY)
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self.path, "ab") as f:
+            # Outro worker pode já ter crescido o arquivo: nunca encolher
+            if f.tell() < new_capacity * self._row_bytes:
+                f.truncate(new_capacity * self._row_bytes)
+        self._open()
+
+    def refresh(self):
+        """Remapeia o arquivo se outro worker o cresceu ou recriou"""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._vectors = None
+                return
+            if (
+                stat.st_ino != self._inode
+                or stat.st_size != self.capacity * self._row_bytes
+            ):
+                self._open()
+
+    def put(self, ids: np.ndarray, vectors: np.ndarray):
+        """Grava os vetores nas linhas dos faiss_ids informados"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        with self._lock:
+            self._ensure_capacity(int(ids.max()) + 1)
+            self._vectors[ids] = vectors
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Lê os vetores dos faiss_ids informados (cópia em memória)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = self._vectors
+        if vectors is None:
+            return np.zeros(ids.shape + (self.dimension,), dtype=np.float32)
+        return np.asarray(vectors[ids])
+
+    def covers(self, ids: np.ndarray, sample_size: int = 1024) -> bool:
+        """Verifica se os faiss_ids têm vetor gravado
+
+        Confere o tamanho do arquivo e uma amostra das linhas, para não ler a
+        galeria inteira do disco na inicialização.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return True
+        if int(ids.max()) >= self.capacity:
+            return False
+        if len(ids) > sample_size:
+            ids = np.random.default_rng(0).choice(ids, sample_size, replace=False)
+        return bool(np.all(np.any(self.get(np.sort(ids)) != 0, axis=1)))
+
+    def flush(self):
+        """Garante que as linhas escritas cheguem ao disco"""
+        if self._vectors is not None:
+            self._vectors.flush()
+
+    def clear(self):
+        """Remove todos os vetores"""
+        with self._lock:
+            self._vectors = None
+            self._inode = None
+            if self.path.exists():
+                self.path.unlink()
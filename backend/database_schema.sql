@@ -6,10 +6,12 @@ CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     email VARCHAR(100) UNIQUE NOT NULL,
-    embedding_hash TEXT NOT NULL,
+    embedding_hash TEXT NOT NULL DEFAULT '',
+    embedding BYTEA,
     faiss_id INTEGER NOT NULL,
     passage_count INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_active BOOLEAN DEFAULT TRUE
 );
 
@@ -19,6 +21,9 @@ CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 -- Criar índice no faiss_id
 CREATE INDEX IF NOT EXISTS idx_users_faiss_id ON users(faiss_id);
 
+-- Criar índice no updated_at (reconciliação incremental com o índice FAISS)
+CREATE INDEX IF NOT EXISTS ix_users_updated_at ON users(updated_at);
+
 -- Tabela de logs de acesso
 CREATE TABLE IF NOT EXISTS access_logs (
     id SERIAL PRIMARY KEY,
@@ -42,7 +47,9 @@ CREATE INDEX IF NOT EXISTS idx_access_logs_access_granted ON access_logs(access_
 COMMENT ON TABLE users IS 'Tabela de usuários cadastrados no sistema';
 COMMENT ON TABLE access_logs IS 'Logs de tentativas de acesso ao sistema';
 
-COMMENT ON COLUMN users.embedding_hash IS 'Embedding facial criptografado';
+COMMENT ON COLUMN users.embedding_hash IS 'Embedding facial criptografado (formato antigo, texto base64; vazio nos cadastros novos)';
+COMMENT ON COLUMN users.embedding IS 'Embedding facial criptografado (envelope binário AES-GCM, float32/float16)';
 COMMENT ON COLUMN users.faiss_id IS 'ID correspondente no índice FAISS';
 COMMENT ON COLUMN users.passage_count IS 'Contador de passagens bem-sucedidas';
+COMMENT ON COLUMN users.updated_at IS 'Última alteração do usuário (marca d''água da reconciliação com o índice)';
 
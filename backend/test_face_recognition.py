@@ -6,6 +6,12 @@ Script de teste para verificar se o reconhecimento facial está funcionando
 
 import sys
 import os
+import asyncio
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
 
 # Adicionar o diretório raiz do projeto ao path
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +31,9 @@ def test_face_recognition():
     """Testa o sistema de reconhecimento facial"""
     print("Testando sistema de reconhecimento facial...")
 
+    # Modelos e índice carregam em background
+    face_recognition.wait_until_ready()
+
     try:
         # Verificar se há usuários cadastrados
         db = next(get_db())
@@ -57,6 +66,1572 @@ def test_face_recognition():
         return False
 
 
+@contextmanager
+def isolated_gallery(workers=1):
+    """Galerias em um diretório temporário, com banco SQLite próprio
+
+    Cada item é um FaceRecognitionSystem (um "worker") sobre o mesmo
+    diretório; os modelos já carregados são compartilhados. Nada é gravado no
+    índice nem no banco de produção.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.face_recognition import FaceRecognitionSystem
+    from app.models import Base
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_dir = Path(tmp_dir) / "faiss_index"
+        index_dir.mkdir()
+        engine = create_engine(f"sqlite:///{tmp_dir}/test.db")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        systems = []
+        try:
+            for _ in range(workers):
+                system = FaceRecognitionSystem(
+                    index_dir=index_dir,
+                    pipeline=face_recognition.pipeline,
+                    session_factory=session_factory,
+                )
+                system.wait_until_ready()
+                systems.append(system)
+            yield systems
+        finally:
+            for system in systems:
+                system.close()
+            engine.dispose()
+
+
+def random_embeddings(count, seed=0):
+    """Embeddings normalizados aleatórios (512 dimensões)"""
+    embeddings = np.random.default_rng(seed).standard_normal((count, 512)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_tracking_user_removal():
+    """Testa que a trilha não libera acesso para um usuário removido"""
+    print("\nTestando remocao de usuario durante o rastreamento...")
+
+    session_id = "teste-remocao-durante-trilha"
+    user_id = 7
+    bbox = np.array([200, 150, 440, 350], dtype=np.float32)
+
+    try:
+        with isolated_gallery() as (system,):
+            embedding = random_embeddings(1)[0]
+            faiss_id = system.add_user_embedding(embedding, user_id)
+
+            # Reconhecimento completo confirma a identidade da trilha
+            system.verify_track(session_id, bbox, user_id, 0.1)
+            if system.face_tracker.check(session_id, bbox, embedding, 0.4) is None:
+                print("ERRO: Identidade confirmada nao foi reaproveitada pela trilha")
+                return False
+
+            system.remove_user_embedding(faiss_id)
+
+            if system.face_tracker.check(session_id, bbox, embedding, 0.4) is not None:
+                print("ERRO: Trilha continuou com a identidade do usuario removido")
+                return False
+            if system.is_user_in_gallery(user_id):
+                print("ERRO: Usuario removido continua na galeria")
+                return False
+
+        print("OK: Trilha descartada ao remover o usuario")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar remocao durante o rastreamento: {e}")
+        return False
+
+
+def test_tracking_requires_embedding_match():
+    """Testa que a trilha só reaproveita a identidade para o mesmo rosto e frames próximos"""
+    print("\nTestando conferencia do embedding na trilha...")
+
+    session_id = "teste-outra-pessoa-na-trilha"
+    user_id = 8
+    bbox = np.array([200, 150, 440, 350], dtype=np.float32)
+
+    try:
+        with isolated_gallery() as (system,):
+            embedding, other = random_embeddings(2, seed=1)
+            system.add_user_embedding(embedding, user_id)
+            system.verify_track(session_id, bbox, user_id, 0.0)
+
+            # Outra pessoa na mesma posição: a caixa continua, o embedding não
+            if system.face_tracker.check(session_id, bbox, other, 0.4) is not None:
+                print("ERRO: Outra pessoa herdou a identidade da trilha")
+                return False
+
+            track = system.face_tracker.check(session_id, bbox, embedding, 0.4)
+            if track is None or track["user_id"] != user_id or track["distance"] > 1e-4:
+                print("ERRO: Mesmo rosto nao reaproveitou a identidade da trilha")
+                return False
+
+            # Frame depois do intervalo máximo: reconhecimento completo
+            system.face_tracker.max_gap = 0.0
+            time.sleep(0.01)
+            if system.face_tracker.check(session_id, bbox, embedding, 0.4) is not None:
+                print("ERRO: Trilha reaproveitada depois do intervalo maximo")
+                return False
+
+        print("OK: Trilha exige o mesmo rosto e frames proximos")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar conferencia da trilha: {e}")
+        return False
+
+
+def test_inference_scheduler_batching():
+    """Testa que frames que chegam juntos são processados em um só lote"""
+    print("\nTestando lotes do agendador de inferencia...")
+
+    from app.inference_scheduler import InferenceScheduler
+
+    release = threading.Event()
+    batch_sizes = []
+
+    def run_batch(items):
+        release.wait(5)
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    scheduler = InferenceScheduler(run_batch, max_batch=8, max_wait_ms=50)
+    try:
+        # O primeiro frame ocupa a thread; os seguintes esperam juntos na fila
+        first = scheduler.submit(0)
+        time.sleep(0.1)
+        futures = [scheduler.submit(i) for i in range(1, 5)]
+        release.set()
+
+        results = [future.result(timeout=5) for future in [first] + futures]
+        if results != [0, 2, 4, 6, 8]:
+            print(f"ERRO: Resultados fora de ordem: {results}")
+            return False
+        if batch_sizes != [1, 4]:
+            print(f"ERRO: Lotes inesperados: {batch_sizes}")
+            return False
+
+        print("OK: Frames concorrentes processados em um lote")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar lotes do agendador: {e}")
+        return False
+    finally:
+        scheduler.close()
+
+
+def test_inference_scheduler_cancellation():
+    """Testa que cancelar quem espera um frame não derruba a thread do agendador"""
+    print("\nTestando cancelamento no agendador de inferencia...")
+
+    from app.inference_scheduler import InferenceScheduler
+
+    release = threading.Event()
+
+    def run_batch(items):
+        release.wait(5)
+        return list(items)
+
+    scheduler = InferenceScheduler(run_batch, max_batch=1, max_wait_ms=0)
+
+    async def scenario():
+        busy = asyncio.wrap_future(scheduler.submit("ocupado"))
+        await asyncio.sleep(0.1)
+
+        # Requisição que desiste (cliente desconectou) com o frame ainda na fila
+        waiter = asyncio.ensure_future(asyncio.wrap_future(scheduler.submit("cancelado")))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0.05)  # O cancelamento chega ao Future pelo event loop
+        release.set()
+
+        await asyncio.wait_for(busy, timeout=5)
+        return await asyncio.wait_for(asyncio.wrap_future(scheduler.submit("depois")), timeout=5)
+
+    try:
+        result = asyncio.run(scenario())
+        if result != "depois":
+            print(f"ERRO: Resultado inesperado depois do cancelamento: {result}")
+            return False
+        if scheduler.stats()["cancelled"] != 1:
+            print("ERRO: Frame cancelado nao foi descartado")
+            return False
+
+        print("OK: Agendador continua atendendo depois de um cancelamento")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar cancelamento no agendador: {e!r}")
+        return False
+    finally:
+        scheduler.close()
+
+
+def test_blocking_executor_saturation():
+    """Testa o 503 com a fila cheia e a vaga mantida até a tarefa cancelada terminar"""
+    print("\nTestando fila limitada do executor das rotas...")
+
+    from fastapi import HTTPException
+    import app.main as main
+    from app.blocking_executor import BoundedExecutor
+
+    release = threading.Event()
+    executor = BoundedExecutor(max_workers=1, max_queue=1, name="teste")
+    original = main.blocking_executor
+
+    async def scenario():
+        running = asyncio.ensure_future(main.run_blocking(release.wait, 5))
+        queued = asyncio.ensure_future(main.run_blocking(time.sleep, 0))
+        await asyncio.sleep(0.1)
+
+        # Quem aguardava a tarefa em execução desiste: a thread continua ocupada
+        running.cancel()
+        await asyncio.sleep(0.05)
+        try:
+            await main.run_blocking(time.sleep, 0)
+            return "aceita com o pool ocupado"
+        except HTTPException as e:
+            if e.status_code != 503:
+                return f"status {e.status_code}"
+
+        release.set()
+        await queued
+        await main.run_blocking(time.sleep, 0)
+        return None
+
+    main.blocking_executor = executor
+    try:
+        error = asyncio.run(scenario())
+        if error:
+            print(f"ERRO: {error}")
+            return False
+        stats = executor.stats()
+        if stats["rejected"] != 1 or stats["queue_depth"] != 0 or stats["running"] != 0:
+            print(f"ERRO: Contadores do executor inconsistentes: {stats}")
+            return False
+
+        print("OK: Fila cheia recusada com 503 e vagas liberadas ao concluir")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar executor das rotas: {e!r}")
+        return False
+    finally:
+        main.blocking_executor = original
+        release.set()
+        executor.shutdown()
+
+
+def test_inference_server_recovery():
+    """Testa que o servidor de inferência recria o pool quando um processo morre"""
+    print("\nTestando recuperacao do pool de inferencia...")
+
+    from app.inference_pool import InferenceServer
+
+    server = InferenceServer(os.path.join(tempfile.gettempdir(), "teste-inferencia.sock"), workers=1)
+    try:
+        # Processo do pool morre no meio de um lote (falta de memória, crash nativo)
+        crashed = server._pool.submit(os._exit, 1)
+        try:
+            crashed.result(timeout=120)
+        except Exception:
+            pass
+
+        status, message = server._run_batch("sem-segmento", [], [])
+        if status != "error":
+            print("ERRO: Lote no pool quebrado nao falhou")
+            return False
+        print(f"   - Lote com o pool quebrado: {message}")
+
+        if server._pool.submit(os.getpid).result(timeout=120) == os.getpid():
+            print("ERRO: Pool recriado nao roda em outro processo")
+            return False
+
+        print("OK: Pool de inferencia recriado depois da queda de um processo")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar recuperacao do pool: {e!r}")
+        return False
+    finally:
+        server._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def test_face_sharpness_gate():
+    """Testa que a nitidez não depende do brilho e que faces borradas ficam abaixo do mínimo"""
+    print("\nTestando nitidez das faces...")
+
+    from app.face_quality import score_faces
+    from config import FACE_MIN_SHARPNESS
+
+    # Rosto desenhado com bordas nítidas (olhos, nariz e boca)
+    face = np.full((256, 256, 3), 60, dtype=np.uint8)
+    cv2.ellipse(face, (128, 128), (90, 115), 0, 0, 360, (170, 180, 200), -1)
+    for x in (90, 166):
+        cv2.ellipse(face, (x, 105), (18, 9), 0, 0, 360, (40, 40, 40), -1)
+    cv2.line(face, (128, 110), (118, 160), (90, 100, 120), 4)
+    cv2.ellipse(face, (128, 190), (35, 12), 0, 0, 180, (60, 60, 140), 5)
+    bbox = np.array([[0, 0, 256, 256]])
+
+    try:
+        sharp = score_faces(face, bbox)["sharpness"][0]
+        dim = score_faces((face * 0.2).astype(np.uint8), bbox)["sharpness"][0]
+        blurred = score_faces(cv2.GaussianBlur(face, (0, 0), 8), bbox)["sharpness"][0]
+        print(f"   - Nitida: {sharp:.3f}, escura: {dim:.3f}, borrada: {blurred:.3f}")
+
+        if abs(dim - sharp) > 0.2 * sharp:
+            print("ERRO: Face escura e nitida com nitidez diferente da clara")
+            return False
+        if min(sharp, dim) < 5 * FACE_MIN_SHARPNESS:
+            print("ERRO: Face nitida perto do minimo de nitidez")
+            return False
+        if blurred >= FACE_MIN_SHARPNESS:
+            print("ERRO: Face borrada acima do minimo de nitidez")
+            return False
+
+        print("OK: Nitidez independe do brilho e separa faces borradas")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar nitidez: {e}")
+        return False
+
+
+def test_updated_at_ignores_passages():
+    """Testa que passagens não avançam updated_at (só embedding, faiss_id e is_active)"""
+    print("\nTestando updated_at dos usuarios...")
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.models import Base
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{tmp_dir}/test.db")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            user = User(name="Teste", email="teste@exemplo.com", faiss_id=0)
+            db.add(user)
+            db.commit()
+            created = user.updated_at
+
+            time.sleep(0.01)
+            user.passage_count += 1
+            db.commit()
+            if user.updated_at != created:
+                print("ERRO: Passagem avancou updated_at")
+                return False
+
+            user.is_active = False
+            db.commit()
+            if user.updated_at <= created:
+                print("ERRO: Desativacao nao avancou updated_at")
+                return False
+
+            print("OK: updated_at muda so com o que o indice usa")
+            return True
+
+        except Exception as e:
+            print(f"ERRO ao testar updated_at: {e}")
+            return False
+        finally:
+            db.close()
+            engine.dispose()
+
+
+def test_removal_and_compaction():
+    """Testa que removidos somem da busca na hora e que a compactação preserva os demais"""
+    print("\nTestando remocao e compactacao do indice...")
+
+    try:
+        with isolated_gallery() as (system,):
+            embeddings = random_embeddings(10)
+            faiss_ids = [
+                system.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(embeddings, 1)
+            ]
+
+            # 4 de 10 viram tombstones: acima do limite, a compactação roda em background
+            removed = system.remove_user_embeddings(faiss_ids[:4])
+            if removed != 4:
+                print(f"ERRO: {removed} embeddings removidos em vez de 4")
+                return False
+
+            expected = np.array([-1] * 4 + list(range(5, 11)))
+            user_ids, _ = system.recognize_faces(embeddings)
+            if not np.array_equal(user_ids, expected):
+                print(f"ERRO: Busca com tombstones retornou {user_ids.tolist()}")
+                return False
+
+            if system._compaction_thread is not None:
+                system._compaction_thread.join()
+            if system.faiss_index.ntotal != 6 or system.tombstones:
+                print(f"ERRO: Indice compactado com {system.faiss_index.ntotal} embeddings")
+                return False
+            user_ids, _ = system.recognize_faces(embeddings)
+            if not np.array_equal(user_ids, expected):
+                print(f"ERRO: Busca depois da compactacao retornou {user_ids.tolist()}")
+                return False
+
+        print("OK: Remocao imediata na busca e compactacao sem perdas")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar remocao e compactacao: {e}")
+        return False
+
+
+def test_ann_indexes():
+    """Testa recall de IVF/HNSW contra a busca exata e a exclusão de tombstones neles"""
+    print("\nTestando indices IVF e HNSW...")
+
+    import faiss
+    from app.index_factory import build_index, index_kind, make_search_params, measure_recall
+
+    vectors = random_embeddings(4000, seed=2)
+    ids = np.arange(4000, dtype=np.int64)
+    removed = ids[:100]
+
+    try:
+        for kind in ("ivf", "hnsw"):
+            index = build_index(vectors, ids, kind)
+            if index_kind(index) != kind:
+                print(f"ERRO: Indice {kind} criado como {index_kind(index)}")
+                return False
+
+            recall = measure_recall(index, vectors, ids, params=make_search_params(index))
+            print(f"   - {kind}: recall@1={recall['recall_at_1']:.3f}")
+            if recall["recall_at_1"] < 0.95:
+                print(f"ERRO: Recall do {kind} abaixo de 0.95")
+                return False
+
+            batch = faiss.IDSelectorBatch(removed)
+            selector = faiss.IDSelectorNot(batch)
+            _, found = index.search(vectors[removed], 5, params=make_search_params(index, selector))
+            if np.isin(found, removed).any():
+                print(f"ERRO: Busca no {kind} retornou faiss_ids removidos")
+                return False
+
+        print("OK: IVF e HNSW com recall alto e sem removidos")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar indices IVF e HNSW: {e}")
+        return False
+
+
+def test_compressed_index_rerank():
+    """Testa SQ8/PQ com re-ranking exato e os vetores exatos do EmbeddingStore"""
+    print("\nTestando indices comprimidos com re-ranking...")
+
+    import faiss
+    from app.index_factory import (
+        build_index,
+        index_compression,
+        index_kind,
+        make_search_params,
+        measure_recall,
+    )
+    from app.vector_store import EmbeddingStore
+    from config import FAISS_RERANK_K
+
+    vectors = random_embeddings(1000, seed=3)
+    ids = np.arange(1000, dtype=np.int64)
+    removed = ids[:50]
+
+    try:
+        for compression in ("sq8", "pq"):
+            index = build_index(vectors, ids, "flat", compression)
+            if (index_kind(index), index_compression(index)) != ("flat", compression):
+                print(f"ERRO: Indice flat/{compression} criado como {index_kind(index)}")
+                return False
+            recall = measure_recall(
+                index, vectors, ids, params=make_search_params(index), rerank_k=FAISS_RERANK_K
+            )
+            print(f"   - {compression}: recall@1={recall['recall_at_1']:.3f}")
+            if recall["recall_at_1"] < 0.95:
+                print(f"ERRO: Recall do {compression} com re-ranking abaixo de 0.95")
+                return False
+
+            # Tombstones também precisam ser excluídos da busca comprimida
+            batch = faiss.IDSelectorBatch(removed)
+            selector = faiss.IDSelectorNot(batch)
+            _, found = index.search(vectors[removed], 5, params=make_search_params(index, selector))
+            if np.isin(found, removed).any():
+                print(f"ERRO: Busca no {compression} retornou faiss_ids removidos")
+                return False
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "vectors.f32"
+            store = EmbeddingStore(path)
+            store.put(ids[10:20], vectors[10:20])
+            store.flush()
+
+            # Outro worker abre o mesmo arquivo
+            reopened = EmbeddingStore(path)
+            if not np.array_equal(reopened.get(ids[10:20]), vectors[10:20]):
+                print("ERRO: Vetores exatos diferentes depois de reabrir o arquivo")
+                return False
+            if np.any(reopened.get(ids[:10])) or not reopened.covers(ids[10:20]) or reopened.covers(ids[:20]):
+                print("ERRO: Linhas nunca gravadas nao estao zeradas")
+                return False
+
+        print("OK: Indices comprimidos com re-ranking e vetores exatos em disco")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar indices comprimidos: {e}")
+        return False
+
+
+def test_batched_recognition():
+    """Testa que recognize_faces em lote dá o mesmo resultado que uma busca por face"""
+    print("\nTestando reconhecimento em lote...")
+
+    try:
+        with isolated_gallery() as (system,):
+            gallery = random_embeddings(20, seed=4)
+            for user_id, embedding in enumerate(gallery, 1):
+                system.add_user_embedding(embedding, user_id)
+
+            # Novas capturas de 5 usuários cadastrados e 2 pessoas desconhecidas
+            rng = np.random.default_rng(5)
+            queries = gallery[[0, 3, 7, 12, 19]] + rng.normal(0, 0.02, (5, 512)).astype(np.float32)
+            queries = np.vstack([queries, random_embeddings(2, seed=6)])
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+            user_ids, distances = system.recognize_faces(queries)
+            if user_ids.tolist() != [1, 4, 8, 13, 20, -1, -1]:
+                print(f"ERRO: Usuarios reconhecidos em lote: {user_ids.tolist()}")
+                return False
+
+            for query, user_id, distance in zip(queries, user_ids, distances):
+                single_user, single_distance = system.recognize_face(query)
+                if (single_user or -1) != user_id or abs(single_distance - distance) > 1e-5:
+                    print("ERRO: Lote diferente do reconhecimento de uma face")
+                    return False
+
+        print("OK: Reconhecimento em lote igual ao individual")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar reconhecimento em lote: {e}")
+        return False
+
+
+def reopen_gallery(system):
+    """Novo FaceRecognitionSystem no diretório de outro (reinício do worker)"""
+    from app.face_recognition import FaceRecognitionSystem
+
+    reopened = FaceRecognitionSystem(
+        index_dir=system.index_dir,
+        pipeline=system.pipeline,
+        session_factory=system._session_factory,
+    )
+    reopened.wait_until_ready()
+    return reopened
+
+
+def test_journal_torn_write():
+    """Testa o replay do journal com registro incompleto ou CRC inválido no fim"""
+    print("\nTestando journal com escrita interrompida...")
+
+    from app.index_journal import RECORD_ADD, RECORD_MAP, RECORD_REMOVE, IndexJournal
+
+    vectors = random_embeddings(3, seed=7)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "index.journal"
+            journal = IndexJournal(path)
+            journal.append(RECORD_ADD, 0, 1, vectors[0], generation=1)
+            journal.append(RECORD_ADD, 1, None, vectors[1], generation=2)
+            journal.append(RECORD_MAP, 1, 2, generation=3)
+            journal.close()
+            valid_size = path.stat().st_size
+
+            # Queda no meio do registro seguinte: cabeçalho e metade do vetor
+            # (como na galeria, o journal é lido antes de receber registros)
+            journal = IndexJournal(path)
+            list(journal.replay())
+            journal.append(RECORD_ADD, 2, 3, vectors[2], generation=4)
+            journal.close()
+            with open(path, "r+b") as f:
+                f.truncate(valid_size + 200)
+
+            records = list(IndexJournal(path).replay())
+            expected = [(1, RECORD_ADD, 0, 1), (2, RECORD_ADD, 1, None), (3, RECORD_MAP, 1, 2)]
+            if [record[:4] for record in records] != expected:
+                print(f"ERRO: Registros lidos depois da queda: {records}")
+                return False
+            if not np.array_equal(records[0][4], vectors[0]) or path.stat().st_size != valid_size:
+                print("ERRO: Registro incompleto nao foi truncado")
+                return False
+
+            # Registro completo com um bit trocado no vetor (CRC inválido)
+            journal = IndexJournal(path)
+            list(journal.replay())
+            journal.append(RECORD_ADD, 2, 3, vectors[2], generation=4)
+            journal.close()
+            with open(path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                last = f.read(1)
+                f.seek(-1, os.SEEK_END)
+                f.write(bytes([last[0] ^ 0x01]))
+            if len(list(IndexJournal(path).replay())) != 3 or path.stat().st_size != valid_size:
+                print("ERRO: Registro com CRC invalido foi aplicado")
+                return False
+
+            # Depois do truncamento o journal continua recebendo registros
+            journal = IndexJournal(path)
+            list(journal.replay())
+            journal.append(RECORD_REMOVE, 0, None, generation=4)
+            journal.close()
+            records = list(IndexJournal(path).replay(after_generation=2))
+            if [record[:2] for record in records] != [(3, RECORD_MAP), (4, RECORD_REMOVE)]:
+                print(f"ERRO: Registros depois da geracao 2: {records}")
+                return False
+
+        # Reinício de um worker com o fim do journal corrompido
+        with isolated_gallery() as (system,):
+            gallery = random_embeddings(5, seed=8)
+            for user_id, embedding in enumerate(gallery, 1):
+                system.add_user_embedding(embedding, user_id)
+            system.journal.sync()
+            with open(system.journal.path, "ab") as f:
+                f.write(b"\x01" + os.urandom(40))
+
+            reopened = reopen_gallery(system)
+            try:
+                user_ids, _ = reopened.recognize_faces(gallery)
+            finally:
+                reopened.close()
+            if user_ids.tolist() != [1, 2, 3, 4, 5]:
+                print(f"ERRO: Galeria recarregada do journal: {user_ids.tolist()}")
+                return False
+
+        print("OK: Journal ignora e trunca o registro interrompido")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar journal: {e}")
+        return False
+
+
+def test_layered_snapshot():
+    """Testa snapshot mapeado + delta: busca nos dois, tombstones e republicação atômica"""
+    print("\nTestando snapshot com delta...")
+
+    import faiss
+    from app.index_factory import build_index, make_search_params
+    from app.index_snapshot import LayeredIndex, open_snapshot, publish_snapshot, serialize_snapshot
+
+    vectors = random_embeddings(110, seed=9)
+    ids = np.arange(110, dtype=np.int64)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "index.faiss"
+            publish_snapshot(serialize_snapshot(build_index(vectors[:100], ids[:100])), path)
+
+            snapshot = open_snapshot(path)
+            index = snapshot if isinstance(snapshot, LayeredIndex) else LayeredIndex(snapshot)
+            # Cadastros depois da carga vão para o delta em heap
+            index.add_with_ids(vectors[100:], ids[100:])
+            if index.ntotal != 110 or not np.array_equal(np.sort(index.get_ids()), ids):
+                print("ERRO: IDs do snapshot com delta incorretos")
+                return False
+
+            _, labels = index.search(vectors[[5, 105]], 1)
+            if labels[:, 0].tolist() != [5, 105]:
+                print(f"ERRO: Busca no snapshot e no delta retornou {labels[:, 0].tolist()}")
+                return False
+
+            removed = np.array([5, 105], dtype=np.int64)
+            batch = faiss.IDSelectorBatch(removed)
+            selector = faiss.IDSelectorNot(batch)
+            _, labels = index.search(vectors[removed], 3, params=make_search_params(index, selector))
+            if np.isin(labels, removed).any():
+                print("ERRO: Tombstones retornados pela busca com delta")
+                return False
+
+            # Checkpoint: snapshot novo com o delta incorporado, trocado atomicamente
+            publish_snapshot(serialize_snapshot(index), path)
+            reopened = open_snapshot(path)
+            _, labels = reopened.search(vectors[[5, 105]], 1)
+            if reopened.ntotal != 110 or labels[:, 0].tolist() != [5, 105]:
+                print("ERRO: Snapshot republicado sem os cadastros do delta")
+                return False
+            if list(Path(tmp_dir).glob("*.tmp")):
+                print("ERRO: Arquivo temporario deixado pela publicacao")
+                return False
+
+        print("OK: Snapshot com delta, tombstones e republicacao atomica")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar snapshot com delta: {e}")
+        return False
+
+
+def test_user_id_map():
+    """Testa o mapeamento faiss_id -> user_id em array (interface de dict, .npy e .pkl antigo)"""
+    print("\nTestando mapeamento faiss_id -> user_id...")
+
+    import pickle
+    from app.id_mapping import NO_USER, UserIdMap
+
+    try:
+        mapping = UserIdMap.from_dict({0: 10, 3: 13, 2000: 20})
+        mapping[5] = 15
+        del mapping[3]
+        if len(mapping) != 3 or 3 in mapping or mapping.get(3) is not None or mapping[2000] != 20:
+            print("ERRO: Interface de dict do mapeamento inconsistente")
+            return False
+        if mapping.lookup(np.array([[0, 3], [5, 99999]])).tolist() != [[10, NO_USER], [15, NO_USER]]:
+            print("ERRO: Consulta vetorizada incorreta")
+            return False
+        if not mapping.contains_user(15) or mapping.contains_users([13, 20]).tolist() != [False, True]:
+            print("ERRO: Busca por usuario incorreta")
+            return False
+        if mapping.faiss_ids_of(20).tolist() != [2000] or mapping.max_id() != 2000:
+            print("ERRO: faiss_ids do usuario incorretos")
+            return False
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "id_to_user.npy"
+            mapping.save(path)
+            loaded = UserIdMap.load(path)
+            if loaded.keys().tolist() != [0, 5, 2000] or len(loaded) != 3:
+                print("ERRO: Mapeamento recarregado do .npy diferente")
+                return False
+            # O arquivo é aberto copy-on-write: alterar em memória não muda o disco
+            loaded[7] = 17
+            if 7 in UserIdMap.load(path):
+                print("ERRO: Alteracao em memoria gravada no arquivo")
+                return False
+
+            legacy_path = Path(tmp_dir) / "id_to_user.pkl"
+            with open(legacy_path, "wb") as f:
+                pickle.dump({1: 11, 4: 14}, f)
+            legacy = UserIdMap.load(legacy_path)
+            if legacy.keys().tolist() != [1, 4] or legacy[4] != 14:
+                print("ERRO: Mapeamento antigo (.pkl) nao convertido")
+                return False
+
+        print("OK: Mapeamento em array com interface de dict")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar mapeamento: {e}")
+        return False
+
+
+def test_sharded_index():
+    """Testa que a galeria em shards dá o mesmo top-k que um índice único"""
+    print("\nTestando galeria em shards...")
+
+    import faiss
+    from app.index_factory import build_index, make_search_params
+    from app.sharded_index import build_sharded_index, shard_of
+
+    vectors = random_embeddings(310, seed=10)
+    ids = np.arange(310, dtype=np.int64)
+    queries = random_embeddings(20, seed=11)
+
+    try:
+        sharded = build_sharded_index(vectors[:300], ids[:300], n_shards=4)
+        # Cadastros depois da montagem vão para o shard faiss_id % 4
+        sharded.add_with_ids(vectors[300:], ids[300:])
+        for shard_id, shard in enumerate(sharded.shards):
+            if not np.all(shard_of(faiss.vector_to_array(shard.id_map), 4) == shard_id):
+                print(f"ERRO: Shard {shard_id} com faiss_ids de outro shard")
+                return False
+        if sharded.ntotal != 310 or not np.array_equal(np.sort(sharded.get_ids()), ids):
+            print("ERRO: IDs da galeria em shards incorretos")
+            return False
+
+        single = build_index(vectors, ids)
+        removed = ids[::7]
+        batch = faiss.IDSelectorBatch(removed)
+        selector = faiss.IDSelectorNot(batch)
+        for params in (None, make_search_params(single, selector)):
+            expected_sims, expected = single.search(queries, 5, params=params)
+            sims, labels = sharded.search(queries, 5, params=params)
+            if not np.array_equal(labels, expected) or not np.allclose(sims, expected_sims, atol=1e-5):
+                print("ERRO: Top-k da galeria em shards diferente do indice unico")
+                return False
+
+        print("OK: Galeria em shards com o mesmo top-k do indice unico")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar galeria em shards: {e}")
+        return False
+
+
+def test_parallel_decrypt_batch():
+    """Testa a descriptografia em lote com os dois formatos e linhas inválidas"""
+    print("\nTestando descriptografia em lote...")
+
+    from app.encryption import decrypt_embedding_batch, encryption_manager
+
+    embeddings = random_embeddings(3, seed=12)
+    tampered = bytearray(encryption_manager.encrypt_embedding_binary(embeddings[2]))
+    tampered[-1] ^= 0x01
+
+    try:
+        vectors, valid = decrypt_embedding_batch([
+            encryption_manager.encrypt_embedding_binary(embeddings[0]),
+            encryption_manager.encrypt_embedding(embeddings[1]),
+            bytes(tampered),
+            encryption_manager.encrypt_embedding(embeddings[0][:128]),
+            b"lixo",
+        ])
+        if valid.tolist() != [True, True, False, False, False]:
+            print(f"ERRO: Linhas validas do lote: {valid.tolist()}")
+            return False
+        if not np.allclose(vectors[:2], embeddings[:2], atol=1e-6) or np.any(vectors[2:]):
+            print("ERRO: Embeddings do lote incorretos")
+            return False
+
+        print("OK: Lote com formatos misturados e linhas invalidas zeradas")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar descriptografia em lote: {e}")
+        return False
+
+
+def test_embedding_envelope():
+    """Testa o envelope binário AES-GCM: ida e volta, adulteração e migração sob demanda"""
+    print("\nTestando envelope binario dos embeddings...")
+
+    from app.encryption import ENVELOPE_HEADER, encryption_manager
+
+    embeddings = random_embeddings(3, seed=13)
+
+    try:
+        for dtype, atol in (("float32", 0), ("float16", 1e-3)):
+            envelope = encryption_manager.encrypt_embedding_binary(embeddings[0], dtype=dtype)
+            decrypted = encryption_manager.decrypt_embedding(envelope)
+            if decrypted.dtype != np.float32 or not np.allclose(decrypted, embeddings[0], atol=atol):
+                print(f"ERRO: Envelope {dtype} nao voltou ao embedding original")
+                return False
+
+        # float32 x 512 e float16 x 1024 têm o mesmo tamanho: só o cabeçalho
+        # autenticado impede reinterpretar o vetor
+        envelope = encryption_manager.encrypt_embedding_binary(embeddings[0])
+        forged = ENVELOPE_HEADER.pack(b"FE", 1, 2, 1024) + envelope[ENVELOPE_HEADER.size :]
+        tampered = [forged]
+        for position in (ENVELOPE_HEADER.size, ENVELOPE_HEADER.size + 20, len(envelope) - 1):
+            altered = bytearray(envelope)
+            altered[position] ^= 0x01
+            tampered.append(bytes(altered))
+        for altered in tampered:
+            try:
+                encryption_manager.decrypt_embedding_binary(altered)
+            except Exception:
+                continue
+            print("ERRO: Envelope adulterado foi aceito")
+            return False
+
+        with isolated_gallery() as (system,):
+            db = system._session_factory()
+            try:
+                db.add_all([
+                    User(
+                        name=f"Usuario {faiss_id}",
+                        email=f"usuario{faiss_id}@exemplo.com",
+                        embedding_hash=encryption_manager.encrypt_embedding(embedding),
+                        faiss_id=faiss_id,
+                    )
+                    for faiss_id, embedding in enumerate(embeddings[:2])
+                ])
+                db.add(User(
+                    name="Usuario 2",
+                    email="usuario2@exemplo.com",
+                    embedding=encryption_manager.encrypt_embedding_binary(embeddings[2]),
+                    faiss_id=2,
+                ))
+                db.commit()
+                updated = {user.id: user.updated_at for user in db.query(User)}
+            finally:
+                db.close()
+
+            system.rebuild_index_from_database()
+            user_ids, _ = system.recognize_faces(embeddings)
+            if sorted(user_ids.tolist()) != sorted(updated):
+                print(f"ERRO: Usuarios reconhecidos apos reconstrucao: {user_ids.tolist()}")
+                return False
+
+            db = system._session_factory()
+            try:
+                for user in db.query(User):
+                    if user.embedding_hash or user.embedding is None:
+                        print("ERRO: Embedding no formato antigo nao foi migrado")
+                        return False
+                    if user.updated_at != updated[user.id]:
+                        print("ERRO: Migracao do formato avancou updated_at")
+                        return False
+                    decrypted = encryption_manager.decrypt_embedding(user.embedding)
+                    if not np.allclose(decrypted, embeddings[user.faiss_id], atol=1e-6):
+                        print("ERRO: Embedding migrado diferente do original")
+                        return False
+            finally:
+                db.close()
+
+        print("OK: Envelope autenticado e migracao do formato antigo")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar envelope binario: {e}")
+        return False
+
+
+def test_cross_worker_sync():
+    """Testa que cadastros e remoções de um worker chegam aos outros pelo journal"""
+    print("\nTestando sincronizacao entre workers...")
+
+    import struct
+    import zlib
+    from app.index_journal import (
+        LEGACY_HEADER,
+        RECORD_ADD,
+        RECORD_MAP,
+        RECORD_REMOVE,
+        IndexJournal,
+    )
+
+    gallery = random_embeddings(6, seed=14)
+
+    try:
+        with isolated_gallery(workers=2) as (first, second):
+            first_ids = [
+                first.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(gallery[:3], 1)
+            ]
+            second.sync_gallery()
+            if second.generation != first.generation:
+                print("ERRO: Segundo worker nao alcancou a geracao do primeiro")
+                return False
+            user_ids, _ = second.recognize_faces(gallery[:3])
+            if user_ids.tolist() != [1, 2, 3]:
+                print(f"ERRO: Cadastros do outro worker: {user_ids.tolist()}")
+                return False
+
+            # faiss_ids reservados no arquivo de versão compartilhado
+            second_ids = [
+                second.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(gallery[3:], 4)
+            ]
+            if set(first_ids) & set(second_ids):
+                print("ERRO: Workers usaram o mesmo faiss_id")
+                return False
+
+            first.remove_user_embedding(first_ids[1])
+            second.sync_gallery()
+            first.sync_gallery()
+            for system in (first, second):
+                user_ids, _ = system.recognize_faces(gallery)
+                if user_ids.tolist() != [1, -1, 3, 4, 5, 6]:
+                    print(f"ERRO: Galeria depois da remocao: {user_ids.tolist()}")
+                    return False
+
+        # Journal gravado antes das gerações
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "index.journal"
+            legacy = []
+            for record_type, faiss_id, user_id, vector in (
+                (RECORD_ADD, 0, -1, gallery[0]),
+                (RECORD_MAP, 0, 1, None),
+                (RECORD_REMOVE, 0, -1, None),
+            ):
+                payload = vector.tobytes() if vector is not None else b""
+                crc = zlib.crc32(payload, zlib.crc32(struct.pack("<Bqq", record_type, faiss_id, user_id)))
+                legacy.append(LEGACY_HEADER.pack(record_type, faiss_id, user_id, crc) + payload)
+            # Último registro interrompido no meio
+            path.write_bytes(b"".join(legacy) + legacy[0][:100])
+
+            journal = IndexJournal(path)
+            if journal.upgrade_legacy(5) != 8:
+                print("ERRO: Geracoes atribuidas ao journal antigo")
+                return False
+            records = list(journal.replay())
+            journal.close()
+            expected = [(6, RECORD_ADD, 0, None), (7, RECORD_MAP, 0, 1), (8, RECORD_REMOVE, 0, None)]
+            if [record[:4] for record in records] != expected:
+                print(f"ERRO: Journal antigo convertido: {records}")
+                return False
+            if not np.array_equal(records[0][4], gallery[0]):
+                print("ERRO: Vetor do journal antigo alterado na conversao")
+                return False
+
+        print("OK: Workers sincronizados pelo journal e journal antigo convertido")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar sincronizacao entre workers: {e}")
+        return False
+
+
+def test_encrypted_snapshot_restore():
+    """Testa o snapshot criptografado da galeria: ida e volta, adulteração e restauração"""
+    print("\nTestando snapshot criptografado da galeria...")
+
+    from app.encryption import encryption_manager
+    from app.gallery_snapshot import read_encrypted_snapshot, write_encrypted_snapshot
+
+    vectors = random_embeddings(10, seed=15)
+    ids = np.arange(10, 20, dtype=np.int64)
+    user_ids = np.arange(1, 11, dtype=np.int64)
+    user_ids[3] = -1  # tombstone
+    key = encryption_manager.snapshot_key
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "gallery_snapshot.enc"
+            # Blocos de 4 linhas, com o último incompleto
+            write_encrypted_snapshot(
+                path, key, ids, user_ids, lambda chunk: vectors[chunk - 10], 7, 25, chunk_rows=4
+            )
+            info, read_ids, read_user_ids, read_vectors = read_encrypted_snapshot(path, key)
+            if (
+                (info["generation"], info["next_faiss_id"]) != (7, 25)
+                or not np.array_equal(read_ids, ids)
+                or not np.array_equal(read_user_ids, user_ids)
+                or not np.array_equal(read_vectors, vectors)
+            ):
+                print("ERRO: Snapshot criptografado lido diferente do gravado")
+                return False
+
+            data = path.read_bytes()
+            altered = bytearray(data)
+            altered[len(data) // 2] ^= 0x01
+            for name, content, read_key in (
+                ("adulterado", bytes(altered), key),
+                ("truncado", data[:-40], key),
+                ("com outra chave", data, bytes(32)),
+            ):
+                path.write_bytes(content)
+                try:
+                    read_encrypted_snapshot(path, read_key)
+                except ValueError:
+                    continue
+                print(f"ERRO: Snapshot {name} foi aceito")
+                return False
+
+        # Arquivos do índice perdidos: a galeria volta do snapshot + journal
+        with isolated_gallery() as (system,):
+            gallery = random_embeddings(6, seed=16)
+            faiss_ids = [
+                system.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(gallery[:5], 1)
+            ]
+            system.save_faiss_index()
+            system.add_user_embedding(gallery[5], 6)
+            system.remove_user_embedding(faiss_ids[1])
+            system.journal.sync()
+
+            for path in system.index_dir.iterdir():
+                if path.name.startswith(("face_index", "id_mapping", "manifest", "embeddings")):
+                    path.unlink()
+
+            reopened = reopen_gallery(system)
+            try:
+                user_ids, _ = reopened.recognize_faces(gallery)
+            finally:
+                reopened.close()
+            if user_ids.tolist() != [1, -1, 3, 4, 5, 6]:
+                print(f"ERRO: Galeria restaurada do snapshot: {user_ids.tolist()}")
+                return False
+
+        print("OK: Snapshot criptografado autenticado e galeria restaurada")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar snapshot criptografado: {e}")
+        return False
+
+
+def test_checkpoint_reload():
+    """Testa checkpoint + recarga e a volta ao snapshot anterior se o atual estiver corrompido"""
+    print("\nTestando checkpoint e recarga da galeria...")
+
+    from app.index_snapshot import MANIFEST, PREVIOUS_MANIFEST, read_manifest, verify_snapshot_files
+
+    gallery = random_embeddings(8, seed=17)
+
+    try:
+        with isolated_gallery() as (system,):
+            faiss_ids = [
+                system.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(gallery[:4], 1)
+            ]
+            system.save_faiss_index()
+            for user_id, embedding in enumerate(gallery[4:7], 5):
+                system.add_user_embedding(embedding, user_id)
+            system.remove_user_embedding(faiss_ids[0])
+            generation = system.generation
+            system.save_faiss_index()
+
+            manifest = read_manifest(system.index_dir)
+            verify_snapshot_files(manifest, system.index_dir)
+            if manifest["generation"] != generation:
+                print("ERRO: Manifesto nao cobre a geracao do checkpoint")
+                return False
+
+            expected = [-1, 2, 3, 4, 5, 6, 7]
+            reopened = reopen_gallery(system)
+            try:
+                user_ids, _ = reopened.recognize_faces(gallery[:7])
+                generation, next_faiss_id = reopened.generation, reopened.next_faiss_id
+            finally:
+                reopened.close()
+            if user_ids.tolist() != expected:
+                print(f"ERRO: Galeria recarregada do checkpoint: {user_ids.tolist()}")
+                return False
+            if (generation, next_faiss_id) != (system.generation, system.next_faiss_id):
+                print("ERRO: Geracao ou proximo faiss_id perdidos na recarga")
+                return False
+
+            # Snapshot atual corrompido (mesmo tamanho): volta ao anterior e
+            # reaplica o journal desde ele
+            system.add_user_embedding(gallery[7], 8)
+            system.journal.sync()
+            snapshot_path = system.index_dir / manifest["index_files"][0]
+            data = bytearray(snapshot_path.read_bytes())
+            data[len(data) // 2] ^= 0x01
+            snapshot_path.write_bytes(bytes(data))
+            try:
+                verify_snapshot_files(manifest, system.index_dir)
+                print("ERRO: Checksum nao detectou o snapshot corrompido")
+                return False
+            except ValueError:
+                pass
+
+            previous = read_manifest(system.index_dir, PREVIOUS_MANIFEST)
+            reopened = reopen_gallery(system)
+            try:
+                user_ids, _ = reopened.recognize_faces(gallery)
+            finally:
+                reopened.close()
+            if user_ids.tolist() != expected + [8]:
+                print(f"ERRO: Galeria recarregada do snapshot anterior: {user_ids.tolist()}")
+                return False
+            # O worker republica um snapshot bom no lugar do corrompido
+            republished = read_manifest(system.index_dir, MANIFEST)
+            verify_snapshot_files(republished, system.index_dir)
+            if republished["generation"] <= previous["generation"]:
+                print("ERRO: Snapshot bom nao foi republicado")
+                return False
+
+        print("OK: Checkpoint recarregado e snapshot anterior usado se o atual falhar")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar checkpoint e recarga: {e}")
+        return False
+
+
+def test_incremental_reconcile():
+    """Testa a reconciliação banco ↔ índice pela marca d'água de updated_at"""
+    print("\nTestando reconciliacao incremental...")
+
+    from datetime import datetime, timedelta
+    from app.encryption import encryption_manager
+
+    gallery = random_embeddings(4, seed=18)
+
+    try:
+        with isolated_gallery() as (system,):
+            # Usuário 4 está no banco mas não no índice (cadastro perdido)
+            for user_id, embedding in enumerate(gallery[:3], 1):
+                system.add_user_embedding(embedding, user_id)
+            # Alterações antigas, uma hora entre cada usuário
+            now = datetime.utcnow()
+            db = system._session_factory()
+            try:
+                db.add_all([
+                    User(
+                        name=f"Usuario {faiss_id + 1}",
+                        email=f"usuario{faiss_id + 1}@exemplo.com",
+                        embedding=encryption_manager.encrypt_embedding_binary(embedding),
+                        faiss_id=faiss_id,
+                        updated_at=now - timedelta(hours=4 - faiss_id),
+                    )
+                    for faiss_id, embedding in enumerate(gallery)
+                ])
+                db.commit()
+
+                summary = system.reconcile_with_database()
+                if (summary["checked"], summary["added"]) != (4, 1):
+                    print(f"ERRO: Primeira reconciliacao: {summary}")
+                    return False
+
+                # Só o usuário alterado e o da marca d'água (dentro da janela
+                # FAISS_RECONCILE_OVERLAP) são conferidos
+                user = db.query(User).filter(User.faiss_id == 1).one()
+                user.is_active = False
+                db.commit()
+                summary = system.reconcile_with_database()
+                if (summary["checked"], summary["removed"]) != (2, 1):
+                    print(f"ERRO: Reconciliacao incremental: {summary}")
+                    return False
+            finally:
+                db.close()
+
+            user_ids, _ = system.recognize_faces(gallery)
+            if user_ids.tolist() != [1, -1, 3, 4]:
+                print(f"ERRO: Galeria depois da reconciliacao: {user_ids.tolist()}")
+                return False
+
+            summary = system.reconcile_with_database(full=True)
+            changes = sum(summary[key] for key in ("added", "mapped", "removed", "orphans"))
+            if summary["checked"] != 4 or changes:
+                print(f"ERRO: Reconciliacao completa depois de corrigir: {summary}")
+                return False
+
+        print("OK: Reconciliacao confere so os usuarios alterados")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar reconciliacao incremental: {e}")
+        return False
+
+
+def test_background_rebuild_swap():
+    """Testa a troca atômica do índice reconstruído com alterações feitas durante a leitura"""
+    print("\nTestando reconstrucao com troca atomica...")
+
+    from app.encryption import encryption_manager
+
+    gallery = random_embeddings(5, seed=19)
+
+    try:
+        with isolated_gallery() as (system,):
+            faiss_ids = [
+                system.add_user_embedding(embedding, user_id)
+                for user_id, embedding in enumerate(gallery[:4], 1)
+            ]
+            db = system._session_factory()
+            try:
+                db.add_all([
+                    User(
+                        name=f"Usuario {faiss_id + 1}",
+                        email=f"usuario{faiss_id + 1}@exemplo.com",
+                        embedding=encryption_manager.encrypt_embedding_binary(embedding),
+                        faiss_id=faiss_id,
+                    )
+                    for faiss_id, embedding in zip(faiss_ids, gallery)
+                ])
+                db.commit()
+            finally:
+                db.close()
+
+            # Buscas, cadastros e remoções continuam no índice atual enquanto o
+            # banco é lido
+            during = {}
+            load = system._load_database_embeddings
+
+            def load_with_changes(db, total, max_faiss_id):
+                result = load(db, total, max_faiss_id)
+                during["user_ids"], _ = system.recognize_faces(gallery[:4])
+                system.add_user_embedding(gallery[4], 5)
+                system.remove_user_embedding(faiss_ids[0])
+                return result
+
+            system._load_database_embeddings = load_with_changes
+            system.rebuild_index_from_database()
+
+            if during["user_ids"].tolist() != [1, 2, 3, 4]:
+                print(f"ERRO: Busca durante a reconstrucao: {during['user_ids'].tolist()}")
+                return False
+            user_ids, _ = system.recognize_faces(gallery)
+            if user_ids.tolist() != [-1, 2, 3, 4, 5]:
+                print(f"ERRO: Galeria depois da troca: {user_ids.tolist()}")
+                return False
+
+        print("OK: Alteracoes durante a reconstrucao preservadas na troca")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar reconstrucao com troca atomica: {e}")
+        return False
+
+
+def loaded_pipeline():
+    """FacePipeline com os modelos neste processo (o global, se não usar o servidor de inferência)"""
+    from app.face_pipeline import FacePipeline
+
+    face_recognition.wait_until_ready()
+    if getattr(face_recognition.pipeline, "face_app", None) is not None:
+        return face_recognition.pipeline
+    pipeline = FacePipeline()
+    pipeline.load_models()
+    return pipeline
+
+
+def test_model_pack():
+    """Testa que só os modelos de INSIGHTFACE_ALLOWED_MODULES são carregados e medidos"""
+    print("\nTestando pacote de modelos...")
+
+    from insightface.data import get_image
+    from app.face_pipeline import FacePipeline
+    from app.model_profiling import profile_face_analysis
+
+    try:
+        pipeline = loaded_pipeline()
+        allowed = FacePipeline._allowed_modules()
+        if allowed is not None and set(pipeline.model_names) != set(allowed):
+            print(f"ERRO: Modelos carregados {pipeline.model_names}, permitidos {allowed}")
+            return False
+        if not {"detection", "recognition"} <= set(pipeline.model_names):
+            print("ERRO: Deteccao e reconhecimento devem estar sempre carregados")
+            return False
+
+        report = profile_face_analysis(pipeline.face_app, get_image("t1"), runs=2)
+        if set(report) != set(pipeline.model_names) | {"faces", "total_ms"} or report["faces"] == 0:
+            print(f"ERRO: Relatorio de latencia dos modelos: {report}")
+            return False
+        total = sum(report[taskname]["mean_ms"] for taskname in pipeline.model_names)
+        if abs(report["total_ms"] - total) > 1e-6:
+            print("ERRO: Total do relatorio diferente da soma dos modelos")
+            return False
+
+        print(f"OK: Pacote carregado so com {pipeline.model_names}")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar pacote de modelos: {e}")
+        return False
+
+
+def test_detect_then_embed():
+    """Testa que detectar e depois reconhecer só as faces escolhidas dá os embeddings do face_app.get"""
+    print("\nTestando deteccao antes do reconhecimento...")
+
+    from insightface.data import get_image
+
+    image = get_image("t1")
+
+    try:
+        pipeline = loaded_pipeline()
+        det_size = pipeline.detector_sizes[-1]
+        all_faces, top_faces = pipeline.run(
+            [(image, det_size, False, None), (image, det_size, False, 2)]
+        )
+        if not all_faces or len(top_faces) != min(2, len(all_faces)):
+            print(f"ERRO: Faces escolhidas: {len(all_faces)} e {len(top_faces)} (max_faces=2)")
+            return False
+        best = sorted(face["det_score"] for face in all_faces)[-len(top_faces):]
+        if sorted(face["det_score"] for face in top_faces) != best:
+            print("ERRO: max_faces nao escolheu as faces de maior confianca")
+            return False
+
+        # Mesmos embeddings do caminho que roda todos os modelos em cada face
+        reference = pipeline.face_app.get(image)
+        centers = np.array([(face.bbox[:2] + face.bbox[2:]) / 2 for face in reference])
+        for face in all_faces:
+            center = (face["bbox"][:2] + face["bbox"][2:]) / 2
+            match = reference[int(np.argmin(np.linalg.norm(centers - center, axis=1)))]
+            similarity = np.dot(face["embedding"], match.embedding) / (
+                np.linalg.norm(face["embedding"]) * np.linalg.norm(match.embedding)
+            )
+            if similarity < 0.999:
+                print(f"ERRO: Embedding diferente do face_app.get (similaridade {similarity:.4f})")
+                return False
+
+        print(f"OK: {len(all_faces)} faces reconhecidas em lote depois da deteccao")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar deteccao antes do reconhecimento: {e}")
+        return False
+
+
+def test_detector_size_choice():
+    """Testa a escolha da resolução do detector por imagem e pelo frame anterior da sessão"""
+    print("\nTestando resolucao do detector por requisicao...")
+
+    session_id = "teste-resolucao-detector"
+
+    try:
+        with isolated_gallery() as (system,):
+            pipeline = system.pipeline
+            detector_sizes = pipeline.detector_sizes
+            pipeline.detector_sizes = [320, 480, 640]
+            try:
+                frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                # Face de MIN_FACE_SIZE (80px) precisa de 48px na entrada: 480
+                cases = [
+                    (frame, None, False, 480),
+                    (frame, None, True, 640),
+                    (np.zeros((200, 300, 3), dtype=np.uint8), None, False, 320),
+                    (np.zeros((1080, 1920, 3), dtype=np.uint8), None, False, 640),
+                ]
+                for image, session, high_precision, expected in cases:
+                    size = system._choose_det_size(image, session, high_precision)
+                    if size != expected:
+                        print(f"ERRO: Resolucao {size} para {image.shape[:2]}, esperado {expected}")
+                        return False
+
+                # Face grande no frame anterior: a próxima cabe na menor resolução
+                system._remember_face_size(
+                    session_id, [{"bbox": np.array([100, 50, 400, 400], dtype=np.float32)}]
+                )
+                if system._choose_det_size(frame, session_id) != 320:
+                    print("ERRO: Tamanho da face do frame anterior ignorado")
+                    return False
+                system._remember_face_size(session_id, [])
+                if system._choose_det_size(frame, session_id) != 480:
+                    print("ERRO: Frame sem face nao voltou a procurar faces pequenas")
+                    return False
+
+                pipeline.detector_sizes = [640]
+                if system._choose_det_size(frame, None) != 640:
+                    print("ERRO: Detector com entrada fixa deve usar so a sua resolucao")
+                    return False
+            finally:
+                pipeline.detector_sizes = detector_sizes
+
+        print("OK: Resolucao do detector escolhida por requisicao")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar resolucao do detector: {e}")
+        return False
+
+
+def test_onnx_session_settings():
+    """Testa as opções de sessão ONNX por modelo (padrões ONNX_* e ajustes por tarefa)"""
+    print("\nTestando opcoes das sessoes ONNX...")
+
+    from app import onnx_sessions
+    from config import ONNX_INTRA_OP_THREADS, QUANTIZED_MODELS_DIR
+
+    overrides = onnx_sessions.ONNX_MODEL_SESSION_OPTIONS
+    try:
+        onnx_sessions.ONNX_MODEL_SESSION_OPTIONS = {
+            "detection": {"intra_op_threads": 3, "execution_mode": "parallel"},
+            "genderage": {"threads": 1},
+            "landmark_2d_106": {"graph_optimization": "maximo"},
+        }
+        detection = onnx_sessions.session_settings("detection")
+        recognition = onnx_sessions.session_settings("recognition")
+        if (detection["intra_op_threads"], detection["execution_mode"]) != (3, "parallel"):
+            print(f"ERRO: Ajustes da deteccao nao aplicados: {detection}")
+            return False
+        if recognition["intra_op_threads"] != ONNX_INTRA_OP_THREADS:
+            print("ERRO: Ajuste de um modelo alterou outro")
+            return False
+        for taskname in ("genderage", "landmark_2d_106"):
+            try:
+                onnx_sessions.session_settings(taskname)
+            except ValueError:
+                continue
+            print(f"ERRO: Opcao invalida aceita para {taskname}")
+            return False
+
+        quantized = onnx_sessions.quantized_model_path(
+            "/modelos/buffalo_l/w600k_r50.onnx", "buffalo_l"
+        )
+        if quantized != QUANTIZED_MODELS_DIR / "buffalo_l" / "w600k_r50.int8.onnx":
+            print(f"ERRO: Caminho do modelo INT8: {quantized}")
+            return False
+
+        import onnxruntime as ort
+
+        options = onnx_sessions.build_session_options(detection)
+        if (
+            options.intra_op_num_threads != 3
+            or options.execution_mode != ort.ExecutionMode.ORT_PARALLEL
+            or options.enable_cpu_mem_arena != bool(detection["cpu_mem_arena"])
+        ):
+            print("ERRO: SessionOptions diferente das opcoes configuradas")
+            return False
+
+        print("OK: Opcoes de sessao por modelo")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar opcoes das sessoes ONNX: {e}")
+        return False
+    finally:
+        onnx_sessions.ONNX_MODEL_SESSION_OPTIONS = overrides
+
+
+def test_optimized_graph_cache():
+    """Testa o cache dos grafos ONNX otimizados (miss na primeira carga, hit nas seguintes)"""
+    print("\nTestando cache dos grafos otimizados...")
+
+    import onnx
+    from onnx import TensorProto, helper
+    from app import onnx_sessions
+
+    def save_model(path, op_type):
+        graph = helper.make_graph(
+            [helper.make_node(op_type, ["x", "x"], ["y"]), helper.make_node("Relu", ["y"], ["z"])],
+            "teste",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 4])],
+            [helper.make_tensor_value_info("z", TensorProto.FLOAT, [1, 4])],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        onnx.save(model, str(path))
+        return str(path)
+
+    providers = ["CPUExecutionProvider"]
+    settings = {**onnx_sessions.session_settings("recognition"), "graph_optimization": "all"}
+    cache_settings = (onnx_sessions.ONNX_OPTIMIZED_CACHE, onnx_sessions.ONNX_OPTIMIZED_CACHE_DIR)
+    x = np.array([[-1.0, 0.5, 2.0, -3.0]], dtype=np.float32)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            onnx_sessions.ONNX_OPTIMIZED_CACHE = True
+            onnx_sessions.ONNX_OPTIMIZED_CACHE_DIR = Path(tmp_dir) / "cache"
+            model_file = save_model(Path(tmp_dir) / "soma.onnx", "Add")
+
+            outputs = []
+            for expected in ("miss", "hit"):
+                session, cache = onnx_sessions.create_session(model_file, settings, providers)
+                if cache != expected:
+                    print(f"ERRO: Cache do grafo {cache}, esperado {expected}")
+                    return False
+                outputs.append(session.run(None, {"x": x})[0])
+            if not np.allclose(outputs[0], np.maximum(2 * x, 0)) or not np.array_equal(*outputs):
+                print("ERRO: Grafo do cache com resultado diferente")
+                return False
+
+            # Outro modelo ou outro nível de otimização não reaproveitam o grafo
+            def cache_key(model, options):
+                # Sem o nome do arquivo: só o que identifica o grafo otimizado
+                return onnx_sessions.optimized_model_path(model, providers, options).name.split("-", 1)[1]
+
+            cached = onnx_sessions.optimized_model_path(model_file, providers, settings)
+            other_model = save_model(Path(tmp_dir) / "produto.onnx", "Mul")
+            keys = {
+                cache_key(model_file, settings),
+                cache_key(other_model, settings),
+                cache_key(model_file, {**settings, "graph_optimization": "basic"}),
+            }
+            if not cached.exists() or len(keys) != 3:
+                print("ERRO: Chave do cache nao distingue modelo e otimizacao")
+                return False
+
+        print("OK: Grafo otimizado gravado e reaproveitado")
+        return True
+
+    except Exception as e:
+        print(f"ERRO ao testar cache dos grafos otimizados: {e}")
+        return False
+    finally:
+        onnx_sessions.ONNX_OPTIMIZED_CACHE, onnx_sessions.ONNX_OPTIMIZED_CACHE_DIR = cache_settings
+
+
 def test_api_endpoint():
     """Testa o endpoint da API"""
     print("\nTestando endpoint da API...")
@@ -122,20 +1697,52 @@ def create_test_image():
     return f"data:image/jpeg;base64,{img_str}"
 
 
+# (descrição, teste) na ordem de execução
+TESTS = [
+    ("Reconhecimento facial", test_face_recognition),
+    ("Rastreamento com remocao", test_tracking_user_removal),
+    ("Rastreamento com outra pessoa", test_tracking_requires_embedding_match),
+    ("Lotes de inferencia", test_inference_scheduler_batching),
+    ("Cancelamento na inferencia", test_inference_scheduler_cancellation),
+    ("Fila do executor", test_blocking_executor_saturation),
+    ("Recuperacao do pool de inferencia", test_inference_server_recovery),
+    ("Nitidez das faces", test_face_sharpness_gate),
+    ("updated_at dos usuarios", test_updated_at_ignores_passages),
+    ("Remocao e compactacao", test_removal_and_compaction),
+    ("Indices IVF e HNSW", test_ann_indexes),
+    ("Indices comprimidos", test_compressed_index_rerank),
+    ("Reconhecimento em lote", test_batched_recognition),
+    ("Journal com escrita interrompida", test_journal_torn_write),
+    ("Snapshot com delta", test_layered_snapshot),
+    ("Mapeamento de usuarios", test_user_id_map),
+    ("Galeria em shards", test_sharded_index),
+    ("Descriptografia em lote", test_parallel_decrypt_batch),
+    ("Envelope dos embeddings", test_embedding_envelope),
+    ("Sincronizacao entre workers", test_cross_worker_sync),
+    ("Snapshot criptografado", test_encrypted_snapshot_restore),
+    ("Checkpoint e recarga", test_checkpoint_reload),
+    ("Reconciliacao incremental", test_incremental_reconcile),
+    ("Reconstrucao com troca atomica", test_background_rebuild_swap),
+    ("Pacote de modelos", test_model_pack),
+    ("Deteccao antes do reconhecimento", test_detect_then_embed),
+    ("Resolucao do detector", test_detector_size_choice),
+    ("Opcoes das sessoes ONNX", test_onnx_session_settings),
+    ("Cache dos grafos otimizados", test_optimized_graph_cache),
+    ("API", test_api_endpoint),
+]
+
+
 if __name__ == "__main__":
     print("Iniciando testes do sistema de reconhecimento facial...\n")
 
-    # Testar reconhecimento facial
-    face_recognition_ok = test_face_recognition()
-
-    # Testar API
-    api_ok = test_api_endpoint()
+    results = [(name, test()) for name, test in TESTS]
 
     print(f"\nResumo dos testes:")
-    print(f"   - Reconhecimento facial: {'OK' if face_recognition_ok else 'FALHOU'}")
-    print(f"   - API: {'OK' if api_ok else 'FALHOU'}")
+    for name, ok in results:
+        print(f"   - {name}: {'OK' if ok else 'FALHOU'}")
 
-    if face_recognition_ok and api_ok:
+    if all(ok for _, ok in results):
         print("\nTodos os testes passaram! O sistema esta funcionando corretamente.")
     else:
         print("\nAlguns testes falharam. Verifique os problemas acima.")
+        sys.exit(1)
@@ -1,3 +1,4 @@
+import json
 import os
 import torch
 from pathlib import Path
@@ -39,6 +40,9 @@ else:
 FACE_DETECTION_CONFIDENCE = 0.25  # Threshold de confiança para detecção
 FACE_RECOGNITION_THRESHOLD = 0.4  # Threshold para reconhecimento (distância máxima) - Relaxado para teste
 EMBEDDING_DIMENSION = 512  # Dimensão dos embeddings ArcFace
+EMBEDDING_STORAGE_DTYPE = os.getenv(
+    "EMBEDDING_STORAGE_DTYPE", "float32"
+)  # Tipo dos embeddings gravados no banco: float32 ou float16 (metade do espaço)
 
 # Configurações avançadas de precisão
 FACE_DETECTION_CONFIDENCE_HIGH = 0.4  # Threshold mais rigoroso para casos críticos
@@ -46,6 +50,177 @@ FACE_RECOGNITION_THRESHOLD_STRICT = 0.2  # Threshold mais rigoroso para alta seg
 FACE_RECOGNITION_THRESHOLD_RELAXED = 0.35  # Threshold mais relaxado para casos difíceis
 MIN_FACE_SIZE = 80  # Tamanho mínimo da face em pixels
 MAX_FACE_SIZE = 2000  # Tamanho máximo da face em pixels
+FACE_QUALITY_ROI_SIZE = int(
+    os.getenv("FACE_QUALITY_ROI_SIZE", "64")
+)  # Lado (px) para o qual cada face é reduzida antes do cálculo de qualidade
+# Na ROI de 64px, faces nítidas ficam entre 0.3 e 0.55 e um desfoque gaussiano de
+# 1.5px (na escala da ROI) fica abaixo de 0.02; uma face nítida com 20% do brilho
+# normal fica em torno de 0.025
+FACE_MIN_SHARPNESS = float(
+    os.getenv("FACE_MIN_SHARPNESS", "0.02")
+)  # Nitidez mínima (variância do Laplaciano / variância dos pixels, 0-1) para a face ir ao reconhecimento (0 = não descarta faces borradas)
+FACE_DETECTION_SIZES = [
+    int(size) for size in os.getenv("FACE_DETECTION_SIZES", "320,480,640").split(",") if size.strip()
+]  # Resoluções de entrada do detector, escolhidas por requisição (a maior é a padrão)
+FACE_DETECTION_MIN_FACE_PIXELS = int(
+    os.getenv("FACE_DETECTION_MIN_FACE_PIXELS", "48")
+)  # Menor face esperada, em pixels na entrada do detector, para usar uma resolução menor
+FACE_DETECTION_SESSION_TTL = float(
+    os.getenv("FACE_DETECTION_SESSION_TTL", "30")
+)  # Tempo (s) em que o tamanho da face do frame anterior de uma sessão é lembrado
+FACE_TRACK_REVERIFY_FRAMES = int(
+    os.getenv("FACE_TRACK_REVERIFY_FRAMES", "10")
+)  # Frames seguidos de uma sessão que reaproveitam a identidade confirmada antes de reconhecer de novo (0 = sem rastreamento)
+FACE_TRACK_IOU = float(
+    os.getenv("FACE_TRACK_IOU", "0.5")
+)  # IoU mínimo entre as caixas de frames seguidos para ser a mesma face
+FACE_TRACK_CENTROID_SHIFT = float(
+    os.getenv("FACE_TRACK_CENTROID_SHIFT", "0.3")
+)  # Ou deslocamento máximo do centro (fração da largura da face), com tamanho parecido
+FACE_TRACK_SIMILARITY_DROP = float(
+    os.getenv("FACE_TRACK_SIMILARITY_DROP", "0.1")
+)  # Queda de similaridade na reverificação que descarta a identidade da trilha
+FACE_TRACK_TTL = float(
+    os.getenv("FACE_TRACK_TTL", "10")
+)  # Tempo (s) sem frames com face até a trilha expirar
+FACE_TRACK_MAX_GAP = float(
+    os.getenv("FACE_TRACK_MAX_GAP", "1.0")
+)  # Intervalo máximo (s) entre frames da sessão para reaproveitar a identidade (bem abaixo do intervalo do cliente)
+INFERENCE_BATCH_SIZE = int(
+    os.getenv("INFERENCE_BATCH_SIZE", "8")
+)  # Frames de requisições concorrentes processados juntos (1 = sem lotes)
+INFERENCE_BATCH_WAIT_MS = float(
+    os.getenv("INFERENCE_BATCH_WAIT_MS", "5")
+)  # Espera máxima (ms) por outros frames antes de processar o lote
+INFERENCE_BATCH_QUEUE = int(
+    os.getenv("INFERENCE_BATCH_QUEUE", "64")
+)  # Frames aguardando o próximo lote; acima disso as requisições recebem 503 (0 = sem limite)
+BLOCKING_EXECUTOR_WORKERS = int(
+    os.getenv("BLOCKING_EXECUTOR_WORKERS", "0")
+)  # Threads para o trabalho bloqueante das rotas (decodificação, FAISS, banco); 0 = CPUs + 4
+BLOCKING_EXECUTOR_QUEUE = int(
+    os.getenv("BLOCKING_EXECUTOR_QUEUE", "64")
+)  # Tarefas aguardando uma thread; acima disso as requisições recebem 503
+INFERENCE_SERVER_ADDRESS = os.getenv(
+    "INFERENCE_SERVER_ADDRESS", ""
+)  # Socket Unix do servidor de inferência compartilhado (vazio = modelos em cada worker da API)
+INFERENCE_WORKERS = int(
+    os.getenv("INFERENCE_WORKERS", "2")
+)  # Processos com os modelos carregados no servidor de inferência
+FACE_RECOGNITION_BACKGROUND_INIT = (
+    os.getenv("FACE_RECOGNITION_BACKGROUND_INIT", "true").lower() == "true"
+)  # Carregar modelos e índice em background (a API aceita conexões durante a carga)
+INSIGHTFACE_MODEL_PACK = os.getenv(
+    "INSIGHTFACE_MODEL_PACK", "buffalo_l"
+)  # buffalo_l, buffalo_s ou buffalo_sc; trocar o modelo de reconhecimento exige recadastrar as faces
+INSIGHTFACE_ALLOWED_MODULES = [
+    module.strip()
+    for module in os.getenv("INSIGHTFACE_ALLOWED_MODULES", "detection,recognition").split(",")
+    if module.strip()
+]  # Modelos do pacote executados por face (vazio = todos: landmarks 2D/3D, gênero/idade)
+ONNX_INTRA_OP_THREADS = int(
+    os.getenv("ONNX_INTRA_OP_THREADS", "0")
+)  # Threads de cada operador nas sessões ONNX Runtime (0 = padrão do ONNX Runtime, todos os núcleos)
+ONNX_INTER_OP_THREADS = int(
+    os.getenv("ONNX_INTER_OP_THREADS", "0")
+)  # Threads entre operadores (só com ONNX_EXECUTION_MODE=parallel; 0 = padrão)
+ONNX_GRAPH_OPTIMIZATION = os.getenv(
+    "ONNX_GRAPH_OPTIMIZATION", "all"
+)  # Otimização do grafo: disable, basic, extended ou all
+ONNX_EXECUTION_MODE = os.getenv(
+    "ONNX_EXECUTION_MODE", "sequential"
+)  # sequential ou parallel
+ONNX_CPU_MEM_ARENA = (
+    os.getenv("ONNX_CPU_MEM_ARENA", "true").lower() == "true"
+)  # Arena de memória da CPU (mais rápida, mas retém o pico de memória de cada sessão)
+ONNX_MODEL_SESSION_OPTIONS = json.loads(
+    os.getenv("ONNX_MODEL_SESSION_OPTIONS", "{}")
+)  # Ajustes por modelo, ex.: {"detection": {"intra_op_threads": 2}, "recognition": {"execution_mode": "parallel"}}
+INSIGHTFACE_INT8_MODELS = [
+    module.strip()
+    for module in os.getenv("INSIGHTFACE_INT8_MODELS", "").split(",")
+    if module.strip()
+]  # Modelos que usam a versão INT8 (scripts/quantize_models.py), ex.: detection,recognition
+QUANTIZED_MODELS_DIR = MODELS_DIR / "quantized"  # Modelos INT8 por pacote
+ONNX_OPTIMIZED_CACHE = (
+    os.getenv("ONNX_OPTIMIZED_CACHE", "true").lower() == "true"
+)  # Guardar os grafos otimizados pelo ONNX Runtime (a próxima carga não otimiza de novo)
+ONNX_OPTIMIZED_CACHE_DIR = Path(
+    os.getenv("ONNX_OPTIMIZED_CACHE_DIR", str(MODELS_DIR / "optimized"))
+)  # Grafos otimizados por hash do modelo, provider e versão do ONNX Runtime
+MODEL_WARMUP_RUNS = int(
+    os.getenv("MODEL_WARMUP_RUNS", "2")
+)  # Execuções com frames sintéticos em cada resolução do detector antes de ficar pronto (0 = sem aquecimento)
+
+# Configurações do índice FAISS
+FAISS_COMPACTION_TOMBSTONE_RATIO = float(
+    os.getenv("FAISS_COMPACTION_TOMBSTONE_RATIO", "0.2")
+)  # Compactar o índice quando a fração de embeddings removidos passar deste valor
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")  # auto, flat, ivf ou hnsw
+FAISS_ANN_TYPE = os.getenv("FAISS_ANN_TYPE", "hnsw")  # Tipo ANN usado pelo modo auto (ivf ou hnsw)
+FAISS_ANN_THRESHOLD = int(
+    os.getenv("FAISS_ANN_THRESHOLD", "100000")
+)  # Tamanho da galeria a partir do qual o modo auto troca FlatIP por ANN
+FAISS_ANN_MIN_RECALL = float(
+    os.getenv("FAISS_ANN_MIN_RECALL", "0.98")
+)  # Recall@1 mínimo contra FlatIP para aceitar a troca para ANN
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))  # Listas IVF (0 = ~4*sqrt(N))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "32"))  # Listas visitadas por busca
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))  # Vizinhos por nó no grafo HNSW
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "128"))
+FAISS_COMPRESSION = os.getenv(
+    "FAISS_COMPRESSION", "none"
+)  # none, sq8 (4x menos memória) ou pq (FAISS_PQ_M bytes por face)
+FAISS_COMPRESSION_MIN_VECTORS = int(
+    os.getenv("FAISS_COMPRESSION_MIN_VECTORS", "10000")
+)  # Galerias menores ficam sem compressão
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "128"))  # Subquantizadores PQ (128 = 16x menos memória)
+FAISS_RERANK_K = int(
+    os.getenv("FAISS_RERANK_K", "32")
+)  # Candidatos reordenados com os vetores exatos no modo comprimido
+FAISS_SHARDS = int(
+    os.getenv("FAISS_SHARDS", "1")
+)  # Shards da galeria (faiss_id % FAISS_SHARDS), pesquisados em paralelo
+FAISS_INDEX_MMAP = (
+    os.getenv("FAISS_INDEX_MMAP", "true").lower() == "true"
+)  # Mapear o snapshot do índice em memória (page cache compartilhado entre workers)
+FAISS_REBUILD_BATCH_SIZE = int(
+    os.getenv("FAISS_REBUILD_BATCH_SIZE", "5000")
+)  # Usuários lidos e descriptografados por lote na reconstrução do índice
+FAISS_REBUILD_WORKERS = int(
+    os.getenv("FAISS_REBUILD_WORKERS", "0")
+)  # Processos de descriptografia na reconstrução (0 = número de CPUs)
+# Os processos usam "spawn" e reimportam o __main__: scripts que reconstroem o
+# índice precisam do if __name__ == "__main__". Fora do processo principal
+# (workers do uvicorn) ou sem __main__ importável, descriptografa no próprio processo
+FAISS_JOURNAL_FSYNC_BATCH = int(
+    os.getenv("FAISS_JOURNAL_FSYNC_BATCH", "32")
+)  # Registros do journal por fsync
+FAISS_JOURNAL_FSYNC_INTERVAL = float(
+    os.getenv("FAISS_JOURNAL_FSYNC_INTERVAL", "0.05")
+)  # Atraso máximo (s) do fsync de registros pendentes
+FAISS_CHECKPOINT_RECORDS = int(
+    os.getenv("FAISS_CHECKPOINT_RECORDS", "5000")
+)  # Registros no journal que disparam um checkpoint (snapshot completo)
+FAISS_SYNC_INTERVAL = float(
+    os.getenv("FAISS_SYNC_INTERVAL", "0.5")
+)  # Intervalo (s) em que cada worker aplica alterações feitas por outros workers
+FAISS_RECONCILE_INTERVAL = float(
+    os.getenv("FAISS_RECONCILE_INTERVAL", "60")
+)  # Intervalo (s) da reconciliação incremental banco ↔ índice (0 = desligada)
+FAISS_RECONCILE_OVERLAP = float(
+    os.getenv("FAISS_RECONCILE_OVERLAP", "300")
+)  # Janela (s) antes da marca d'água relida a cada reconciliação (relógios dos servidores)
+FAISS_VERIFY_CHECKSUMS = (
+    os.getenv("FAISS_VERIFY_CHECKSUMS", "true").lower() == "true"
+)  # Conferir o SHA-256 dos arquivos do snapshot na inicialização
+FAISS_ENCRYPTED_SNAPSHOT = (
+    os.getenv("FAISS_ENCRYPTED_SNAPSHOT", "true").lower() == "true"
+)  # Gravar a cada checkpoint um snapshot criptografado da galeria (restart sem o banco)
+FAISS_ENCRYPTED_SNAPSHOT_PATH = Path(
+    os.getenv("FAISS_ENCRYPTED_SNAPSHOT_PATH", str(DATA_DIR / "gallery_snapshot.enc"))
+)  # Pode ficar fora de FAISS_INDEX_DIR (ex.: índice em tmpfs, snapshot em disco persistente)
 
 # Configurações de segurança
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "facial_detect_demo_key_2024")  # Em produção, usar variável de ambiente
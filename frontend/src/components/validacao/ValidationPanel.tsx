@@ -68,6 +68,12 @@ export function ValidationPanel({ videoRef, canvasRef, webcam }: ValidationPanel
   const intervalRef = useRef<NodeJS.Timeout | null>(null);
   const isProcessingRef = useRef(false);
   const lastValidationRef = useRef<number>(0);
+  // Identifica esta câmera: o backend acompanha a face entre os frames da sessão
+  const sessionIdRef = useRef<string>(
+    typeof crypto !== 'undefined' && 'randomUUID' in crypto
+      ? crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
 
   // Função de validação ultra-otimizada para não interferir na câmera
   const validateContinuously = useCallback(() => {
@@ -110,7 +116,7 @@ export function ValidationPanel({ videoRef, canvasRef, webcam }: ValidationPanel
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ image: imageData }),
+        body: JSON.stringify({ image: imageData, session_id: sessionIdRef.current }),
       })
         .then(response => response.json())
         .then(response => {
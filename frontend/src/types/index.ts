@@ -70,6 +70,7 @@ export interface PassageStatsResponse extends ApiResponse {
 // Validation types
 export interface ValidationRequest {
   image: string; // base64 encoded image
+  session_id?: string; // câmera do cliente (rastreamento da face entre frames)
 }
 
 export interface ValidationResponse extends ApiResponse {
@@ -79,6 +80,8 @@ export interface ValidationResponse extends ApiResponse {
   user_id?: number;
   user_name?: string;
   passage_count?: number;
+  track_id?: number | null;
+  tracked?: boolean;
 }
 
 // Register types
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Script para comparar os formatos de armazenamento dos embeddings no banco
+Mede codificação/decodificação do formato antigo (np.array2string + AES-CBC +
+base64) contra o envelope binário (AES-GCM) em float32 e float16
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.encryption import decrypt_embedding_batch, encryption_manager
+
+
+def measure(name: str, encode, embeddings: np.ndarray) -> dict:
+    """Vazão de codificação, decodificação em lote, tamanho e erro máximo"""
+    start = time.perf_counter()
+    encoded = [encode(embedding) for embedding in embeddings]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded, valid = decrypt_embedding_batch(encoded)
+    decode_time = time.perf_counter() - start
+
+    size = np.mean([len(item) for item in encoded])
+    error = float(np.max(np.abs(decoded - embeddings))) if valid.all() else float("nan")
+    result = {
+        "name": name,
+        "encode_per_s": len(embeddings) / encode_time,
+        "decode_per_s": len(embeddings) / decode_time,
+        "bytes": size,
+        "max_error": error,
+    }
+    print(
+        f"   {name}: codificação {result['encode_per_s']:.0f}/s, "
+        f"decodificação {result['decode_per_s']:.0f}/s, {size:.0f} bytes, "
+        f"erro máximo {error:.2e}"
+    )
+    return result
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000, help="Embeddings codificados por formato")
+    args = parser.parse_args()
+
+    print("Formatos de armazenamento dos embeddings")
+    print("=" * 60)
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.count, config.EMBEDDING_DIMENSION)).astype(np.float32)
+    # Escala típica dos embeddings ArcFace antes da normalização
+    embeddings *= 1.5
+
+    results = [
+        measure("texto (antigo)", encryption_manager.encrypt_embedding, embeddings),
+        measure(
+            "binário float32",
+            lambda e: encryption_manager.encrypt_embedding_binary(e, "float32"),
+            embeddings,
+        ),
+        measure(
+            "binário float16",
+            lambda e: encryption_manager.encrypt_embedding_binary(e, "float16"),
+            embeddings,
+        ),
+    ]
+
+    print("\nRESUMO:")
+    print("=" * 60)
+    print(f"{'formato':<18} {'cod. (/s)':>10} {'decod. (/s)':>12} {'bytes':>7} {'speedup':>8}")
+    baseline = results[0]["decode_per_s"]
+    for result in results:
+        print(
+            f"{result['name']:<18} {result['encode_per_s']:>10.0f} "
+            f"{result['decode_per_s']:>12.0f} {result['bytes']:>7.0f} "
+            f"{result['decode_per_s'] / baseline:>7.1f}x"
+        )
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Script para medir o ganho do agendador de inferência sob carga
+Compara chamadas diretas a detect_faces (uma sessão por requisição, em
+paralelo) com o agendador em lotes, usando clientes concorrentes em loop fechado
+"""
+
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from app.face_recognition import face_recognition
+from app.inference_scheduler import InferenceScheduler
+
+
+def load_image(path: str):
+    """Imagem de teste: arquivo informado ou amostra do InsightFace"""
+    if path:
+        image = cv2.imread(path)
+        if image is None:
+            raise SystemExit(f"Não foi possível ler a imagem {path}")
+        return image
+    from insightface.data import get_image
+
+    return get_image("t1")
+
+
+def run_load(call, image, clients: int, duration: float) -> dict:
+    """Clientes concorrentes enviando frames até o fim do tempo"""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index: int):
+        session_id = f"bench-{index}"
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            call(image, session_id)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - start
+
+    return {
+        "frames_per_s": len(latencies) / total,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="", help="Imagem de teste (padrão: amostra do InsightFace)")
+    parser.add_argument("--clients", type=int, default=8, help="Requisições concorrentes")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duração de cada cenário (s)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Tamanho máximo do lote")
+    parser.add_argument("--wait-ms", type=float, default=5.0, help="Janela de espera do lote (ms)")
+    args = parser.parse_args()
+
+    face_recognition.wait_until_ready()
+    if not face_recognition.pipeline.models_loaded:
+        print("❌ Modelos não carregados")
+        return False
+    image = load_image(args.image)
+
+    print("Agendador de inferência sob carga")
+    print("=" * 60)
+    print(f"Imagem: {image.shape[1]}x{image.shape[0]}, {args.clients} clientes, {args.duration:.0f}s por cenário")
+
+    scenarios = [
+        ("direto (sem agendador)", None),
+        ("agendador, lote 1", InferenceScheduler(face_recognition.detect_faces_batch, 1, 0)),
+        (
+            f"agendador, lote {args.batch_size}",
+            InferenceScheduler(face_recognition.detect_faces_batch, args.batch_size, args.wait_ms),
+        ),
+    ]
+
+    results = []
+    for name, scheduler in scenarios:
+        if scheduler is None:
+            call = lambda frame, session_id: face_recognition.detect_faces(
+                frame, max_faces=1, session_id=session_id
+            )
+        else:
+            call = lambda frame, session_id, scheduler=scheduler: scheduler.submit(
+                (frame, False, 1, session_id, False)
+            ).result()
+
+        result = run_load(call, image, args.clients, args.duration)
+        if scheduler is not None:
+            result["mean_batch_size"] = scheduler.stats()["mean_batch_size"]
+            scheduler.close()
+        result["name"] = name
+        results.append(result)
+        print(
+            f"   {name}: {result['frames_per_s']:.1f} frames/s, "
+            f"p50 {result['p50_ms']:.0f}ms, p95 {result['p95_ms']:.0f}ms"
+        )
+
+    print("\nRESUMO:")
+    print("=" * 60)
+    print(f"{'cenário':<26} {'frames/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'lote':>5} {'speedup':>8}")
+    baseline = results[0]["frames_per_s"]
+    for result in results:
+        batch = f"{result['mean_batch_size']:.1f}" if "mean_batch_size" in result else "-"
+        print(
+            f"{result['name']:<26} {result['frames_per_s']:>9.1f} {result['p50_ms']:>9.0f} "
+            f"{result['p95_ms']:>9.0f} {batch:>5} {result['frames_per_s'] / baseline:>7.1f}x"
+        )
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Script para medir a latência de cada modelo InsightFace por pacote
+Compara o pacote completo (todos os modelos) com os módulos de
+INSIGHTFACE_ALLOWED_MODULES para escolher INSIGHTFACE_MODEL_PACK
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import cv2
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.model_profiling import profile_face_analysis
+
+
+def load_image(path: str):
+    """Imagem de teste: arquivo informado ou amostra do InsightFace (várias faces)"""
+    if path:
+        image = cv2.imread(path)
+        if image is None:
+            raise SystemExit(f"Não foi possível ler a imagem {path}")
+        return image
+    from insightface.data import get_image
+
+    return get_image("t1")
+
+
+def benchmark(pack: str, allowed_modules, image, runs: int, det_size: int, providers: list) -> dict:
+    """Carrega o pacote com os módulos pedidos e mede cada modelo"""
+    from insightface.app import FaceAnalysis
+
+    face_app = FaceAnalysis(name=pack, allowed_modules=allowed_modules, providers=providers)
+    face_app.prepare(ctx_id=0 if config.DEVICE == "cuda" else -1, det_size=(det_size, det_size))
+    report = profile_face_analysis(face_app, image, runs)
+
+    label = ",".join(allowed_modules) if allowed_modules else "todos"
+    print(f"\n{pack} [{label}] - {report['faces']} faces")
+    for taskname, timing in report.items():
+        if isinstance(timing, dict):
+            print(
+                f"   {taskname:<14} {timing['model']:<22} "
+                f"média {timing['mean_ms']:7.1f}ms  p95 {timing['p95_ms']:7.1f}ms"
+            )
+    print(f"   {'total':<14} {'':<22} média {report['total_ms']:7.1f}ms por imagem")
+    return {"pack": pack, "modules": label, "faces": report["faces"], "total_ms": report["total_ms"]}
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="", help="Imagem de teste (padrão: amostra do InsightFace)")
+    parser.add_argument(
+        "--packs", default="buffalo_l,buffalo_s,buffalo_sc", help="Pacotes a comparar (separados por vírgula)"
+    )
+    parser.add_argument("--runs", type=int, default=20, help="Execuções medidas por configuração")
+    parser.add_argument("--det-size", type=int, default=640, help="Resolução de entrada do detector")
+    args = parser.parse_args()
+
+    providers = (
+        ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        if config.DEVICE == "cuda"
+        else ["CPUExecutionProvider"]
+    )
+    image = load_image(args.image)
+
+    print("Latência dos modelos InsightFace")
+    print("=" * 60)
+    print(f"Imagem: {image.shape[1]}x{image.shape[0]}, dispositivo: {config.DEVICE}")
+
+    results = []
+    for pack in [name.strip() for name in args.packs.split(",") if name.strip()]:
+        for allowed_modules in (None, config.INSIGHTFACE_ALLOWED_MODULES or None):
+            try:
+                results.append(
+                    benchmark(pack, allowed_modules, image, args.runs, args.det_size, providers)
+                )
+            except Exception as e:
+                print(f"⚠️  {pack}: {e}")
+            if not config.INSIGHTFACE_ALLOWED_MODULES:
+                break
+
+    if not results:
+        return False
+
+    print("\nRESUMO:")
+    print("=" * 60)
+    print(f"{'pacote':<12} {'módulos':<24} {'faces':>5} {'ms/imagem':>10} {'speedup':>8}")
+    baseline = results[0]["total_ms"]
+    for result in results:
+        print(
+            f"{result['pack']:<12} {result['modules']:<24} {result['faces']:>5} "
+            f"{result['total_ms']:>10.1f} {baseline / result['total_ms']:>7.1f}x"
+        )
+    print("\nTrocar o modelo de reconhecimento (ex.: buffalo_l -> buffalo_s) exige recadastrar as faces")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
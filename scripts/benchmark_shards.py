@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Script para medir a latência de busca da galeria em função do número de shards
+Use para escolher FAISS_SHARDS de acordo com o tamanho da galeria e os núcleos da máquina
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.index_factory import make_search_params
+from app.sharded_index import build_sharded_index
+
+
+def generate_gallery(size: int):
+    """Gera galeria sintética de embeddings normalizados"""
+    print(f"Gerando galeria sintética com {size} embeddings...")
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, config.EMBEDDING_DIMENSION)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors, np.arange(size, dtype=np.int64)
+
+
+def measure(index, queries, k: int, batch_size: int) -> dict:
+    """Latência de buscas com uma consulta (como no /api/validate) e vazão em lote"""
+    params = make_search_params(index)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batch = queries[:batch_size]
+    start = time.perf_counter()
+    index.search(batch, k, params=params)
+    batch_time = time.perf_counter() - start
+
+    return {
+        "mean_ms": float(np.mean(latencies)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "batch_qps": len(batch) / batch_time,
+    }
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=200000, help="Embeddings na galeria sintética")
+    parser.add_argument(
+        "--shards", default="1,2,4,8", help="Números de shards a comparar (separados por vírgula)"
+    )
+    parser.add_argument("--kind", default="flat", choices=["flat", "ivf", "hnsw"], help="Tipo de índice")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas individuais medidas")
+    parser.add_argument("--batch", type=int, default=64, help="Tamanho do lote de consultas")
+    parser.add_argument("--k", type=int, default=5, help="Vizinhos por consulta")
+    args = parser.parse_args()
+
+    shard_counts = [int(n) for n in args.shards.split(",")]
+
+    print("Latência de busca vs número de shards")
+    print("=" * 60)
+    print(f"Núcleos disponíveis: {os.cpu_count()} | threads OpenMP do FAISS: {faiss.omp_get_max_threads()}")
+
+    vectors, ids = generate_gallery(args.size)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + rng.normal(0.0, 0.03, queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    results = []
+    for n_shards in shard_counts:
+        print(f"\nConstruindo índice {args.kind} com {n_shards} shard(s)...")
+        start = time.perf_counter()
+        index = build_sharded_index(vectors, ids, args.kind, "none", n_shards)
+        print(f"   Construção: {time.perf_counter() - start:.1f}s")
+
+        result = measure(index, queries, args.k, args.batch)
+        print(
+            f"   média={result['mean_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+            f"lote={result['batch_qps']:.0f} consultas/s"
+        )
+        results.append((n_shards, result))
+        del index
+
+    print("\nRESUMO:")
+    print("=" * 60)
+    print(f"{'shards':>6} {'média (ms)':>12} {'p95 (ms)':>10} {'lote (q/s)':>12} {'speedup':>8}")
+    baseline = results[0][1]["mean_ms"]
+    for n_shards, result in results:
+        print(
+            f"{n_shards:>6} {result['mean_ms']:>12.2f} {result['p95_ms']:>10.2f} "
+            f"{result['batch_qps']:>12.0f} {baseline / result['mean_ms']:>7.2f}x"
+        )
+
+    best_shards, _ = min(results, key=lambda r: r[1]["mean_ms"])
+    print(f"\nMenor latência por consulta com FAISS_SHARDS={best_shards}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Script para comparar recall e latência dos índices ANN (IVF/HNSW) contra FlatIP
+Use antes de habilitar a troca automática para ANN (FAISS_ANN_THRESHOLD)
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.index_factory import build_index, make_search_params, measure_recall
+from app.index_snapshot import read_manifest
+
+
+def load_gallery_vectors(synthetic: int):
+    """Carrega os vetores da galeria salva ou gera uma galeria sintética"""
+    index_path = config.FAISS_INDEX_DIR / "face_index.faiss"
+    manifest = read_manifest(config.FAISS_INDEX_DIR)
+    if manifest.get("index_files"):
+        # Snapshot publicado pelo checkpoint (primeiro shard)
+        index_path = config.FAISS_INDEX_DIR / manifest["index_files"][0]
+
+    if synthetic == 0 and index_path.exists():
+        index = faiss.read_index(str(index_path))
+        if isinstance(index, faiss.IndexIDMap2):
+            ids = faiss.vector_to_array(index.id_map)
+            vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+        else:
+            ids = np.arange(index.ntotal, dtype=np.int64)
+            vectors = index.reconstruct_n(0, index.ntotal)
+        print(f"Galeria carregada de {index_path}: {len(ids)} embeddings")
+        return vectors, ids
+
+    n = synthetic or 20000
+    print(f"Gerando galeria sintética com {n} embeddings...")
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, config.EMBEDDING_DIMENSION)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors, np.arange(n, dtype=np.int64)
+
+
+def measure_latency(index, vectors, params, n_queries: int = 200, k: int = 5) -> float:
+    """Latência média (ms) de buscas com uma consulta por chamada, como no /api/validate"""
+    queries = vectors[:n_queries]
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query.reshape(1, -1), k, params=params)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def check_kind(kind: str, vectors, ids, settings):
+    """Mede recall e latência de um tipo de índice para cada valor de nprobe/efSearch"""
+    print(f"\nConstruindo índice {kind}...")
+    start = time.perf_counter()
+    index = build_index(vectors, ids, kind)
+    print(f"   Construção: {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for value in settings:
+        params = make_search_params(index)
+        if kind == "ivf":
+            params.nprobe = value
+            label = f"nprobe={value}"
+        elif kind == "hnsw":
+            params.efSearch = value
+            label = f"efSearch={value}"
+        else:
+            label = "exato"
+
+        recall = measure_recall(index, vectors, ids, params=params)
+        latency = measure_latency(index, vectors, params)
+        print(
+            f"   {label:<14} recall@1={recall['recall_at_1']:.4f} "
+            f"recall@{recall['k']}={recall['recall_at_k']:.4f} "
+            f"latência={latency:.2f}ms"
+        )
+        results.append((label, recall["recall_at_1"], latency))
+
+        if kind == "flat":
+            break
+
+    return results
+
+
+def main():
+    """Função principal de verificação"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Usar galeria sintética com N embeddings em vez do índice salvo",
+    )
+    args = parser.parse_args()
+
+    print("Recall dos índices ANN vs FlatIP")
+    print("=" * 60)
+
+    vectors, ids = load_gallery_vectors(args.synthetic)
+    if len(ids) == 0:
+        print("Galeria vazia, nada para comparar.")
+        return False
+
+    check_kind("flat", vectors, ids, [None])
+    ivf_results = check_kind("ivf", vectors, ids, [8, 16, 32, 64, 128])
+    hnsw_results = check_kind("hnsw", vectors, ids, [32, 64, 128, 256])
+
+    print("\nRESUMO:")
+    print("=" * 60)
+    print(f"Recall@1 mínimo configurado: {config.FAISS_ANN_MIN_RECALL}")
+    for kind, results in (("ivf", ivf_results), ("hnsw", hnsw_results)):
+        accepted = [r for r in results if r[1] >= config.FAISS_ANN_MIN_RECALL]
+        if accepted:
+            label, recall, latency = min(accepted, key=lambda r: r[2])
+            print(f"{kind}: menor latência aprovada com {label} ({latency:.2f}ms, recall@1={recall:.4f})")
+        else:
+            print(f"{kind}: nenhuma configuração atingiu o recall mínimo")
+
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
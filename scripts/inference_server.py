@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Servidor de inferência compartilhado pelos workers da API
+Carrega os modelos InsightFace em INFERENCE_WORKERS processos e atende os
+workers configurados com o mesmo INFERENCE_SERVER_ADDRESS
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.inference_pool import InferenceServer
+
+
+def main():
+    """Inicia o servidor de inferência"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--address",
+        default=config.INFERENCE_SERVER_ADDRESS or str(config.DATA_DIR / "inference.sock"),
+        help="Socket Unix do servidor",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=config.INFERENCE_WORKERS, help="Processos com os modelos carregados"
+    )
+    args = parser.parse_args()
+
+    InferenceServer(args.address, args.workers).serve_forever()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Script para gerar as versões INT8 dos modelos de detecção e reconhecimento
+Quantiza os modelos ONNX do pacote INSIGHTFACE_MODEL_PACK (dynamic ou static)
+e compara precisão e latência com os modelos FP32 na CPU
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import cv2
+
+# Adicionar o diretório do backend ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import config
+from app.model_quantization import QUANTIZATION_MODES, calibration_blobs, compare_models, quantize_model
+from app.onnx_sessions import quantized_model_path
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def load_images(path: str, limit: int) -> list:
+    """Imagens com faces para calibração e comparação (padrão: amostras do InsightFace)"""
+    if not path:
+        from insightface.data import get_image
+
+        return [get_image("t1")]
+
+    files = sorted(
+        file for file in Path(path).rglob("*") if file.suffix.lower() in IMAGE_EXTENSIONS
+    )[:limit]
+    images = [image for image in (cv2.imread(str(file)) for file in files) if image is not None]
+    if not images:
+        raise SystemExit(f"Nenhuma imagem encontrada em {path}")
+    return images
+
+
+def print_report(report: dict):
+    """Tabela de precisão e latência FP32 x INT8"""
+    for taskname, result in report.items():
+        print(f"\n{taskname} ({result['model']})")
+        print(
+            f"   latência FP32 {result['fp32']['mean_ms']:7.1f}ms (p95 {result['fp32']['p95_ms']:.1f})  "
+            f"INT8 {result['int8']['mean_ms']:7.1f}ms (p95 {result['int8']['p95_ms']:.1f})  "
+            f"{result['speedup']:.2f}x"
+        )
+        if taskname == "detection":
+            print(
+                f"   faces FP32 {result['fp32_faces']}  INT8 {result['int8_faces']}  "
+                f"recall {result['recall']:.3f}  IoU médio {result['mean_iou']:.3f}"
+            )
+        else:
+            print(
+                f"   cosseno FP32 x INT8: médio {result['mean_cosine']:.4f}  mínimo {result['min_cosine']:.4f}"
+            )
+            print(
+                f"   decisões alteradas: {result['flipped_decisions']} de {result['pairs']} pares "
+                f"(threshold {config.FACE_RECOGNITION_THRESHOLD})"
+            )
+
+
+def main():
+    """Função principal da quantização"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default="", help="Diretório com imagens de faces (calibração e comparação)")
+    parser.add_argument("--limit", type=int, default=200, help="Máximo de imagens lidas")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="static", help="Tipo de quantização")
+    parser.add_argument("--tasks", default="detection,recognition", help="Modelos a quantizar")
+    parser.add_argument("--det-size", type=int, default=max(config.FACE_DETECTION_SIZES), help="Resolução do detector")
+    parser.add_argument("--runs", type=int, default=10, help="Execuções medidas por imagem na comparação")
+    parser.add_argument("--report", default="", help="Arquivo JSON para gravar o relatório")
+    parser.add_argument("--compare-only", action="store_true", help="Só compara os modelos INT8 já gerados")
+    args = parser.parse_args()
+
+    from insightface.app import FaceAnalysis
+
+    tasks = [task.strip() for task in args.tasks.split(",") if task.strip()]
+    unknown = set(tasks) - {"detection", "recognition"}
+    if unknown:
+        raise SystemExit(f"Só detection e recognition podem ser quantizados: {sorted(unknown)}")
+
+    # Modelos FP32 de referência, sempre na CPU (INT8 é uma opção para CPU)
+    face_app = FaceAnalysis(
+        name=config.INSIGHTFACE_MODEL_PACK,
+        allowed_modules=["detection", "recognition"],
+        providers=["CPUExecutionProvider"],
+    )
+    face_app.prepare(ctx_id=-1, det_size=(args.det_size, args.det_size))
+    images = load_images(args.images, args.limit)
+
+    print("Quantização INT8 dos modelos InsightFace")
+    print("=" * 60)
+    print(f"Pacote: {config.INSIGHTFACE_MODEL_PACK}, modo: {args.mode}, imagens: {len(images)}")
+
+    quantized = {}
+    for taskname in tasks:
+        model = face_app.models[taskname]
+        output_file = quantized_model_path(model.model_file, config.INSIGHTFACE_MODEL_PACK)
+        if not args.compare_only:
+            calibration = (
+                calibration_blobs(face_app, taskname, images, args.det_size) if args.mode == "static" else None
+            )
+            print(f"🔧 {taskname}: {Path(model.model_file).name} -> {output_file}")
+            quantize_model(
+                model.model_file,
+                output_file,
+                args.mode,
+                calibration=calibration,
+                input_name=model.session.get_inputs()[0].name,
+            )
+        if not output_file.exists():
+            raise SystemExit(f"Modelo INT8 não encontrado: {output_file}")
+        quantized[taskname] = output_file
+
+    report = compare_models(
+        face_app, quantized, images, args.det_size, config.FACE_RECOGNITION_THRESHOLD, args.runs
+    )
+    print_report(report)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"pack": config.INSIGHTFACE_MODEL_PACK, "mode": args.mode, "models": report}, f, indent=2)
+        print(f"\n📄 Relatório gravado em {args.report}")
+
+    print(f"\nPara usar: export INSIGHTFACE_INT8_MODELS={','.join(quantized)}")
+
+
+if __name__ == "__main__":
+    main()
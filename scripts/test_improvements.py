@@ -117,6 +117,9 @@ def main():
     """Função principal de teste"""
     print("Iniciando testes das melhorias do sistema de reconhecimento facial...")
     print("=" * 60)
+
+    # Modelos e índice carregam em background
+    face_recognition.wait_until_ready()
     
     try:
         # Testar configurações